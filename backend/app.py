@@ -2,10 +2,16 @@ import os
 
 from flask import Flask, jsonify
 
+from .background_tasks import init_background_tasks
 from .cli import obsidian_cli, rag_cli
 from .config import BaseConfig
+from .database import init_db
 from .extensions import cors, db, jwt, limiter
+from .models import ensure_indexes
+from .rag import get_pipeline
+from .rag.warmer import init_warmer
 from .routes import register_blueprints
+from .usage_buffer import init_usage_buffer
 
 
 def create_app(config_object=BaseConfig):
@@ -19,7 +25,9 @@ def create_app(config_object=BaseConfig):
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
     os.makedirs(app.config["VECTOR_STORE_FOLDER"], exist_ok=True)
 
-    db.init_app(app)
+    init_db(app)
+    init_usage_buffer(app)
+    init_background_tasks(app)
     jwt.init_app(app)
     cors.init_app(
         app,
@@ -34,6 +42,7 @@ def create_app(config_object=BaseConfig):
     )
     limiter.init_app(app)
 
+    init_warmer(app)
     register_blueprints(app)
     app.cli.add_command(obsidian_cli)
     app.cli.add_command(rag_cli)
@@ -44,6 +53,14 @@ def create_app(config_object=BaseConfig):
 
     with app.app_context():
         db.create_all()
+        ensure_indexes()
+
+    if app.config["RAG_PRELOAD_MODELS"]:
+        # Under gunicorn --preload this runs once, in the master: workers are
+        # forked with the weights already in memory.
+        get_pipeline(
+            persist_directory=app.config["VECTOR_STORE_FOLDER"], top_k=app.config["RAG_TOP_K"]
+        ).load_models()
 
     return app
 
@@ -0,0 +1,233 @@
+"""ASGI entry point: async SSE chat streaming, every other route served by Flask.
+
+Under sync workers each open /api/chat/query/stream connection pins a whole
+worker for the entire LLM generation. Here that route is an asyncio task
+awaiting the LLM client's async stream, with the blocking retrieval steps run
+in worker threads, so one process holds many concurrent streams. All other
+routes go through a WSGI bridge to the unchanged Flask app.
+
+    gunicorn -k uvicorn.workers.UvicornWorker "backend.asgi:create_asgi_app()"
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+
+from a2wsgi import WSGIMiddleware
+from flask import Flask
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_limiter import RateLimitExceeded
+from jwt import PyJWTError
+
+from .app import create_app
+from .config import BaseConfig
+from .rag import get_pipeline
+from .rag.filters import MetadataFilter
+from .rag.warmer import start_warmer
+from .routes.chat import StreamTurn, check_stream_rate_limit, close_stream, open_stream
+
+STREAM_PATH = "/api/chat/query/stream"
+
+# Threads serving the regular (sync) Flask routes through the WSGI bridge.
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+
+_SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, body: dict):
+        super().__init__(status, body)
+        self.status = status
+        self.body = body
+
+
+def _cors_headers(flask_app: Flask, origin: str | None) -> list[tuple[bytes, bytes]]:
+    """What flask-cors adds on /api/* responses, for the route it does not see."""
+    if not origin or origin not in flask_app.config["FRONTEND_ORIGINS"]:
+        return []
+    return [
+        (b"access-control-allow-origin", origin.encode("latin1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin"),
+    ]
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise _HTTPError(400, {"error": "client disconnected"})
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_json(send, status: int, body: dict, extra_headers: list) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), *extra_headers],
+        }
+    )
+    await send({"type": "http.response.body", "body": json.dumps(body).encode("utf-8")})
+
+
+def _authorize(flask_app: Flask, scope: dict, headers: dict, body: bytes) -> tuple[int, dict]:
+    """Same checks, in the same order, as the Flask route: JWT, rate limit, payload.
+
+    The JWT goes through verify_jwt_in_request() in a request context rebuilt
+    from the scope, so the token locations, blocklist and token-type checks
+    and the error responses are those jwt_required applies on the WSGI route.
+    The rate limit is the route's own (check_stream_rate_limit), counted in
+    the same limiter storage under the same key.
+    """
+    client = (scope.get("client") or ("unknown",))[0]
+    with flask_app.test_request_context(
+        STREAM_PATH,
+        method="POST",
+        headers=headers,
+        data=body,
+        environ_base={"REMOTE_ADDR": client},
+    ):
+        try:
+            verify_jwt_in_request()
+            user_id = int(get_jwt_identity())
+            check_stream_rate_limit()
+        except (JWTExtendedException, PyJWTError, RateLimitExceeded) as err:
+            # flask_jwt_extended and the 429 handler are app error handlers.
+            response = flask_app.make_response(flask_app.handle_user_exception(err))
+            raise _HTTPError(response.status_code, response.get_json()) from err
+
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError as err:
+        raise _HTTPError(400, {"error": "invalid JSON body"}) from err
+    if not isinstance(payload, dict) or not str(payload.get("message", "")).strip():
+        raise _HTTPError(400, {"error": "message is required"})
+    try:
+        payload["filters"] = MetadataFilter.from_dict(payload.get("filters"))
+    except ValueError as err:
+        raise _HTTPError(400, {"error": str(err)}) from err
+    return user_id, payload
+
+
+async def _chat_stream(flask_app: Flask, scope: dict, receive, send) -> None:
+    headers = {
+        name.decode("latin1").lower(): value.decode("latin1")
+        for name, value in scope.get("headers", [])
+    }
+    cors = _cors_headers(flask_app, headers.get("origin"))
+    try:
+        body = await _read_body(receive)
+        user_id, payload = await asyncio.to_thread(_authorize, flask_app, scope, headers, body)
+    except _HTTPError as err:
+        await _send_json(send, err.status, err.body, cors)
+        return
+    message = payload["message"].strip()
+
+    def _open():
+        with flask_app.app_context():
+            return open_stream(user_id, message, payload.get("session_id"), payload.get("title"))
+
+    pipeline, session_pk, chat_history = await asyncio.to_thread(_open)
+    await send({"type": "http.response.start", "status": 200, "headers": _SSE_HEADERS + cors})
+
+    turn = StreamTurn()
+    stream = pipeline.astream_query(
+        message, user_id=user_id, history=chat_history, filters=payload["filters"]
+    )
+
+    async def _pump():
+        async for event in stream:
+            frame = turn.frame(event)
+            if frame is not None:
+                await send(
+                    {"type": "http.response.body", "body": frame.encode(), "more_body": True}
+                )
+
+    pump = asyncio.create_task(_pump())
+    disconnect = asyncio.create_task(_wait_disconnect(receive))
+    await asyncio.wait({pump, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    if not pump.done():
+        # The client is gone: cancelling the task cancels the LLM request it
+        # is awaiting. As on the WSGI route, an unfinished turn is not saved.
+        pump.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await pump
+        await stream.aclose()
+        return
+    disconnect.cancel()
+    pump.result()
+
+    def _close():
+        with flask_app.app_context():
+            return close_stream(
+                pipeline=pipeline,
+                user_id=user_id,
+                session_pk=session_pk,
+                message=message,
+                turn=turn,
+                endpoint="chat.query.stream",
+                include_timings=bool(payload.get("include_timings")),
+            )
+
+    done = await asyncio.to_thread(_close)
+    await send({"type": "http.response.body", "body": done.encode()})
+
+
+def _app_pipeline(flask_app: Flask):
+    return get_pipeline(
+        persist_directory=flask_app.config["VECTOR_STORE_FOLDER"],
+        top_k=flask_app.config["RAG_TOP_K"],
+    )
+
+
+async def _lifespan(flask_app: Flask, receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Runs in each worker after the fork: the first forward passes
+            # (kernel selection, lazy buffers) are paid before any request.
+            if flask_app.config.get("RAG_WARMUP"):
+                await asyncio.to_thread(lambda: _app_pipeline(flask_app).warmup())
+            # The background warmer does not hold up startup: /api/health/ready
+            # reports 503 until it is done. Started here rather than on the
+            # first request, which init_warmer() would otherwise do.
+            if flask_app.config.get("RAG_WARMER"):
+                start_warmer(flask_app, _app_pipeline(flask_app))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def asgi_app(flask_app: Flask):
+    """Wrap a Flask app: async streaming route, WSGI bridge for the rest."""
+    wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            await _lifespan(flask_app, receive, send)
+        elif scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == STREAM_PATH:
+            await _chat_stream(flask_app, scope, receive, send)
+        else:
+            await wsgi(scope, receive, send)
+
+    return app
+
+
+def create_asgi_app(config_object=BaseConfig):
+    return asgi_app(create_app(config_object))
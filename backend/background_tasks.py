@@ -0,0 +1,64 @@
+"""Work left by a request that its response does not wait for.
+
+Folding a long session's old messages into its running summary costs an LLM
+call that the current answer does not need. submit_task() queues such work;
+one thread per worker runs the queued tasks in order, each in its own app
+context (and so its own database session). Tasks still queued when a worker
+is killed are lost, so a task must be safe to skip: the next one catches up.
+"""
+
+import logging
+import os
+import queue
+import threading
+from collections.abc import Callable
+
+from flask import Flask, current_app
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    def __init__(self, app: Flask):
+        self._app = app
+        self._queue: queue.Queue[Callable[[], None]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+
+    def _ensure_thread(self) -> None:
+        # Started lazily, and again after a fork: gunicorn --preload workers
+        # inherit the queue but not its thread.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name="background-tasks", daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, task: Callable[[], None]) -> None:
+        self._ensure_thread()
+        self._queue.put(task)
+
+    def join(self) -> None:
+        """Block until every task submitted so far has run."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                with self._app.app_context():
+                    task()
+            except Exception:  # noqa: BLE001 - a failed task must not kill the thread
+                logger.exception("Background task failed")
+            finally:
+                self._queue.task_done()
+
+
+def init_background_tasks(app: Flask) -> None:
+    app.extensions["background_tasks"] = BackgroundTasks(app)
+
+
+def submit_task(task: Callable[[], None]) -> None:
+    """Run task after the current request, in the worker's background thread."""
+    current_app.extensions["background_tasks"].submit(task)
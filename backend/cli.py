@@ -1,23 +1,53 @@
 from collections import Counter
+from contextlib import suppress
 from dataclasses import replace
+from datetime import UTC, datetime, timedelta
 
 import click
 from flask import current_app
 from flask.cli import AppGroup
 
 from .evals.answers import evaluate_answers
+from .evals.benchmarks import (
+    bench_chat_persistence,
+    bench_dense_backends,
+    bench_embeddings,
+    bench_filters,
+    bench_history,
+    bench_partitioning,
+    bench_startup,
+)
 from .evals.generator import GoldsetGenerator
 from .evals.goldset import load_goldset, save_goldset
-from .evals.retrieval import evaluate_retrieval
+from .evals.retrieval import evaluate_retrieval, sweep_fusion
 from .evals.runs import DEFAULT_RUNS_DIR, build_config, load_runs, markdown_report, write_run
-from .models import User
+from .extensions import db
+from .models import (
+    User,
+    calculate_token_summary,
+    cost_by_user,
+    rebuild_usage_rollups,
+)
 from .rag import get_pipeline
-from .rag.pipeline import RAGPipeline
-from .rag.retrieval_config import REWRITE_MODES, RetrievalConfig
+from .rag.embedding_batcher import MicroBatchEmbeddings
+from .rag.partitioning import migrate_partitions
+from .rag.pipeline import EMBEDDING_MODEL_NAME, RAGPipeline
+from .rag.retrieval_config import (
+    DENSE_BACKENDS,
+    DENSE_QUANTIZATIONS,
+    DIVERSITY_MODES,
+    FUSION_MODES,
+    PARTITIONING_MODES,
+    REWRITE_MODES,
+    REWRITE_TIERS,
+    RetrievalConfig,
+)
+from .rag.retrieval_service import BATCH_WINDOW_MS, MAX_BATCH, WORKERS, RetrievalServer
 from .rag.sync import sync_vault
+from .rag.warmer import start_warmer
 
 obsidian_cli = AppGroup("obsidian", help="Obsidian vault commands.")
-rag_cli = AppGroup("rag", help="RAG evaluation commands.")
+rag_cli = AppGroup("rag", help="RAG evaluation and serving commands.")
 
 
 def _require_user(email: str) -> User:
@@ -40,9 +70,27 @@ def _retrieval_config_options(command):
         click.option("--hybrid/--no-hybrid", "hybrid_enabled", default=None),
         click.option("--rerank/--no-rerank", "rerank_enabled", default=None),
         click.option("--rewrite-mode", type=click.Choice(REWRITE_MODES), default=None),
+        click.option("--speculative/--no-speculative", "speculative_rewrite", default=None),
+        click.option("--local-rewrite/--no-local-rewrite", "local_rewrite", default=None),
         click.option("--candidate-k", type=int, default=None),
         click.option("--final-k", type=int, default=None),
         click.option("--rerank-threshold", type=float, default=None),
+        click.option("--early-generation/--no-early-generation", "early_generation", default=None),
+        click.option("--dense-backend", type=click.Choice(DENSE_BACKENDS), default=None),
+        click.option(
+            "--quantization",
+            "dense_quantization",
+            type=click.Choice(DENSE_QUANTIZATIONS),
+            default=None,
+        ),
+        click.option("--quantization-oversample", type=int, default=None),
+        click.option("--fusion", type=click.Choice(FUSION_MODES), default=None),
+        click.option("--fusion-dense-weight", type=float, default=None),
+        click.option("--rrf-k", type=int, default=None),
+        click.option("--small-to-big/--no-small-to-big", "small_to_big", default=None),
+        click.option("--diversity", type=click.Choice(DIVERSITY_MODES), default=None),
+        click.option("--mmr-lambda", type=float, default=None),
+        click.option("--max-chunks-per-note", type=int, default=None),
     ]
     for option in reversed(options):
         command = option(command)
@@ -137,19 +185,118 @@ def _echo_metric_lines(result: dict) -> None:
 )
 @click.option("--user", "email", required=True, help="Email of the user whose index is evaluated.")
 @click.option("--k", default=5, show_default=True, help="Chunks retrieved per question.")
+@click.option(
+    "--rewrite-tier",
+    type=click.Choice(REWRITE_TIERS),
+    default=None,
+    help="Rewrite questions (with their gold history) through this tier first.",
+)
 @click.option("--runs-dir", default=DEFAULT_RUNS_DIR, show_default=True)
 @_retrieval_config_options
-def eval_retrieval_command(goldset_path: str, email: str, k: int, runs_dir: str, **overrides):
-    """Evaluate retrieval quality (recall@k, MRR, nDCG@5). No LLM call."""
+def eval_retrieval_command(
+    goldset_path: str, email: str, k: int, rewrite_tier: str | None, runs_dir: str, **overrides
+):
+    """Evaluate retrieval quality (recall@k, MRR, nDCG@5).
+
+    No LLM call unless --rewrite-tier is llm or tiered.
+    """
     user = _require_user(email)
     items = load_goldset(goldset_path)
     pipeline = _eval_pipeline(**overrides)
-    result = evaluate_retrieval(items, pipeline=pipeline, user_id=user.id, k=k)
+    result = evaluate_retrieval(
+        items, pipeline=pipeline, user_id=user.id, k=k, rewrite_tier=rewrite_tier
+    )
 
     click.echo(f"Retrieval eval: {result['questions_evaluated']} questions (k={k})")
     _echo_metric_lines(result)
+    if "rewrite_tiers" in result:
+        click.echo(f"  rewrite tiers: {result['rewrite_tiers']}")
+
+    config = build_config(pipeline, k=k, goldset=goldset_path, rewrite_tier=rewrite_tier)
+    run_path = write_run("retrieval", config, result, runs_dir=runs_dir)
+    click.echo(f"Run written to {run_path}")
+
+
+def _float_list(ctx, param, value: str) -> tuple[float, ...]:
+    try:
+        return tuple(float(part) for part in value.split(","))
+    except ValueError as exc:
+        raise click.BadParameter("expected comma-separated numbers") from exc
+
+
+@rag_cli.command("eval-fusion-sweep")
+@click.option(
+    "--goldset", "goldset_path", required=True, type=click.Path(exists=True, dir_okay=False)
+)
+@click.option("--user", "email", required=True, help="Email of the user whose index is evaluated.")
+@click.option("--k", default=5, show_default=True, help="Chunks retrieved per question.")
+@click.option(
+    "--modes",
+    type=click.Choice(FUSION_MODES),
+    multiple=True,
+    help="Fusion modes swept (repeatable; default: all).",
+)
+@click.option(
+    "--weights",
+    "dense_weights",
+    default="0.2,0.35,0.5,0.65,0.8",
+    show_default=True,
+    callback=_float_list,
+    help="Dense weights swept, comma-separated.",
+)
+@click.option("--metric", default="ndcg@5", show_default=True, help="Metric the best is picked on.")
+@click.option("--runs-dir", default=DEFAULT_RUNS_DIR, show_default=True)
+@_retrieval_config_options
+def eval_fusion_sweep_command(
+    goldset_path: str,
+    email: str,
+    k: int,
+    modes: tuple[str, ...],
+    dense_weights: tuple[float, ...],
+    metric: str,
+    runs_dir: str,
+    **overrides,
+):
+    """Sweep hybrid fusion modes and dense weights; keep the best as a retrieval run.
+
+    No LLM call. The other flags fix the rest of the config.
+    """
+    user = _require_user(email)
+    items = load_goldset(goldset_path)
+    pipeline = _eval_pipeline(**overrides)
+    try:
+        sweep = sweep_fusion(
+            items,
+            pipeline=pipeline,
+            user_id=user.id,
+            k=k,
+            modes=modes or FUSION_MODES,
+            dense_weights=dense_weights,
+            metric=metric,
+        )
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from exc
+
+    click.echo(f"Fusion sweep: {len(sweep['settings'])} settings, ranked by {metric} (k={k})")
+    for setting in sweep["settings"]:
+        click.echo(
+            f"  {setting['fusion']:<7} dense_weight={setting['fusion_dense_weight']:<5} "
+            f"{metric}: {setting['metrics'][metric]:.3f}  mrr: {setting['metrics']['mrr']:.3f}"
+        )
+    best = sweep["settings"][0]
+    click.echo(
+        f"Best: RETRIEVAL_FUSION={best['fusion']} "
+        f"RETRIEVAL_FUSION_DENSE_WEIGHT={best['fusion_dense_weight']}"
+    )
 
-    config = build_config(pipeline, k=k, goldset=goldset_path)
+    pipeline.config = replace(
+        pipeline.config,
+        hybrid_enabled=True,
+        fusion=best["fusion"],
+        fusion_dense_weight=best["fusion_dense_weight"],
+    )
+    config = build_config(pipeline, k=k, goldset=goldset_path, fusion_sweep_metric=metric)
+    result = {**sweep["best"], "fusion_sweep": sweep["settings"]}
     run_path = write_run("retrieval", config, result, runs_dir=runs_dir)
     click.echo(f"Run written to {run_path}")
 
@@ -161,21 +308,26 @@ def eval_retrieval_command(goldset_path: str, email: str, k: int, runs_dir: str,
 @click.option("--user", "email", required=True, help="Email of the user whose index is evaluated.")
 @click.option("--limit", default=None, type=int, help="Evaluate only the first N questions.")
 @click.option("--runs-dir", default=DEFAULT_RUNS_DIR, show_default=True)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Answer through the streaming path and report time to sources / first token.",
+)
 @_retrieval_config_options
 def eval_answers_command(
-    goldset_path: str, email: str, limit: int | None, runs_dir: str, **overrides
+    goldset_path: str, email: str, limit: int | None, runs_dir: str, stream: bool, **overrides
 ):
     """End-to-end evaluation with an LLM judge (needs ANTHROPIC_API_KEY)."""
     user = _require_user(email)
     items = load_goldset(goldset_path)
     pipeline = _eval_pipeline(**overrides)
-    result = evaluate_answers(items, pipeline=pipeline, user_id=user.id, limit=limit)
+    result = evaluate_answers(items, pipeline=pipeline, user_id=user.id, limit=limit, stream=stream)
 
     click.echo(f"Answer eval: {result['questions_evaluated']} questions")
     for name, value in result["metrics"].items():
         click.echo(f"  {name}: {value if value is not None else 'n/a'}")
 
-    config = build_config(pipeline, limit=limit, goldset=goldset_path)
+    config = build_config(pipeline, limit=limit, goldset=goldset_path, stream=stream)
     run_path = write_run("answers", config, result, runs_dir=runs_dir)
     click.echo(f"Run written to {run_path}")
 
@@ -199,3 +351,214 @@ def eval_report_command(runs_dir: str, last: int | None, run_type: str):
     if last:
         runs = runs[-last:]
     click.echo(markdown_report(runs))
+
+
+@rag_cli.command("usage-report")
+@click.option("--days", default=30, show_default=True, help="Only count calls of the last N days.")
+@click.option("--limit", default=20, show_default=True, help="Number of users listed.")
+def usage_report_command(days: int, limit: int):
+    """LLM tokens and estimated cost: top users, then totals by stage and model."""
+    since = datetime.now(UTC) - timedelta(days=days)
+    for row in cost_by_user(since, limit):
+        click.echo(
+            f"  {row['email']:<32} calls={row['calls']} in={row['input_tokens']} "
+            f"out={row['output_tokens']} cached={row['cache_read_input_tokens']} "
+            f"${row['cost_usd']:.4f}"
+        )
+    summary = calculate_token_summary(since=since.date())
+    for group in ("by_stage", "by_model"):
+        for name, totals in summary[group].items():
+            click.echo(
+                f"  {group[3:]}={name:<24} in={totals['input_tokens']} "
+                f"out={totals['output_tokens']} ${totals['cost_usd']:.4f}"
+            )
+    click.echo(f"Total (last {days} days): ${summary['cost_usd']:.4f}")
+
+
+@rag_cli.command("rollup-usage")
+@click.option(
+    "--days", default=None, type=int, help="Only rebuild the last N days (default: everything)."
+)
+def rollup_usage_command(days: int | None):
+    """Rebuild the daily analytics rollups from the raw usage log."""
+    since = (datetime.now(UTC) - timedelta(days=days)).date() if days else None
+    rows = rebuild_usage_rollups(since)
+    db.session.commit()
+    click.echo(f"{rows} user-day rollup rows rebuilt")
+
+
+@rag_cli.command("partition-store")
+@click.option(
+    "--mode",
+    type=click.Choice(PARTITIONING_MODES),
+    default=None,
+    help="Target layout (default: VECTOR_STORE_PARTITIONING).",
+)
+@click.option("--shards", type=int, default=None, help="Shards of the hash layout.")
+def partition_store_command(mode: str | None, shards: int | None):
+    """Move the stored chunks into the collections of a partitioning layout."""
+    import chromadb
+
+    current = RetrievalConfig.from_env()
+    target = replace(
+        current,
+        partitioning=mode or current.partitioning,
+        partition_shards=shards or current.partition_shards,
+    )
+    client = chromadb.PersistentClient(path=current_app.config["VECTOR_STORE_FOLDER"])
+    moved = migrate_partitions(client, target.partitioning, target.partition_shards)
+    click.echo(
+        f"{sum(moved.values())} chunks moved into {len(moved)} collections "
+        f"({target.partitioning} layout)"
+    )
+    if target != current:
+        click.echo(
+            f"Set VECTOR_STORE_PARTITIONING={target.partitioning} "
+            f"VECTOR_STORE_SHARDS={target.partition_shards} before restarting the app."
+        )
+
+
+@rag_cli.command("serve-retrieval")
+@click.option(
+    "--socket",
+    "socket_path",
+    envvar="RETRIEVAL_SERVICE_SOCKET",
+    required=True,
+    help="Unix socket to listen on (defaults to RETRIEVAL_SERVICE_SOCKET).",
+)
+@click.option("--batch-window-ms", default=BATCH_WINDOW_MS, show_default=True, type=float)
+@click.option("--max-batch", default=MAX_BATCH, show_default=True, type=int)
+@click.option("--workers", default=WORKERS, show_default=True, help="Batches run at once.")
+def serve_retrieval_command(socket_path: str, batch_window_ms: float, max_batch: int, workers: int):
+    """Run the shared retrieval service the web workers connect to."""
+    # Always a local pipeline: get_pipeline() would itself be a client here.
+    pipeline = RAGPipeline(
+        persist_directory=current_app.config["VECTOR_STORE_FOLDER"],
+        top_k=current_app.config["RAG_TOP_K"],
+    )
+    server = RetrievalServer(
+        pipeline,
+        socket_path,
+        batch_window_ms=batch_window_ms,
+        max_batch=max_batch,
+        workers=workers,
+    )
+    if current_app.config["RAG_WARMER"]:
+        start_warmer(current_app._get_current_object(), pipeline)
+    click.echo(f"Retrieval service listening on {socket_path}")
+    with suppress(KeyboardInterrupt):
+        server.run()
+
+
+@rag_cli.command("bench-embed")
+@click.option("--concurrency", default=16, show_default=True, help="Concurrent callers.")
+@click.option("--requests", "n_requests", default=256, show_default=True)
+@click.option("--window-ms", default=5.0, show_default=True, help="Micro-batch window.")
+@click.option("--max-batch", default=32, show_default=True)
+def bench_embed_command(concurrency: int, n_requests: int, window_ms: float, max_batch: int):
+    """Query embedding latency and QPS: per-call vs micro-batched."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    queries = [f"Que disent mes notes sur le sujet numéro {i} ?" for i in range(n_requests)]
+    results = bench_embeddings(
+        {
+            "per-call": model,
+            "micro-batch": MicroBatchEmbeddings(model, window_ms=window_ms, max_batch=max_batch),
+        },
+        queries,
+        concurrency,
+    )
+    click.echo(f"{n_requests} queries, {concurrency} concurrent callers ({EMBEDDING_MODEL_NAME})")
+    for name, summary in results.items():
+        click.echo(
+            f"  {name:<12} p50={summary['p50_ms']}ms p99={summary['p99_ms']}ms qps={summary['qps']}"
+        )
+
+
+@rag_cli.command("bench-startup")
+@click.option("--runs", default=3, show_default=True, help="Fresh processes per mode.")
+def bench_startup_command(runs: int):
+    """Worker boot and time-to-first-request: lazy vs preloaded vs warmed up."""
+    for mode, summary in bench_startup(runs=runs).items():
+        click.echo(
+            f"  {mode:<15} import={summary['import_ms']}ms boot={summary['boot_ms']}ms "
+            f"ready={summary['ready_ms']}ms first-request={summary['first_request_ms']}ms"
+        )
+
+
+@rag_cli.command("bench-history")
+@click.option("--sessions", default=1000, show_default=True, help="Chat sessions seeded.")
+@click.option("--messages", default=50, show_default=True, help="Messages per session.")
+@click.option("--runs", default=5, show_default=True, help="Requests per variant.")
+def bench_history_command(sessions: int, messages: int, runs: int):
+    """Chat history reads: former unpaginated payload vs the paginated endpoints."""
+    click.echo(f"{sessions} sessions x {messages} messages (throwaway SQLite database)")
+    for name, summary in bench_history(sessions, messages, runs).items():
+        click.echo(
+            f"  {name:<26} p50={summary['p50_ms']}ms queries={summary['queries']} "
+            f"bytes={summary['bytes']}"
+        )
+
+
+@rag_cli.command("bench-persistence")
+@click.option("--concurrency", default=16, show_default=True, help="Concurrent users.")
+@click.option("--turns", default=50, show_default=True, help="Chat turns per user.")
+def bench_persistence_command(concurrency: int, turns: int):
+    """Concurrent chat-turn writes: default SQLite vs tuned vs tuned + usage buffer."""
+    click.echo(f"{concurrency} users x {turns} turns (throwaway SQLite file)")
+    for name, summary in bench_chat_persistence(concurrency, turns).items():
+        click.echo(
+            f"  {name:<20} p50={summary['p50_ms']}ms p99={summary['p99_ms']}ms "
+            f"turns/s={summary['qps']} errors={summary['errors']}"
+        )
+
+
+@rag_cli.command("bench-partitioning")
+@click.option("--users", default=50, show_default=True, help="Users in the synthetic store.")
+@click.option("--chunks", "chunks_per_user", default=400, show_default=True)
+@click.option("--queries", default=200, show_default=True, help="Queries per layout.")
+@click.option("--shards", default=8, show_default=True, help="Shards of the hash layout.")
+def bench_partitioning_command(users: int, chunks_per_user: int, queries: int, shards: int):
+    """Dense retrieval latency: global collection vs per-user vs hash-sharded."""
+    click.echo(f"{users} users x {chunks_per_user} chunks (throwaway Chroma store)")
+    for name, summary in bench_partitioning(users, chunks_per_user, queries, shards).items():
+        click.echo(
+            f"  {name:<8} p50={summary['p50_ms']}ms p99={summary['p99_ms']}ms "
+            f"qps={summary['qps']} chunks-searched={summary['chunks_searched']}"
+        )
+
+
+@rag_cli.command("bench-filters")
+@click.option("--chunks", default=5000, show_default=True, help="Chunks of the queried user.")
+@click.option("--queries", default=100, show_default=True)
+@click.option("--k", default=10, show_default=True)
+def bench_filters_command(chunks: int, queries: int, k: int):
+    """Retrieval latency scoped by folder, tag or date vs unscoped, per search backend."""
+    click.echo(f"{chunks} chunks, top {k} (throwaway Chroma store)")
+    for backend, scopes in bench_filters(chunks, queries, k).items():
+        for scope, summary in scopes.items():
+            click.echo(
+                f"  {backend:<7} scope={scope:<7} p50={summary['p50_ms']}ms "
+                f"p99={summary['p99_ms']}ms hits={summary['hits']}"
+            )
+
+
+@rag_cli.command("bench-dense")
+@click.option(
+    "--sizes", default="1000,5000,20000", show_default=True, help="Chunks of the queried user."
+)
+@click.option("--other-chunks", default=20000, show_default=True, help="Other users' chunks.")
+@click.option("--queries", default=200, show_default=True)
+@click.option("--k", default=10, show_default=True)
+def bench_dense_command(sizes: str, other_chunks: int, queries: int, k: int):
+    """Dense search latency and recall@k: Chroma HNSW vs exact vs quantized exact search."""
+    parsed = tuple(int(size) for size in sizes.split(","))
+    click.echo(f"{other_chunks} chunks of other users, top {k} (throwaway Chroma store)")
+    for size, backends in bench_dense_backends(parsed, other_chunks, queries, k).items():
+        for name, summary in backends.items():
+            click.echo(
+                f"  {size:>6} chunks {name:<7} p50={summary['p50_ms']}ms "
+                f"p99={summary['p99_ms']}ms recall={summary['recall']} "
+                f"scanned={summary['scanned_bytes'] or '-'}"
+            )
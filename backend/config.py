@@ -8,6 +8,17 @@ class BaseConfig:
         f"sqlite:///{os.path.join(os.path.dirname(__file__), '..', 'instance', 'app.db')}",
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # File SQLite only: WAL, synchronous, busy timeout and a connection pool
+    # per worker (see backend/database.py).
+    SQLITE_TUNING = os.getenv("SQLITE_TUNING", "true").lower() in {"1", "true", "yes"}
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    # Write UsageLog rows in batches from a background thread per worker
+    # (see backend/usage_buffer.py).
+    USAGE_BUFFER = os.getenv("USAGE_BUFFER", "false").lower() in {"1", "true", "yes"}
+    USAGE_BUFFER_INTERVAL_MS = int(os.getenv("USAGE_BUFFER_INTERVAL_MS", "1000"))
+    USAGE_BUFFER_MAX_BATCH = int(os.getenv("USAGE_BUFFER_MAX_BATCH", "200"))
     # Development-only fallback; create_app() refuses to start in production
     # when JWT_SECRET_KEY is not provided via the environment.
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-only-insecure-secret")
@@ -23,6 +34,19 @@ class BaseConfig:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB upload limit
     RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
     RATE_LIMIT = os.getenv("RATE_LIMIT", "60/minute")
+    # Load model weights in create_app() (shared copy-on-write under gunicorn
+    # --preload) / run a dummy embed + rerank when each ASGI worker starts.
+    RAG_PRELOAD_MODELS = os.getenv("RAG_PRELOAD_MODELS", "false").lower() in {"1", "true", "yes"}
+    RAG_WARMUP = os.getenv("RAG_WARMUP", "false").lower() in {"1", "true", "yes"}
+    # Background warmer, once per worker process (ASGI startup, else the first
+    # request): models, vector store, then BM25 and Chroma caches of the most
+    # active users (by recent UsageLog rows).
+    RAG_WARMER = os.getenv("RAG_WARMER", "false").lower() in {"1", "true", "yes"}
+    RAG_WARMER_TOP_USERS = int(os.getenv("RAG_WARMER_TOP_USERS", "20"))
+    RAG_WARMER_LOOKBACK_DAYS = int(os.getenv("RAG_WARMER_LOOKBACK_DAYS", "7"))
+    # Prometheus /metrics endpoint (unauthenticated: expose it to the scraper
+    # only). Several workers also need METRICS_MULTIPROC_DIR, see backend/metrics.py.
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in {"1", "true", "yes"}
     FRONTEND_ORIGINS = [
         origin.strip()
         for origin in os.getenv("FRONTEND_ORIGINS", "http://localhost:5173").split(",")
@@ -0,0 +1,71 @@
+"""Database engine setup, with SQLite tuned for concurrent workers.
+
+Every chat turn commits a few small transactions. With several gunicorn
+workers on SQLite's default rollback journal, a writer blocks every reader
+and pysqlite gives up with "database is locked". For a file database, and
+unless SQLITE_TUNING is off, connections are therefore opened with:
+
+- journal_mode=WAL: readers never block, and writers only wait for each other;
+- synchronous=NORMAL: no fsync per commit in WAL mode, still crash-safe
+  (the last commits can be lost on power failure, not corrupted);
+- a busy timeout: a writer waits up to SQLITE_BUSY_TIMEOUT_MS for the lock
+  instead of failing at once;
+- a bounded connection pool per worker, so connections, and their page cache,
+  are reused.
+"""
+
+import sqlalchemy as sa
+from flask import Flask
+
+from .extensions import db
+
+
+def sqlite_file(uri: str) -> bool:
+    url = sa.engine.make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _tuned(config) -> bool:
+    return config["SQLITE_TUNING"] and sqlite_file(config["SQLALCHEMY_DATABASE_URI"])
+
+
+def engine_options(config) -> dict:
+    """Engine options of the configured database; empty unless SQLite is tuned."""
+    if not _tuned(config):
+        return {}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_POOL_SIZE"],
+        "connect_args": {"timeout": config["SQLITE_BUSY_TIMEOUT_MS"] / 1000},
+    }
+
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def _set_pragmas(config):
+    busy_timeout_ms = int(config["SQLITE_BUSY_TIMEOUT_MS"])
+    synchronous = config["SQLITE_SYNCHRONOUS"].upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {SYNCHRONOUS_MODES}")
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        cursor.close()
+
+    return on_connect
+
+
+def init_db(app: Flask) -> None:
+    """db.init_app() with the tuned engine options and connection pragmas."""
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(app.config),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+    db.init_app(app)
+    if _tuned(app.config):
+        with app.app_context():
+            sa.event.listen(db.engine, "connect", _set_pragmas(app.config))
@@ -1,20 +1,15 @@
 import time
+from functools import partial
 
-from langchain.chat_models import init_chat_model
 from pydantic import BaseModel, Field
 
 from ..rag.pipeline import RAGPipeline
+from ..rag.usage import cached_input_tokens, estimate_cost, usage_by_model
 from .goldset import GoldItem
-from .metrics import mean
+from .metrics import mean, percentile, stage_percentiles
 
 JUDGE_MODEL = "claude-sonnet-4-6"
 
-# USD per million tokens (input, output) - used for cost estimates only.
-PRICING_PER_MTOK = {
-    "claude-haiku-4-5": (1.0, 5.0),
-    "claude-sonnet-4-6": (3.0, 15.0),
-}
-
 try:
     from langchain_core.callbacks import get_usage_metadata_callback
 except ImportError:  # pragma: no cover - older langchain-core
@@ -83,6 +78,8 @@ class AnswerJudge:
     @property
     def llm(self):
         if self._llm is None:
+            from langchain.chat_models import init_chat_model
+
             self._llm = init_chat_model(JUDGE_MODEL, model_provider="anthropic", temperature=0.0)
         return self._llm
 
@@ -115,37 +112,32 @@ class AnswerJudge:
         return verdict.refused
 
 
-def _usage_to_dict(usage_metadata: dict) -> dict:
-    return {
-        model: {
-            "input_tokens": data.get("input_tokens", 0),
-            "output_tokens": data.get("output_tokens", 0),
-        }
-        for model, data in usage_metadata.items()
-    }
-
-
-def _estimate_cost(usage: dict | None) -> float | None:
-    if not usage:
-        return None
-    total = 0.0
-    priced = False
-    for model, data in usage.items():
-        for name, (price_in, price_out) in PRICING_PER_MTOK.items():
-            if name in model:
-                total += data["input_tokens"] / 1e6 * price_in
-                total += data["output_tokens"] / 1e6 * price_out
-                priced = True
-    return round(total, 6) if priced else None
-
-
 def _tracked(callable_, *args, **kwargs) -> tuple[object, dict | None]:
     """Run callable_ and capture LLM token usage when langchain supports it."""
     if get_usage_metadata_callback is None:
         return callable_(*args, **kwargs), None
     with get_usage_metadata_callback() as cb:
         result = callable_(*args, **kwargs)
-    return result, _usage_to_dict(cb.usage_metadata)
+    return result, usage_by_model(cb.usage_metadata)
+
+
+def _streamed_query(pipeline: RAGPipeline, question: str, *, user_id: int) -> dict:
+    """query() through stream_query(), plus time_to_sources_ms and ttft_ms."""
+    start = time.perf_counter()
+    result = {"sources": [], "timings": {}}
+    parts = []
+    for event in pipeline.stream_query(question, user_id=user_id):
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        if event["type"] == "sources":
+            result.setdefault("time_to_sources_ms", elapsed_ms)
+            result["sources"] = event["sources"]
+        elif event["type"] == "delta":
+            result.setdefault("ttft_ms", elapsed_ms)
+            parts.append(event["text"])
+        else:
+            result["timings"] = event["timings"]
+    result["answer"] = "".join(parts)
+    return result
 
 
 def evaluate_answers(
@@ -155,14 +147,20 @@ def evaluate_answers(
     user_id: int,
     judge: AnswerJudge | None = None,
     limit: int | None = None,
+    stream: bool = False,
 ) -> dict:
-    """End-to-end evaluation: query() + LLM judge on every gold question."""
+    """End-to-end evaluation: query() + LLM judge on every gold question.
+
+    With stream=True answers go through stream_query(), as on the SSE route,
+    and time to sources / first token are measured too.
+    """
     judge = judge or AnswerJudge()
     per_question = []
+    ask = partial(_streamed_query, pipeline) if stream else pipeline.query
 
     for item in items[:limit]:
         started = time.perf_counter()
-        result, query_usage = _tracked(pipeline.query, item.question, user_id=user_id)
+        result, query_usage = _tracked(ask, item.question, user_id=user_id)
         latency_ms = (time.perf_counter() - started) * 1000
 
         answer = result.get("answer", "")
@@ -184,8 +182,11 @@ def evaluate_answers(
             ],
             "answer": answer,
             "latency_ms": round(latency_ms, 1),
+            "timings": result.get("timings", {}),
+            **{key: result[key] for key in ("time_to_sources_ms", "ttft_ms") if key in result},
             "query_usage": query_usage,
-            "query_cost_usd": _estimate_cost(query_usage),
+            "query_cost_usd": estimate_cost(query_usage),
+            "query_cached_input_tokens": cached_input_tokens(query_usage),
         }
 
         if item.is_negative:
@@ -196,7 +197,7 @@ def evaluate_answers(
                 judge.judge_answer, item.question, item.expected_answer_points, answer, sources_text
             )
             entry.update(verdict)
-        entry["judge_cost_usd"] = _estimate_cost(judge_usage)
+        entry["judge_cost_usd"] = estimate_cost(judge_usage)
 
         per_question.append(entry)
 
@@ -214,6 +215,11 @@ def evaluate_answers(
         "avg_latency_ms": round(mean([q["latency_ms"] for q in per_question]), 1),
         "total_query_cost_usd": _sum_costs(q["query_cost_usd"] for q in per_question),
         "total_judge_cost_usd": _sum_costs(q["judge_cost_usd"] for q in per_question),
+        "total_query_cached_input_tokens": sum(
+            q["query_cached_input_tokens"] for q in per_question
+        ),
+        **stage_percentiles(per_question),
+        **_stream_percentiles(per_question),
     }
     return {
         "questions_evaluated": len(per_question),
@@ -222,6 +228,17 @@ def evaluate_answers(
     }
 
 
+def _stream_percentiles(per_question: list[dict]) -> dict[str, float]:
+    """p50/p95 time to sources and to first token of streamed runs."""
+    metrics = {}
+    for name in ("time_to_sources", "ttft"):
+        values = [q[f"{name}_ms"] for q in per_question if f"{name}_ms" in q]
+        if values:
+            metrics[f"{name}_p50_ms"] = percentile(values, 50)
+            metrics[f"{name}_p95_ms"] = percentile(values, 95)
+    return metrics
+
+
 def _sum_costs(costs) -> float | None:
     known = [c for c in costs if c is not None]
     return round(sum(known), 6) if known else None
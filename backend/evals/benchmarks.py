@@ -0,0 +1,533 @@
+"""Latency/throughput micro-benchmarks behind the `flask rag bench-*` commands.
+
+Unlike the eval runs these measure speed, not quality: results are printed,
+not written to the runs directory.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from .metrics import percentile
+
+
+def latency_summary(latencies_ms: list[float], wall_seconds: float) -> dict:
+    return {
+        "requests": len(latencies_ms),
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "qps": round(len(latencies_ms) / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+    }
+
+
+def run_concurrently(call: Callable[[str], object], inputs: list[str], concurrency: int) -> dict:
+    """Run call(input) for every input from `concurrency` threads; latency summary."""
+
+    def _timed(value: str) -> float:
+        start = time.perf_counter()
+        call(value)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(_timed, inputs))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def bench_embeddings(
+    variants: dict[str, Embeddings], queries: list[str], concurrency: int
+) -> dict[str, dict]:
+    """embed_query() under concurrency, one summary per embedding variant."""
+    results = {}
+    for name, embedding in variants.items():
+        embedding.embed_query(queries[0])  # warm-up outside the measurement
+        results[name] = run_concurrently(embedding.embed_query, queries, concurrency)
+    return results
+
+
+# Runs in a fresh interpreter: every import and model load is paid again.
+_STARTUP_PROBE = """
+import json, os, time
+start = time.perf_counter()
+elapsed = lambda: round((time.perf_counter() - start) * 1000, 1)
+from backend.app import create_app
+from backend.rag import get_pipeline
+imported = elapsed()
+app = create_app()
+booted = elapsed()
+pipeline = get_pipeline(app.config["VECTOR_STORE_FOLDER"], app.config["RAG_TOP_K"])
+if os.environ.get("RAG_WARMUP", "").lower() in {"1", "true", "yes"}:
+    pipeline.warmup()
+ready = elapsed()
+pipeline.embedding.embed_query("startup benchmark")
+pipeline.retrieve("startup benchmark", user_id=0)
+print(json.dumps({"import_ms": imported, "boot_ms": booted, "ready_ms": ready,
+                  "first_request_ms": elapsed()}))
+"""
+
+STARTUP_MODES = {
+    "lazy": {},
+    "preload": {"RAG_PRELOAD_MODELS": "true"},
+    "preload+warmup": {"RAG_PRELOAD_MODELS": "true", "RAG_WARMUP": "true"},
+}
+
+
+def bench_startup(modes: dict[str, dict] = STARTUP_MODES, runs: int = 3) -> dict[str, dict]:
+    """Median boot and time-to-first-request (embed + retrieval) per startup mode.
+
+    ready_ms is when a worker would accept traffic; first_request_ms adds the
+    first request's own cost, which is where lazy loading shows up.
+    """
+    root = Path(__file__).resolve().parents[2]
+    results = {}
+    for name, env in modes.items():
+        samples = []
+        for _ in range(runs):
+            completed = subprocess.run(
+                [sys.executable, "-c", _STARTUP_PROBE],
+                cwd=root,
+                env={**os.environ, **env},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        results[name] = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+    return results
+
+
+def _seed_history(user_id: int, sessions: int, messages: int) -> None:
+    from sqlalchemy import insert
+
+    from ..extensions import db
+    from ..models import ChatMessage, ChatSession
+
+    start = datetime(2025, 1, 1, tzinfo=UTC)
+    db.session.execute(
+        insert(ChatSession),
+        [
+            {"user_id": user_id, "title": f"Session {i}", "created_at": start + timedelta(hours=i)}
+            for i in range(sessions)
+        ],
+    )
+    session_ids = db.session.scalars(
+        db.select(ChatSession.id).filter_by(user_id=user_id).order_by(ChatSession.id)
+    ).all()
+    sources = [
+        {"source": f"note-{i}.md", "score": 0.5, "confidence": 0.5, "snippet": "x" * 280}
+        for i in range(5)
+    ]
+    for session_id in session_ids:
+        db.session.execute(
+            insert(ChatMessage),
+            [
+                {
+                    "session_id": session_id,
+                    "role": "user" if j % 2 == 0 else "assistant",
+                    "content": "Que disent mes notes sur ce sujet ? " * 4,
+                    "sources": None if j % 2 == 0 else sources,
+                    "created_at": start + timedelta(seconds=j),
+                }
+                for j in range(messages)
+            ],
+        )
+    db.session.commit()
+
+
+def _legacy_history(user_id: int) -> bytes:
+    """The former /history payload: every session, messages loaded per session."""
+    from ..models import ChatSession
+
+    sessions = ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.created_at.desc())
+    return json.dumps(
+        {
+            "sessions": [
+                {
+                    "session_id": session.id,
+                    "title": session.title,
+                    "created_at": session.created_at.isoformat(),
+                    "messages": [
+                        {
+                            "id": msg.id,
+                            "role": msg.role,
+                            "content": msg.content,
+                            "created_at": msg.created_at.isoformat(),
+                            "sources": msg.sources,
+                            "response_time_ms": msg.response_time_ms,
+                        }
+                        for msg in session.messages
+                    ],
+                }
+                for session in sessions
+            ]
+        }
+    ).encode()
+
+
+def bench_history(sessions: int = 1000, messages: int = 50, runs: int = 5) -> dict[str, dict]:
+    """Chat history reads on a throwaway database: median latency, SQL queries, bytes.
+
+    "legacy" is the former unpaginated /history (one query per session); the
+    other variants are requests to the paginated endpoints.
+    """
+    from sqlalchemy import event
+
+    from ..app import create_app
+    from ..config import BaseConfig
+    from ..extensions import db
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        class BenchConfig(BaseConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp}/bench.db"
+            UPLOAD_FOLDER = f"{tmp}/uploads"
+            VECTOR_STORE_FOLDER = f"{tmp}/vectorstore"
+            RATELIMIT_ENABLED = False
+            RAG_PRELOAD_MODELS = False
+            RAG_WARMER = False
+
+        app = create_app(BenchConfig)
+        client = app.test_client()
+        registered = client.post(
+            "/api/auth/register", json={"email": "bench@example.com", "password": "bench-password"}
+        ).get_json()
+        user_id = registered["user"]["id"]
+        headers = {"Authorization": f"Bearer {registered['access_token']}"}
+        with app.app_context():
+            _seed_history(user_id, sessions, messages)
+            engine = db.engine
+        first_session = client.get("/api/chat/history?limit=1", headers=headers).get_json()
+
+        messages_url = f"/api/chat/sessions/{first_session['sessions'][0]['session_id']}/messages"
+
+        def _get(url: str) -> Callable[[], bytes]:
+            return lambda: client.get(url, headers=headers).get_data()
+
+        def _legacy() -> bytes:
+            with app.app_context():
+                return _legacy_history(user_id)
+
+        variants = {
+            "legacy (all, N+1)": _legacy,
+            "sessions page": _get("/api/chat/history"),
+            "sessions page + messages": _get("/api/chat/history?include_messages=1"),
+            "messages page": _get(messages_url),
+            "messages page, no sources": _get(f"{messages_url}?include_sources=0"),
+        }
+        queries = []
+        event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+        results = {}
+        for name, call in variants.items():
+            latencies = []
+            for _ in range(runs):
+                queries.clear()
+                start = time.perf_counter()
+                body = call()
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                "p50_ms": round(statistics.median(latencies), 2),
+                "queries": len(queries),
+                "bytes": len(body),
+            }
+        engine.dispose()
+    return results
+
+
+PERSISTENCE_MODES = {
+    "default": {"SQLITE_TUNING": False, "USAGE_BUFFER": False},
+    "tuned": {"SQLITE_TUNING": True, "USAGE_BUFFER": False},
+    "tuned+usage-buffer": {"SQLITE_TUNING": True, "USAGE_BUFFER": True},
+}
+
+
+def _persist_turn(pipeline, user_id: int, session_id: int) -> None:
+    """The database work of one /api/chat/query turn, without retrieval or the LLM."""
+    from ..extensions import db
+    from ..models import ChatMessage
+    from ..routes.chat import _load_history, _usage_entry
+    from ..usage_buffer import save_usage
+
+    _load_history(pipeline, session_id)
+    db.session.add(ChatMessage(session_id=session_id, role="user", content="Question ?"))
+    db.session.flush()
+    answer = ChatMessage(
+        session_id=session_id,
+        role="assistant",
+        content="Réponse. " * 40,
+        sources=[{"source": "notes.md", "score": 0.5, "snippet": "x" * 280}] * 4,
+        response_time_ms=800.0,
+    )
+    db.session.add(answer)
+    db.session.flush()
+    timings = dict.fromkeys(("embedding", "dense_search", "generation"), 10.0)
+    usage = {"generation": {"claude-haiku-4-5": {"input_tokens": 900, "output_tokens": 120}}}
+    save_usage(_usage_entry(user_id, "chat.query", 800.0, timings, usage, answer))
+    db.session.commit()
+
+
+def _bench_persistence_mode(overrides: dict, concurrency: int, turns: int) -> dict:
+    from types import SimpleNamespace
+
+    from sqlalchemy.exc import OperationalError
+
+    from ..app import create_app
+    from ..config import BaseConfig
+    from ..extensions import db
+    from ..models import ChatSession, User
+    from ..rag.retrieval_config import RetrievalConfig
+
+    pipeline = SimpleNamespace(config=RetrievalConfig())
+    with tempfile.TemporaryDirectory() as tmp:
+        config = type(
+            "BenchConfig",
+            (BaseConfig,),
+            {
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/bench.db",
+                "UPLOAD_FOLDER": f"{tmp}/uploads",
+                "VECTOR_STORE_FOLDER": f"{tmp}/vectorstore",
+                "RAG_PRELOAD_MODELS": False,
+                "RAG_WARMER": False,
+                **overrides,
+            },
+        )
+        app = create_app(config)
+        with app.app_context():
+            sessions = [
+                ChatSession(user=User(email=f"bench-{i}@example.com", password_hash="x"))
+                for i in range(concurrency)
+            ]
+            db.session.add_all(sessions)
+            db.session.commit()
+            players = [(session.user_id, session.id) for session in sessions]
+        errors = []
+
+        def _turn(player: tuple[int, int]) -> None:
+            with app.app_context():
+                try:
+                    _persist_turn(pipeline, *player)
+                except OperationalError:
+                    db.session.rollback()
+                    errors.append(player)
+
+        summary = run_concurrently(_turn, players * turns, concurrency)
+        if buffer := app.extensions.get("usage_buffer"):
+            buffer.flush()
+        with app.app_context():
+            db.engine.dispose()
+    return {**summary, "errors": len(errors)}
+
+
+def bench_chat_persistence(
+    concurrency: int = 16, turns: int = 50, modes: dict[str, dict] = PERSISTENCE_MODES
+) -> dict[str, dict]:
+    """Concurrent chat-turn persistence on a file SQLite database, per engine mode.
+
+    Each thread plays one user; "errors" counts turns that failed with
+    "database is locked" (or any other OperationalError).
+    """
+    return {
+        name: _bench_persistence_mode(overrides, concurrency, turns)
+        for name, overrides in modes.items()
+    }
+
+
+class UnitFakeEmbedding(DeterministicFakeEmbedding):
+    """DeterministicFakeEmbedding with unit-norm vectors, like all-MiniLM-L6-v2's."""
+
+    def _get_embedding(self, seed: int) -> list[float]:
+        vector = np.random.default_rng(seed).normal(size=self.size)
+        return list(vector / np.linalg.norm(vector))
+
+
+def _synthetic_chunks(user_id: int, count: int) -> list[Document]:
+    # Each chunk text gets a pseudo-random vector of its own.
+    return [
+        Document(page_content=f"note {user_id}-{i}", metadata={"user_id": user_id})
+        for i in range(count)
+    ]
+
+
+def bench_partitioning(
+    users: int = 50, chunks_per_user: int = 400, queries: int = 200, shards: int = 8
+) -> dict[str, dict]:
+    """Dense retrieval latency of one user's query, per vector store layout.
+
+    Every layout holds the same synthetic store (users x chunks_per_user
+    chunks, random 384-dimensional vectors) in a throwaway directory; the
+    queries are spread over the users, run one at a time once every user's
+    collection is open. "chunks_searched" is the size of the collection a
+    query searches.
+    """
+    from ..rag.pipeline import RAGPipeline
+    from ..rag.retrieval_config import PARTITIONING_MODES, RetrievalConfig
+
+    chunks = {
+        user_id: _synthetic_chunks(user_id, chunks_per_user) for user_id in range(1, users + 1)
+    }
+    questions = [f"question {i}" for i in range(queries)]
+    results = {}
+    for mode in PARTITIONING_MODES:
+        config = RetrievalConfig(partitioning=mode, partition_shards=shards, final_k=5)
+        with tempfile.TemporaryDirectory() as tmp:
+            pipeline = RAGPipeline(persist_directory=tmp, config=config)
+            pipeline._embedding = UnitFakeEmbedding(size=384)
+            for docs in chunks.values():
+                pipeline.ingest_documents(docs)
+            for user_id in chunks:  # opens every collection, as the warmer would
+                pipeline.retrieve(questions[0], user_id=user_id)
+            latencies = []
+            start = time.perf_counter()
+            for i, question in enumerate(questions):
+                query_start = time.perf_counter()
+                pipeline.retrieve(question, user_id=i % users + 1)
+                latencies.append((time.perf_counter() - query_start) * 1000)
+            summary = latency_summary(latencies, time.perf_counter() - start)
+            searched = pipeline._user_vectorstore(1)._collection.count()
+        results[mode] = {**summary, "chunks_searched": searched}
+    return results
+
+
+DENSE_VARIANTS = {
+    "chroma": {"dense_backend": "chroma"},
+    "exact": {"dense_backend": "exact"},
+    "binary": {"dense_backend": "exact", "dense_quantization": "binary"},
+    "int8": {"dense_backend": "exact", "dense_quantization": "int8"},
+}
+
+
+def bench_dense_backends(
+    sizes: tuple[int, ...] = (1000, 5000, 20000),
+    other_chunks: int = 20000,
+    queries: int = 200,
+    k: int = 10,
+    variants: dict[str, dict] = DENSE_VARIANTS,
+) -> dict[int, dict[str, dict]]:
+    """Dense search of one user per corpus size: Chroma HNSW, exact, quantized.
+
+    The store also holds `other_chunks` chunks of other users (one global
+    collection, filtered by user_id). "recall" is the share of the exact top
+    k that a variant returns, averaged over the queries; "scanned_bytes" what
+    the exact backend's first pass reads per query.
+    """
+    from dataclasses import replace
+
+    from ..rag.pipeline import RAGPipeline
+    from ..rag.retrieval_config import RetrievalConfig
+
+    embedding = UnitFakeEmbedding(size=384)
+    vectors = embedding.embed_documents([f"question {i}" for i in range(queries)])
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            pipeline = RAGPipeline(persist_directory=tmp, config=RetrievalConfig())
+            pipeline._embedding = embedding
+            for user_id, count in ((1, size), (2, other_chunks)):
+                docs = _synthetic_chunks(user_id, count)
+                for start in range(0, count, 5000):
+                    pipeline.ingest_documents(docs[start : start + 5000])
+            hits = {}
+            results[size] = {}
+            for backend, overrides in variants.items():
+                pipeline.config = replace(RetrievalConfig(), **overrides)
+                pipeline._dense_hits("", 1, k, vectors[0])  # builds / opens the index
+                latencies, hits[backend] = [], []
+                start = time.perf_counter()
+                for vector in vectors:
+                    query_start = time.perf_counter()
+                    hits[backend].append(
+                        {hit["id"] for hit in pipeline._dense_hits("", 1, k, vector)}
+                    )
+                    latencies.append((time.perf_counter() - query_start) * 1000)
+                results[size][backend] = {
+                    **latency_summary(latencies, time.perf_counter() - start),
+                    "scanned_bytes": pipeline.dense_index_bytes(1),
+                }
+            for backend in variants:
+                found = [
+                    len(got & truth) / k
+                    for got, truth in zip(hits[backend], hits["exact"], strict=True)
+                ]
+                results[size][backend]["recall"] = round(statistics.mean(found), 4)
+    return results
+
+
+FILTER_VARIANTS = {
+    "chroma": {"dense_backend": "chroma"},
+    "exact": {"dense_backend": "exact"},
+    "hybrid": {"dense_backend": "exact", "hybrid_enabled": True},
+}
+
+
+def bench_filters(
+    chunks: int = 5000,
+    queries: int = 100,
+    k: int = 10,
+    variants: dict[str, dict] = FILTER_VARIANTS,
+) -> dict[str, dict[str, dict]]:
+    """retrieve() latency of one user, unscoped and scoped, per search backend.
+
+    The user's chunks are spread over 10 folders, 20 tags and 2024's days;
+    the scopes select one folder (10%), one tag (5%) and December (8%).
+    "hits" is the average number of hits returned: k when the scope holds
+    enough chunks, since the searches only score the chunks in scope.
+    """
+    from dataclasses import replace
+
+    from ..rag.filters import MetadataFilter
+    from ..rag.pipeline import RAGPipeline
+    from ..rag.retrieval_config import RetrievalConfig
+
+    scopes = {
+        "none": None,
+        "folder": MetadataFilter(folder="dossier-3"),
+        "tag": MetadataFilter(tags=("sujet-7",)),
+        "date": MetadataFilter(modified_after="2024-12-01"),
+    }
+    start_day = datetime(2024, 1, 1)
+    docs = [
+        Document(
+            page_content=f"note {i} sujet {i % 20}",
+            metadata={
+                "user_id": 1,
+                "folder": f"dossier-{i % 10}",
+                "tags": [f"sujet-{i % 20}", "notes"],
+                "modified_at": (start_day + timedelta(days=i % 366)).isoformat(),
+            },
+        )
+        for i in range(chunks)
+    ]
+    questions = [f"question sujet {i}" for i in range(queries)]
+    results: dict[str, dict[str, dict]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = RAGPipeline(persist_directory=tmp, config=RetrievalConfig())
+        pipeline._embedding = UnitFakeEmbedding(size=384)
+        for begin in range(0, chunks, 5000):
+            pipeline.ingest_documents(docs[begin : begin + 5000])
+        for name, overrides in variants.items():
+            pipeline.config = replace(RetrievalConfig(), final_k=k, **overrides)
+            results[name] = {}
+            for scope_name, scope in scopes.items():
+                pipeline.retrieve(questions[0], user_id=1, filters=scope)  # builds the indexes
+                latencies, counts = [], []
+                begin = time.perf_counter()
+                for question in questions:
+                    query_start = time.perf_counter()
+                    counts.append(len(pipeline.retrieve(question, user_id=1, filters=scope)))
+                    latencies.append((time.perf_counter() - query_start) * 1000)
+                results[name][scope_name] = {
+                    **latency_summary(latencies, time.perf_counter() - begin),
+                    "hits": round(statistics.mean(counts), 2),
+                }
+    return results
@@ -1,7 +1,6 @@
 import random
 from pathlib import Path
 
-from langchain.chat_models import init_chat_model
 from pydantic import BaseModel, Field
 
 from ..rag.connectors import ObsidianConnector
@@ -81,6 +80,8 @@ class GoldsetGenerator:
     @property
     def llm(self):
         if self._llm is None:
+            from langchain.chat_models import init_chat_model
+
             self._llm = init_chat_model(
                 GENERATOR_MODEL, model_provider="anthropic", temperature=0.7
             )
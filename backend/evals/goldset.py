@@ -2,7 +2,7 @@ import json
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
 
-VALID_TAGS = {"factual", "multi-note", "negative"}
+VALID_TAGS = {"factual", "multi-note", "negative", "follow-up"}
 
 
 @dataclass
@@ -12,6 +12,8 @@ class GoldItem:
     expected_note_paths: list[str] = field(default_factory=list)
     expected_answer_points: list[str] = field(default_factory=list)
     tags: list[str] = field(default_factory=list)
+    # Prior turns for follow-up questions: [{"role", "content", "sources"?}].
+    history: list[dict] = field(default_factory=list)
 
     @property
     def is_negative(self) -> bool:
@@ -36,6 +38,7 @@ def load_goldset(path: str | Path) -> list[GoldItem]:
             expected_note_paths=list(data.get("expected_note_paths", [])),
             expected_answer_points=list(data.get("expected_answer_points", [])),
             tags=list(data.get("tags", [])),
+            history=list(data.get("history", [])),
         )
         if item.id in seen_ids:
             raise ValueError(f"{path}:{line_no}: duplicate id {item.id!r}")
@@ -1,5 +1,7 @@
 import math
 
+from ..rag.tracing import STAGES
+
 
 def unique_ordered(values: list[str]) -> list[str]:
     """Deduplicate while keeping the first-occurrence (rank) order."""
@@ -47,3 +49,23 @@ def ndcg_at_k(expected: list[str], retrieved: list[str], k: int = 5) -> float:
 
 def mean(values: list[float]) -> float:
     return sum(values) / len(values) if values else 0.0
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in [0, 100]); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def stage_percentiles(per_question: list[dict]) -> dict[str, float]:
+    """p50/p95 of every pipeline stage that ran, e.g. "rerank_p95_ms"."""
+    metrics = {}
+    for stage in STAGES:
+        durations = [q["timings"][stage] for q in per_question if stage in q["timings"]]
+        if durations:
+            metrics[f"{stage}_p50_ms"] = percentile(durations, 50)
+            metrics[f"{stage}_p95_ms"] = percentile(durations, 95)
+    return metrics
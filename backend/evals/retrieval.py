@@ -1,6 +1,10 @@
+from collections import Counter
+from dataclasses import replace
+
 from ..rag.pipeline import RAGPipeline
+from ..rag.tracing import tracing
 from .goldset import GoldItem
-from .metrics import mean, mrr, ndcg_at_k, recall_at_k, unique_ordered
+from .metrics import mean, mrr, ndcg_at_k, recall_at_k, stage_percentiles, unique_ordered
 
 RECALL_KS = (1, 3, 5)
 
@@ -15,19 +19,44 @@ def _retrieved_note_paths(hits: list[dict]) -> list[str]:
 
 
 def evaluate_retrieval(
-    items: list[GoldItem], *, pipeline: RAGPipeline, user_id: int, k: int = 5
+    items: list[GoldItem],
+    *,
+    pipeline: RAGPipeline,
+    user_id: int,
+    k: int = 5,
+    rewrite_tier: str | None = None,
 ) -> dict:
-    """Retrieval-only evaluation: no rewriter, no grader, no answerer.
+    """Retrieval-only evaluation: no grader, no answerer.
 
     Negative questions are skipped (they have no expected notes). Metrics are
     computed on the unique note paths of the retrieved chunks, in rank order.
+    With rewrite_tier ("local", "llm" or "tiered") each question first goes
+    through the pipeline's rewrite policy with its gold history, so the
+    rewrite tiers can be compared on the same gold set; only "llm" and
+    "tiered" may call the LLM.
+
+    Retrieval latency is reported as p50/p95 per stage (e.g.
+    "dense_search_p50_ms"), and, with the exact dense backend, the bytes its
+    first pass scans per query as "dense_scanned_bytes", so that runs with
+    and without quantization can be compared in eval-report.
+    "avg_context_chars" is the text the hits would put in the answer prompt
+    (sections, with small-to-big expansion), "avg_unique_notes" the number of
+    distinct notes among the k hits, which diversity selection raises.
     """
     per_question = []
     for item in items:
         if item.is_negative:
             continue
 
-        hits = pipeline.retrieve(item.question, user_id=user_id, top_k=k)
+        query = item.question
+        rewrite = None
+        if rewrite_tier is not None:
+            tier = None if rewrite_tier == "tiered" else rewrite_tier
+            rewrite = pipeline.rewrite_query(item.question, item.history, tier=tier)
+            query = rewrite["query"]
+
+        with tracing() as trace:
+            hits = pipeline.retrieve(query, user_id=user_id, top_k=k)
         retrieved = _retrieved_note_paths(hits)
 
         question_metrics = {
@@ -38,16 +67,20 @@ def evaluate_retrieval(
         question_metrics["mrr"] = mrr(item.expected_note_paths, retrieved)
         question_metrics["ndcg@5"] = ndcg_at_k(item.expected_note_paths, retrieved, 5)
 
-        per_question.append(
-            {
-                "id": item.id,
-                "question": item.question,
-                "tags": item.tags,
-                "expected_note_paths": item.expected_note_paths,
-                "retrieved_note_paths": retrieved,
-                "metrics": question_metrics,
-            }
-        )
+        entry = {
+            "id": item.id,
+            "question": item.question,
+            "tags": item.tags,
+            "expected_note_paths": item.expected_note_paths,
+            "retrieved_note_paths": retrieved,
+            "metrics": question_metrics,
+            "context_chars": sum(len(hit["content"]) for hit in hits),
+            "unique_notes": len(retrieved),
+            "timings": trace.as_dict(),
+        }
+        if rewrite is not None:
+            entry["rewrite"] = rewrite
+        per_question.append(entry)
 
     if not per_question:
         raise ValueError("The gold set contains no non-negative question")
@@ -60,10 +93,71 @@ def evaluate_retrieval(
         }
 
     tags = sorted({tag for q in per_question for tag in q["tags"]})
-    return {
+    result = {
         "k": k,
         "questions_evaluated": len(per_question),
-        "metrics": _aggregate(per_question),
+        "metrics": {
+            **_aggregate(per_question),
+            "avg_context_chars": round(mean([q["context_chars"] for q in per_question]), 1),
+            "avg_unique_notes": round(mean([q["unique_notes"] for q in per_question]), 2),
+            **stage_percentiles(per_question),
+        },
         "by_tag": {tag: _aggregate([q for q in per_question if tag in q["tags"]]) for tag in tags},
         "questions": per_question,
     }
+    scanned = pipeline.dense_index_bytes(user_id)
+    if scanned is not None:
+        result["metrics"]["dense_scanned_bytes"] = scanned
+    if rewrite_tier is not None:
+        tiers = Counter(q["rewrite"]["tier"] for q in per_question)
+        result["rewrite_tiers"] = {
+            tier: round(count / len(per_question), 4) for tier, count in sorted(tiers.items())
+        }
+    return result
+
+
+def sweep_fusion(
+    items: list[GoldItem],
+    *,
+    pipeline: RAGPipeline,
+    user_id: int,
+    k: int = 5,
+    modes: tuple[str, ...],
+    dense_weights: tuple[float, ...],
+    metric: str = "ndcg@5",
+) -> dict:
+    """Hybrid retrieval evaluated for every (fusion, dense weight) pair.
+
+    Returns the settings sorted best first on `metric` (ties keep the sweep
+    order, so the first mode and weight listed win) and the full
+    evaluate_retrieval result of the best one. The pipeline keeps its
+    original config afterwards.
+    """
+    base = pipeline.config
+    settings = []
+    try:
+        for mode in modes:
+            for weight in dense_weights:
+                pipeline.config = replace(
+                    base, hybrid_enabled=True, fusion=mode, fusion_dense_weight=weight
+                )
+                result = evaluate_retrieval(items, pipeline=pipeline, user_id=user_id, k=k)
+                if metric not in result["metrics"]:
+                    raise ValueError(f"Unknown metric {metric!r}")
+                settings.append({"fusion": mode, "fusion_dense_weight": weight, "result": result})
+    finally:
+        pipeline.config = base
+
+    settings.sort(key=lambda setting: setting["result"]["metrics"][metric], reverse=True)
+    return {
+        "metric": metric,
+        "settings": [
+            {
+                "fusion": setting["fusion"],
+                "fusion_dense_weight": setting["fusion_dense_weight"],
+                "metrics": setting["result"]["metrics"],
+            }
+            for setting in settings
+        ],
+        "best": settings[0]["result"],
+    }
@@ -5,7 +5,14 @@ from datetime import UTC, datetime
 from pathlib import Path
 
 from ..rag.answerer import DEFAULT_MODEL as ANSWER_MODEL
-from ..rag.ingestion import CHUNK_OVERLAP, CHUNK_SIZE, MAX_SECTION_CHARS, SECTION_CHUNK_OVERLAP
+from ..rag.ingestion import (
+    CHILD_CHUNK_OVERLAP,
+    CHILD_CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    MAX_SECTION_CHARS,
+    SECTION_CHUNK_OVERLAP,
+)
 from ..rag.pipeline import EMBEDDING_MODEL_NAME, RAGPipeline
 from ..rag.reranker import RERANKER_MODEL_NAME
 from ..rag.rewriter import DEFAULT_MODEL as REWRITER_MODEL
@@ -35,6 +42,8 @@ def build_config(pipeline: RAGPipeline, **extra) -> dict:
             "text_chunk_overlap": CHUNK_OVERLAP,
             "markdown_max_section_chars": MAX_SECTION_CHARS,
             "markdown_section_overlap": SECTION_CHUNK_OVERLAP,
+            "child_chunk_size": CHILD_CHUNK_SIZE,
+            "child_chunk_overlap": CHILD_CHUNK_OVERLAP,
         },
         **extra,
     }
@@ -0,0 +1,373 @@
+"""Prometheus metrics for the serving path, in the text exposition format.
+
+Each process keeps its counters and histograms in memory. With
+METRICS_MULTIPROC_DIR set (needed as soon as gunicorn or uvicorn runs more
+than one worker) a background thread of every process also writes them to
+<dir>/<pid>-<start>.json every METRICS_FLUSH_INTERVAL_S seconds, and at exit;
+a scrape sums every file: whichever worker answers /metrics reports the whole
+server, up to one interval behind. Each process holds a lock on its
+<pid>-<start>.lock while it lives, so a reused pid never passes for a live
+worker. A scrape folds the counts of exited workers into exited.json and
+deletes their files: counters never go backwards, their gauges are dropped,
+and the directory does not grow with worker restarts.
+"""
+
+import atexit
+import contextlib
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or None
+FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_INTERVAL_S", "5"))
+
+# Counts of exited workers, and the lock scrapes hold while folding them in.
+EXITED_FILENAME = "exited.json"
+SCRAPE_LOCK_FILENAME = "scrape.lock"
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets in seconds)
+METRICS: dict[str, tuple[str, str, tuple[float, ...] | None]] = {
+    "rag_http_request_duration_seconds": (
+        "histogram",
+        "Flask request latency up to the response headers, by endpoint.",
+        LATENCY_BUCKETS,
+    ),
+    "rag_query_duration_seconds": (
+        "histogram",
+        "Chat query latency up to the last answer token, by endpoint.",
+        LATENCY_BUCKETS,
+    ),
+    "rag_stage_duration_seconds": (
+        "histogram",
+        "Time spent in each RAG pipeline stage.",
+        STAGE_BUCKETS,
+    ),
+    "rag_time_to_sources_seconds": (
+        "histogram",
+        "Streamed answers: time until the first sources event, by endpoint.",
+        LATENCY_BUCKETS,
+    ),
+    "rag_ttft_seconds": (
+        "histogram",
+        "Streamed answers: time until the first answer token, by endpoint.",
+        LATENCY_BUCKETS,
+    ),
+    "rag_llm_tokens_total": ("counter", "LLM tokens by pipeline stage, model and kind.", None),
+    "rag_bm25_cache_requests_total": ("counter", "BM25 index lookups by result.", None),
+    "rag_bm25_cache_hit_ratio": ("gauge", "BM25 index lookups served from cache.", None),
+    "rag_bm25_cache_users": ("gauge", "Users with a cached BM25 index, per worker.", None),
+    "rag_chroma_chunks": ("gauge", "Chunks stored in the Chroma collection.", None),
+}
+
+TOKEN_KINDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_input_tokens",
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict | None) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """Counters, histograms and per-process gauges of one process."""
+
+    def __init__(
+        self, multiproc_dir: str | None = None, flush_interval_s: float = FLUSH_INTERVAL_S
+    ):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval_s = flush_interval_s
+        self._lock = threading.Lock()
+        self._gauge_functions: dict[str, Callable[[], float]] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._file = (
+            Path(self.multiproc_dir) / f"{self._pid}-{time.time_ns()}.json"
+            if self.multiproc_dir
+            else None
+        )
+        self._liveness_fd: int | None = None
+        self._counters: dict[tuple[str, Labels], float] = {}
+        # name, labels -> [count per bucket (+Inf last), sum]
+        self._histograms: dict[tuple[str, Labels], list] = {}
+
+    def _check_fork(self) -> None:
+        # A forked worker starts from its own zero, not from the master's values.
+        if os.getpid() != self._pid:
+            self._reset()
+        if self._file is not None and self._liveness_fd is None:
+            self._start_publishing()
+
+    def _start_publishing(self) -> None:
+        # Held until the process dies, when the kernel releases it: scrapes
+        # tell live workers from exited ones by trying to take it.
+        self._liveness_fd = os.open(self._file.with_suffix(".lock"), os.O_CREAT | os.O_RDWR)
+        fcntl.flock(self._liveness_fd, fcntl.LOCK_EX)
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self._flush_at_exit, self._pid)
+
+    def _flush_loop(self) -> None:
+        pid = self._pid
+        while True:
+            time.sleep(self.flush_interval_s)
+            if os.getpid() != pid:
+                return
+            self.flush()
+
+    def _flush_at_exit(self, pid: int) -> None:
+        # Exit hooks are inherited through fork: only the registering process flushes.
+        if os.getpid() == pid:
+            self.flush()
+
+    def inc(self, name: str, labels: dict | None = None, amount: float = 1.0) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, labels: dict | None = None) -> None:
+        buckets = METRICS[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram[0][index] += 1
+            histogram[1] += value
+
+    def gauge_function(self, name: str, fn: Callable[[], float]) -> None:
+        """Sample fn() for a per-process gauge each time this process reports."""
+        self._gauge_functions[name] = fn
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            counters = [[name, labels, value] for (name, labels), value in self._counters.items()]
+            histograms = [
+                [name, labels, list(counts), total]
+                for (name, labels), (counts, total) in self._histograms.items()
+            ]
+        gauges = [[name, fn()] for name, fn in self._gauge_functions.items()]
+        return {"pid": self._pid, "counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def flush(self) -> None:
+        """Publish this process's values for the other workers' scrapes (no-op without a dir).
+
+        Called by the flush thread and at exit, not on the request path.
+        """
+        if self.multiproc_dir is None:
+            return
+        _write(self._file, self.snapshot())
+
+    def _snapshots(self) -> list[dict]:
+        if self.multiproc_dir is None:
+            return [self.snapshot()]
+        self.flush()
+        directory = Path(self.multiproc_dir)
+        with _locked(directory / SCRAPE_LOCK_FILENAME):
+            exited = directory / EXITED_FILENAME
+            snapshots = [_read(exited) or _empty_snapshot()]
+            for path in directory.glob("*-*.json"):
+                snapshot = _read(path)
+                if snapshot is None:
+                    continue  # removed or replaced while listing
+                if _alive(path):
+                    snapshots.append(snapshot)
+                    continue
+                snapshots[0] = _merge(snapshots[0], snapshot)
+                _write(exited, snapshots[0])
+                path.unlink(missing_ok=True)
+                path.with_suffix(".lock").unlink(missing_ok=True)
+            # Workers that exited before their first flush leave only a lock.
+            for lock in directory.glob("*-*.lock"):
+                if not lock.with_suffix(".json").exists() and not _alive(lock):
+                    lock.unlink(missing_ok=True)
+        return snapshots
+
+    def render(self, gauges: dict[str, float] | None = None) -> str:
+        """Every process's metrics in the text format; gauges: server-wide values."""
+        counters: dict[tuple[str, Labels], float] = {}
+        histograms: dict[tuple[str, Labels], list] = {}
+        process_gauges: dict[str, list[tuple[int, float]]] = {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, counts, total in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts, strict=True)]
+                merged[1] += total
+            if snapshot["pid"] is not None:
+                for name, value in snapshot["gauges"]:
+                    process_gauges.setdefault(name, []).append((snapshot["pid"], value))
+
+        gauges = dict(gauges or {})
+        hits = counters.get(("rag_bm25_cache_requests_total", (("result", "hit"),)), 0.0)
+        misses = counters.get(("rag_bm25_cache_requests_total", (("result", "miss"),)), 0.0)
+        if hits + misses:
+            gauges["rag_bm25_cache_hit_ratio"] = hits / (hits + misses)
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            samples = []
+            if kind == "counter":
+                samples = [
+                    (name, labels, value)
+                    for (metric, labels), value in sorted(counters.items())
+                    if metric == name
+                ]
+            elif kind == "histogram":
+                for (metric, labels), (counts, total) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*buckets, math.inf), counts, strict=True):
+                        cumulative += count
+                        bucket_labels = (*labels, ("le", _format_value(bound)))
+                        samples.append((f"{name}_bucket", bucket_labels, cumulative))
+                    samples.append((f"{name}_sum", labels, total))
+                    samples.append((f"{name}_count", labels, cumulative))
+            elif name in gauges:
+                samples = [(name, (), gauges[name])]
+            else:
+                samples = [
+                    (name, (("pid", str(pid)),), value)
+                    for pid, value in sorted(process_gauges.get(name, []))
+                ]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(
+                f"{sample}{_format_labels(labels)} {_format_value(value)}"
+                for sample, labels, value in samples
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _alive(path: Path) -> bool:
+    """Whether the process that writes path still runs: its liveness lock is held."""
+    try:
+        fd = os.open(path.with_suffix(".lock"), os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+@contextlib.contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _read(path: Path) -> dict | None:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: Path, snapshot: dict) -> None:
+    # One temporary file per thread: the flush thread and a scrape may both write.
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(snapshot))
+    os.replace(tmp, path)
+
+
+def _empty_snapshot() -> dict:
+    return {"pid": None, "counters": [], "histograms": [], "gauges": []}
+
+
+def _merge(total: dict, snapshot: dict) -> dict:
+    """total plus the counters and histograms of snapshot; gauges are dropped."""
+    counters: dict[tuple, float] = {}
+    for name, labels, value in total["counters"] + snapshot["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0.0) + value
+    histograms: dict[tuple, list] = {}
+    for name, labels, counts, sum_ in total["histograms"] + snapshot["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+        merged[0] = [a + b for a, b in zip(merged[0], counts, strict=True)]
+        merged[1] += sum_
+    return {
+        **_empty_snapshot(),
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "histograms": [
+            [name, labels, counts, sum_] for (name, labels), (counts, sum_) in histograms.items()
+        ],
+    }
+
+
+registry = MetricsRegistry(MULTIPROC_DIR)
+
+
+def record_query(
+    endpoint: str,
+    latency_ms: float,
+    timings: dict[str, float] | None = None,
+    usage: dict[str, dict[str, dict]] | None = None,
+    milestones: dict[str, float] | None = None,
+) -> None:
+    """Record one chat query: latency, stage durations, LLM tokens, stream milestones."""
+    registry.observe("rag_query_duration_seconds", latency_ms / 1000, {"endpoint": endpoint})
+    for milestone, elapsed_ms in (milestones or {}).items():
+        registry.observe(f"rag_{milestone}_seconds", elapsed_ms / 1000, {"endpoint": endpoint})
+    record_stages(timings, usage)
+
+
+def record_stages(
+    timings: dict[str, float] | None = None, usage: dict[str, dict[str, dict]] | None = None
+) -> None:
+    """Record stage durations and LLM tokens, of a query or of work done after it."""
+    for stage, duration_ms in (timings or {}).items():
+        registry.observe("rag_stage_duration_seconds", duration_ms / 1000, {"stage": stage})
+    for stage, by_model in (usage or {}).items():
+        for model, tokens in by_model.items():
+            for kind in TOKEN_KINDS:
+                if tokens.get(kind):
+                    labels = {"stage": stage, "model": model, "kind": kind}
+                    registry.inc("rag_llm_tokens_total", labels, tokens[kind])
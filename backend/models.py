@@ -1,6 +1,7 @@
-from datetime import UTC, datetime
+from datetime import UTC, date, datetime
 
-from sqlalchemy import func
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
 
 from .extensions import db
 
@@ -48,6 +49,9 @@ class ChatSession(db.Model):
         cascade="all, delete-orphan",
         order_by="ChatMessage.created_at",
     )
+    summary = db.relationship(
+        "ChatSummary", back_populates="session", uselist=False, cascade="all, delete-orphan"
+    )
 
     def __repr__(self) -> str:  # pragma: no cover - debug helper
         return f"<ChatSession {self.id} user={self.user_id}>"
@@ -55,6 +59,10 @@ class ChatSession(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = "chat_messages"
+    # Backs the history window: the last N messages of a session.
+    __table_args__ = (
+        db.Index("ix_chat_messages_session_id_created_at", "session_id", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(
@@ -67,6 +75,24 @@ class ChatMessage(db.Model):
     created_at = db.Column(db.DateTime, default=_utcnow, nullable=False)
 
     session = db.relationship("ChatSession", back_populates="messages")
+    token_usage = db.relationship("UsageTokens", back_populates="chat_message")
+
+
+class ChatSummary(db.Model):
+    """Running summary of the messages of a session older than the history window."""
+
+    __tablename__ = "chat_summaries"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("chat_sessions.id"), nullable=False, unique=True
+    )
+    content = db.Column(db.Text, nullable=False)
+    # Newest message folded into the summary.
+    last_message_id = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=_utcnow, onupdate=_utcnow, nullable=False)
+
+    session = db.relationship("ChatSession", back_populates="summary")
 
 
 class UploadedDocument(db.Model):
@@ -105,6 +131,8 @@ class SyncedNote(db.Model):
 
 class UsageLog(db.Model):
     __tablename__ = "usage_log"
+    # Backs the per-user date range queries (dashboard, rollup rebuilds).
+    __table_args__ = (db.Index("ix_usage_log_user_id_created_at", "user_id", "created_at"),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
@@ -114,18 +142,325 @@ class UsageLog(db.Model):
     created_at = db.Column(db.DateTime, default=_utcnow, nullable=False, index=True)
 
     user = db.relationship("User", back_populates="usage_logs")
+    stages = db.relationship("UsageStage", back_populates="usage_log", cascade="all, delete-orphan")
+    token_usage = db.relationship(
+        "UsageTokens", back_populates="usage_log", cascade="all, delete-orphan"
+    )
+
+
+class UsageStage(db.Model):
+    """Milliseconds of one call: spent in a RAG pipeline stage (rewrite, embedding,
+    rerank...), or elapsed until a streaming milestone (time_to_sources, ttft)."""
+
+    __tablename__ = "usage_stages"
+
+    id = db.Column(db.Integer, primary_key=True)
+    usage_log_id = db.Column(db.Integer, db.ForeignKey("usage_log.id"), nullable=False, index=True)
+    stage = db.Column(db.String(32), nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
+
+    usage_log = db.relationship("UsageLog", back_populates="stages")
+
+
+class UsageTokens(db.Model):
+    """LLM tokens of one pipeline stage and model during a call, with their cost.
+
+    UsageLog.tokens_used holds the call's input + output total.
+    """
+
+    __tablename__ = "usage_tokens"
+
+    id = db.Column(db.Integer, primary_key=True)
+    usage_log_id = db.Column(db.Integer, db.ForeignKey("usage_log.id"), nullable=False, index=True)
+    # The assistant answer the tokens were spent on.
+    chat_message_id = db.Column(db.Integer, db.ForeignKey("chat_messages.id"), index=True)
+    stage = db.Column(db.String(32), nullable=False)  # rewrite | generation | other
+    model = db.Column(db.String(128), nullable=False)
+    input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    output_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cache_read_input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cache_creation_input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float)  # None for a model without a known price
+
+    usage_log = db.relationship("UsageLog", back_populates="token_usage")
+    chat_message = db.relationship("ChatMessage", back_populates="token_usage")
+
+
+class UsageDaily(db.Model):
+    """Daily rollup of a user's UsageLog rows (UTC days), read by the dashboard.
+
+    Maintained by record_usage(); rebuild_usage_rollups() recomputes it.
+    """
+
+    __tablename__ = "usage_daily"
+    __table_args__ = (db.UniqueConstraint("user_id", "day", name="uq_usage_daily_user_day"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms_sum = db.Column(db.Float, nullable=False, default=0.0)
+    tokens_used = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UsageTokensDaily(db.Model):
+    """Daily rollup of a user's UsageTokens rows, per stage and model."""
+
+    __tablename__ = "usage_tokens_daily"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "day", "stage", "model", name="uq_usage_tokens_daily_user_day_stage_model"
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    stage = db.Column(db.String(32), nullable=False)
+    model = db.Column(db.String(128), nullable=False)
+    input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    output_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cache_read_input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cache_creation_input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+
+
+TOKEN_COLUMNS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_input_tokens",
+)
+
+
+def _bump(model, key: dict, amounts: dict) -> None:
+    """Add amounts to the rollup row of key, creating it if needed.
+
+    The increment runs in SQL, so concurrent workers do not lose updates.
+    """
+    table = model.__table__
+    where = [table.c[column] == value for column, value in key.items()]
+    increment = (
+        update(table)
+        .where(*where)
+        .values({column: table.c[column] + amount for column, amount in amounts.items()})
+    )
+    if db.session.execute(increment).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(table).values(**key, **amounts))
+    except IntegrityError:  # another worker created the row meanwhile
+        db.session.execute(increment)
+
+
+def _add_amounts(totals: dict, key: tuple, amounts: dict) -> None:
+    bucket = totals.setdefault(key, dict.fromkeys(amounts, 0))
+    for column, amount in amounts.items():
+        bucket[column] += amount
+
+
+def record_usage(*entries: UsageLog) -> None:
+    """Add usage log rows and fold them into the daily rollups, in the caller's transaction.
+
+    Rows of a batch sharing a rollup key are summed first: one increment per key.
+    """
+    daily: dict[tuple, dict] = {}
+    tokens: dict[tuple, dict] = {}
+    for entry in entries:
+        entry.created_at = entry.created_at or _utcnow()
+        db.session.add(entry)
+        day = entry.created_at.date()
+        _add_amounts(
+            daily,
+            (entry.user_id, day),
+            {"calls": 1, "latency_ms_sum": entry.latency_ms, "tokens_used": entry.tokens_used or 0},
+        )
+        for row in entry.token_usage:
+            _add_amounts(
+                tokens,
+                (entry.user_id, day, row.stage, row.model),
+                {
+                    **{column: getattr(row, column) or 0 for column in TOKEN_COLUMNS},
+                    "cost_usd": row.cost_usd or 0.0,
+                },
+            )
+
+    for (user_id, day), amounts in daily.items():
+        _bump(UsageDaily, {"user_id": user_id, "day": day}, amounts)
+    for (user_id, day, stage, model), amounts in tokens.items():
+        _bump(
+            UsageTokensDaily,
+            {"user_id": user_id, "day": day, "stage": stage, "model": model},
+            amounts,
+        )
+
+
+def rebuild_usage_rollups(since: date | None = None) -> int:
+    """Recompute the daily rollups from the raw usage tables (backfill, repair).
+
+    Rollup rows from since (every day when None) are replaced; returns the
+    number of usage_daily rows written. Runs in the caller's transaction.
+    """
+    day = func.date(UsageLog.created_at)
+    for model in (UsageDaily, UsageTokensDaily):
+        purge = delete(model)
+        if since:
+            purge = purge.where(model.day >= since)
+        db.session.execute(purge)
+
+    daily = select(
+        UsageLog.user_id,
+        day,
+        func.count(UsageLog.id),
+        func.sum(UsageLog.latency_ms),
+        func.coalesce(func.sum(UsageLog.tokens_used), 0),
+    ).group_by(UsageLog.user_id, day)
+    tokens = (
+        select(
+            UsageLog.user_id,
+            day,
+            UsageTokens.stage,
+            UsageTokens.model,
+            *(func.sum(getattr(UsageTokens, column)) for column in TOKEN_COLUMNS),
+            func.coalesce(func.sum(UsageTokens.cost_usd), 0.0),
+        )
+        .join(UsageLog)
+        .group_by(UsageLog.user_id, day, UsageTokens.stage, UsageTokens.model)
+    )
+    if since:
+        daily = daily.where(UsageLog.created_at >= since)
+        tokens = tokens.where(UsageLog.created_at >= since)
+
+    written = db.session.execute(
+        insert(UsageDaily).from_select(
+            ["user_id", "day", "calls", "latency_ms_sum", "tokens_used"], daily
+        )
+    ).rowcount
+    db.session.execute(
+        insert(UsageTokensDaily).from_select(
+            ["user_id", "day", "stage", "model", *TOKEN_COLUMNS, "cost_usd"], tokens
+        )
+    )
+    return written
 
 
 def calculate_usage_summary(user_id: int | None = None):
     query = db.session.query(
-        func.count(UsageLog.id).label("total_calls"),
-        func.avg(UsageLog.latency_ms).label("average_latency"),
+        func.sum(UsageDaily.calls).label("total_calls"),
+        func.sum(UsageDaily.latency_ms_sum).label("latency_sum"),
     )
     if user_id:
-        query = query.filter(UsageLog.user_id == user_id)
+        query = query.filter(UsageDaily.user_id == user_id)
 
     row = query.one()
     return {
         "total_calls": row.total_calls or 0,
-        "average_latency_ms": float(row.average_latency or 0),
+        "average_latency_ms": float(row.latency_sum / row.total_calls if row.total_calls else 0),
     }
+
+
+def daily_calls(user_id: int, since: date) -> dict[str, int]:
+    """Calls per UTC day ("YYYY-MM-DD") from since on, days without calls omitted."""
+    rows = (
+        db.session.query(UsageDaily.day, UsageDaily.calls)
+        .filter(UsageDaily.user_id == user_id, UsageDaily.day >= since)
+        .order_by(UsageDaily.day.desc())
+        .all()
+    )
+    return {row.day.isoformat(): row.calls for row in rows}
+
+
+def ensure_indexes() -> None:
+    """Create indexes missing from existing tables; create_all() only adds new tables.
+
+    Also backfills the daily rollups when usage rows predate them (a database
+    from before the rollup tables), so the dashboard totals are complete.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    if _rollups_behind():
+        try:
+            rebuild_usage_rollups()
+            db.session.commit()
+        except IntegrityError:  # another worker backfilled them meanwhile
+            db.session.rollback()
+
+
+def _rollups_behind() -> bool:
+    """Whether some UsageLog rows are older than the oldest daily rollup (or none exist)."""
+    oldest_log = db.session.query(func.min(UsageLog.created_at)).scalar()
+    if oldest_log is None:
+        return False
+    oldest_day = db.session.query(func.min(UsageDaily.day)).scalar()
+    return oldest_day is None or oldest_log.date() < oldest_day
+
+
+def _empty_tokens() -> dict:
+    return {**dict.fromkeys(TOKEN_COLUMNS, 0), "cost_usd": 0.0}
+
+
+def _token_totals(rows, key: str | None = None) -> dict:
+    """Sum aggregated usage_tokens rows, grouped by the key column (or all together)."""
+    totals: dict = {}
+    for row in rows:
+        bucket = totals.setdefault(getattr(row, key) if key else "all", _empty_tokens())
+        for column in TOKEN_COLUMNS:
+            bucket[column] += getattr(row, column) or 0
+        bucket["cost_usd"] = round(bucket["cost_usd"] + (row.cost_usd or 0.0), 6)
+    return totals
+
+
+def calculate_token_summary(user_id: int | None = None, since: date | None = None) -> dict:
+    """LLM tokens and estimated cost (USD), in total and by model and stage."""
+    query = db.session.query(
+        UsageTokensDaily.stage,
+        UsageTokensDaily.model,
+        *(func.sum(getattr(UsageTokensDaily, column)).label(column) for column in TOKEN_COLUMNS),
+        func.sum(UsageTokensDaily.cost_usd).label("cost_usd"),
+    )
+    if user_id:
+        query = query.filter(UsageTokensDaily.user_id == user_id)
+    if since:
+        query = query.filter(UsageTokensDaily.day >= since)
+    rows = query.group_by(UsageTokensDaily.stage, UsageTokensDaily.model).all()
+
+    totals = _token_totals(rows).get("all", _empty_tokens())
+    return {
+        **totals,
+        "by_model": _token_totals(rows, "model"),
+        "by_stage": _token_totals(rows, "stage"),
+    }
+
+
+def cost_by_user(since: datetime | None = None, limit: int = 20) -> list[dict]:
+    """Users with the highest estimated LLM cost, most expensive first."""
+    cost = func.sum(UsageTokens.cost_usd)
+    query = (
+        db.session.query(
+            User.email,
+            func.count(func.distinct(UsageLog.id)).label("calls"),
+            func.sum(UsageTokens.input_tokens).label("input_tokens"),
+            func.sum(UsageTokens.output_tokens).label("output_tokens"),
+            func.sum(UsageTokens.cache_read_input_tokens).label("cache_read_input_tokens"),
+            cost.label("cost_usd"),
+        )
+        .select_from(UsageTokens)
+        .join(UsageLog)
+        .join(User)
+    )
+    if since:
+        query = query.filter(UsageLog.created_at >= since)
+    rows = query.group_by(User.id).order_by(cost.desc(), User.email).limit(limit).all()
+    return [
+        {
+            "email": row.email,
+            "calls": row.calls,
+            "input_tokens": row.input_tokens or 0,
+            "output_tokens": row.output_tokens or 0,
+            "cache_read_input_tokens": row.cache_read_input_tokens or 0,
+            "cost_usd": round(row.cost_usd or 0.0, 6),
+        }
+        for row in rows
+    ]
@@ -1,16 +1,47 @@
+import hashlib
 import os
+import threading
+import time
 
 from dotenv import find_dotenv, load_dotenv
-from langchain.chat_models import init_chat_model
 from pydantic import BaseModel, Field
 
-from .prompts import ANSWER_PROMPT
+from .prompts import ANSWER_CONTEXT_PROMPT, ANSWER_QUESTION_PROMPT, ANSWER_SYSTEM_PROMPT
 
 load_dotenv(find_dotenv())
 
 # The answering model is the quality-sensitive step; make it configurable.
 DEFAULT_MODEL = os.getenv("ANSWER_MODEL", "claude-sonnet-4-6")
 
+# Anthropic prompt caching bills a cache write at 1.25x the input rate and a
+# read at 0.1x, and ignores prefixes shorter than the model's minimum. The
+# breakpoint goes after the retrieved context, and only when that prefix is
+# long enough and was already sent within the cache lifetime, as when a
+# follow-up turn is answered from the same passages. A one-off context is sent
+# without it, at the plain input rate.
+CACHE_CONTROL = {"type": "ephemeral"}
+CACHE_TTL_S = 300
+CACHE_MIN_TOKENS = 1024
+CACHE_MIN_TOKENS_BY_FAMILY = {"haiku": 2048}
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count estimate; ~4 characters per token slightly undercounts Claude's tokenizer."""
+    return len(text) // 4
+
+
+def cache_min_tokens(model_name: str) -> int:
+    """The provider's minimum cacheable prefix for a model."""
+    for family, minimum in CACHE_MIN_TOKENS_BY_FAMILY.items():
+        if family in model_name:
+            return minimum
+    return CACHE_MIN_TOKENS
+
+
+def _context_block(chunks: list[str]) -> str:
+    numbered_context = "\n\n".join(f"(chunk {i + 1}) {c}" for i, c in enumerate(chunks))
+    return ANSWER_CONTEXT_PROMPT.format(context=numbered_context)
+
 
 class AnswerOutput(BaseModel):
     answer: str = Field(description="Final natural language answer based on context")
@@ -18,29 +49,73 @@ class AnswerOutput(BaseModel):
 
 class AnswerGenerator:
     def __init__(self, model_name: str = DEFAULT_MODEL, temperature: float = 0.2):
+        from langchain.chat_models import init_chat_model
+
         self.llm = init_chat_model(model_name, model_provider="anthropic", temperature=temperature)
+        self.cache_min_tokens = cache_min_tokens(model_name)
+        self._sent: dict[str, float] = {}
+        self._sent_lock = threading.Lock()
+
+    def _reused_prefix(self, chunks: list[str]) -> bool:
+        """Whether this context is long enough to cache and was sent within CACHE_TTL_S."""
+        context = _context_block(chunks)
+        if estimate_tokens(ANSWER_SYSTEM_PROMPT + context) < self.cache_min_tokens:
+            return False
+        key = hashlib.sha1(context.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._sent_lock:
+            self._sent = {k: t for k, t in self._sent.items() if now - t < CACHE_TTL_S}
+            reused = key in self._sent
+            self._sent[key] = now
+        return reused
 
     @staticmethod
-    def _prompt(question: str, chunks: list[str]) -> str:
-        numbered_context = "\n\n".join(f"(chunk {i + 1}) {c}" for i, c in enumerate(chunks))
-        return ANSWER_PROMPT.format(question=question, context=numbered_context)
+    def _messages(question: str, chunks: list[str], cache: bool = False) -> list[dict]:
+        """Stable system block, then the retrieved context, then the question.
+
+        With cache=True the context carries the cache breakpoint, so the
+        provider caches everything up to and including it.
+        """
+        context = {"type": "text", "text": _context_block(chunks)}
+        if cache:
+            context["cache_control"] = CACHE_CONTROL
+        return [
+            {"role": "system", "content": [{"type": "text", "text": ANSWER_SYSTEM_PROMPT}]},
+            {
+                "role": "user",
+                "content": [
+                    context,
+                    {"type": "text", "text": ANSWER_QUESTION_PROMPT.format(question=question)},
+                ],
+            },
+        ]
+
+    def _request(self, question: str, chunks: list[str]) -> list[dict]:
+        return self._messages(question, chunks, cache=self._reused_prefix(chunks))
 
     def generate(self, question: str, chunks: list[str]) -> str:
         response = self.llm.with_structured_output(AnswerOutput).invoke(
-            [{"role": "user", "content": self._prompt(question, chunks)}]
+            self._request(question, chunks)
         )
         return response.answer
 
+    @staticmethod
+    def _text(message_chunk) -> str:
+        content = message_chunk.content
+        if isinstance(content, list):
+            content = "".join(
+                part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+            )
+        return content
+
     def generate_stream(self, question: str, chunks: list[str]):
         """Yield the answer as text deltas (no structured output when streaming)."""
-        for message_chunk in self.llm.stream(
-            [{"role": "user", "content": self._prompt(question, chunks)}]
-        ):
-            content = message_chunk.content
-            if isinstance(content, list):
-                content = "".join(
-                    part.get("text", "") if isinstance(part, dict) else str(part)
-                    for part in content
-                )
-            if content:
+        for message_chunk in self.llm.stream(self._request(question, chunks)):
+            if content := self._text(message_chunk):
+                yield content
+
+    async def agenerate_stream(self, question: str, chunks: list[str]):
+        """Async generate_stream(), on the LLM client's async stream."""
+        async for message_chunk in self.llm.astream(self._request(question, chunks)):
+            if content := self._text(message_chunk):
                 yield content
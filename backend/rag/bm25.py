@@ -1,8 +1,11 @@
 import re
 from dataclasses import dataclass
 
+import numpy as np
 from rank_bm25 import BM25Okapi
 
+from .filters import FilterPostings, MetadataFilter
+
 _TOKEN_RE = re.compile(r"\w+", re.UNICODE)
 
 
@@ -13,35 +16,41 @@ def tokenize(text: str) -> list[str]:
 @dataclass
 class BM25Hit:
     chunk_id: str
-    content: str
-    metadata: dict
     rank: int  # 1-based
+    score: float
 
 
 class UserBM25Index:
-    """BM25 index over one user's chunks (mirrors the Chroma user filter)."""
+    """BM25 index over one user's chunks (mirrors the Chroma user filter).
+
+    Only the ids, term statistics and filter postings are kept: hits are
+    hydrated from the chunk store like dense ones.
+    """
 
-    def __init__(self, ids: list[str], contents: list[str], metadatas: list[dict]):
+    def __init__(self, ids: list[str], contents: list[str], metadatas: list[dict] | None = None):
         self.ids = ids
-        self.contents = contents
-        self.metadatas = metadatas
         self._bm25 = BM25Okapi([tokenize(text) for text in contents]) if contents else None
+        self.postings = FilterPostings(metadatas or [{} for _ in ids])
 
-    def search(self, query: str, k: int) -> list[BM25Hit]:
+    def search(self, query: str, k: int, filters: MetadataFilter | None = None) -> list[BM25Hit]:
+        """The k best chunks; with filters, only the chunks in scope are scored."""
         if self._bm25 is None:
             return []
-        scores = self._bm25.get_scores(tokenize(query))
-        order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        if filters is None:
+            rows = np.arange(len(self.ids))
+            scores = np.asarray(self._bm25.get_scores(tokenize(query)))
+        else:
+            # IDF stays that of all the user's chunks: scores match unscoped ones.
+            rows = self.postings.rows(filters)
+            scores = np.asarray(self._bm25.get_batch_scores(tokenize(query), rows.tolist()))
+        order = np.argsort(-scores, kind="stable")
         hits: list[BM25Hit] = []
         for index in order[:k]:
             if scores[index] <= 0:
                 break  # no lexical overlap at all: not a match
             hits.append(
                 BM25Hit(
-                    chunk_id=self.ids[index],
-                    content=self.contents[index],
-                    metadata=self.metadatas[index] or {},
-                    rank=len(hits) + 1,
+                    chunk_id=self.ids[rows[index]], rank=len(hits) + 1, score=float(scores[index])
                 )
             )
         return hits
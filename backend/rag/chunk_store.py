@@ -0,0 +1,194 @@
+"""Chunk texts and metadata keyed by chunk id, outside the search indexes.
+
+Dense search (Chroma or exact), BM25 and fusion only handle chunk ids and
+scores; the text and metadata of a chunk are read here once it makes the
+final cut (the rerank pool, or the top k without reranking). So a query reads
+a few dozen rows instead of every candidate's document from Chroma, and the
+per-user BM25 and exact indexes no longer keep their own copy of every text.
+
+One SQLite file next to the vector store, shared by every worker (WAL):
+
+- chunks: id, user_id, zlib-compressed text, and the id of its metadata;
+- metadata: each distinct metadata dict once, as canonical JSON. The chunks
+  of a note section share theirs (source, title, heading path, user_id);
+- parents: with small-to-big chunking, the section text the children whose
+  metadata hold its parent_id expand to. It goes with their metadata row.
+
+Chroma keeps its copy of the texts: index rebuilds and partition migrations
+read from it, and chunks ingested before this store existed are copied over
+the first time they are hydrated.
+"""
+
+import json
+import sqlite3
+import zlib
+from collections.abc import Iterable
+from pathlib import Path
+from threading import Lock
+
+CHUNK_STORE_FILENAME = "chunks.sqlite3"
+BUSY_TIMEOUT_MS = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    id INTEGER PRIMARY KEY,
+    json TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    content BLOB NOT NULL,
+    metadata_id INTEGER NOT NULL REFERENCES metadata (id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunks_metadata_id ON chunks (metadata_id);
+CREATE TABLE IF NOT EXISTS parents (
+    id TEXT PRIMARY KEY,
+    content BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+# SQLite's default limit on bound parameters is 999 before 3.32.
+_BATCH_SIZE = 500
+
+
+class ChunkStore:
+    """Texts and metadata of the chunks of every user, by chunk id."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = Lock()
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per pipeline, opened on first use and serialized by
+        # the lock: lookups are a few primary-key reads.
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def add(
+        self, chunks: Iterable[tuple[str, str, dict]], parents: dict[str, str] | None = None
+    ) -> None:
+        """Insert or replace (chunk_id, text, metadata) rows; metadata carries user_id.
+
+        `parents` maps the parent_id of the chunks' metadata to its section text.
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO parents (id, content) VALUES (?, ?)",
+                    [
+                        (parent_id, zlib.compress(text.encode("utf-8")))
+                        for parent_id, text in (parents or {}).items()
+                    ],
+                )
+                metadata_ids: dict[str, int] = {}
+                rows = []
+                for chunk_id, content, metadata in chunks:
+                    encoded = json.dumps(metadata, sort_keys=True, separators=(",", ":"))
+                    if encoded not in metadata_ids:
+                        connection.execute(
+                            "INSERT OR IGNORE INTO metadata (json) VALUES (?)", (encoded,)
+                        )
+                        metadata_ids[encoded] = connection.execute(
+                            "SELECT id FROM metadata WHERE json = ?", (encoded,)
+                        ).fetchone()[0]
+                    rows.append(
+                        (
+                            chunk_id,
+                            metadata["user_id"],
+                            zlib.compress(content.encode("utf-8")),
+                            metadata_ids[encoded],
+                        )
+                    )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, user_id, content, metadata_id)"
+                    " VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+
+    def get(self, chunk_ids: list[str]) -> dict[str, tuple[str, dict]]:
+        """(text, metadata) of the chunks found; missing ids are left out."""
+        found: dict[str, tuple[str, dict]] = {}
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(chunk_ids), _BATCH_SIZE):
+                batch = chunk_ids[start : start + _BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                for chunk_id, content, metadata in connection.execute(
+                    "SELECT chunks.id, chunks.content, metadata.json FROM chunks"
+                    " JOIN metadata ON metadata.id = chunks.metadata_id"
+                    f" WHERE chunks.id IN ({placeholders})",
+                    batch,
+                ):
+                    found[chunk_id] = (
+                        zlib.decompress(content).decode("utf-8"),
+                        json.loads(metadata),
+                    )
+        return found
+
+    def parents(self, parent_ids: list[str]) -> dict[str, str]:
+        """Section text of the parents found; missing ids are left out."""
+        found: dict[str, str] = {}
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(parent_ids), _BATCH_SIZE):
+                batch = parent_ids[start : start + _BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                for parent_id, content in connection.execute(
+                    f"SELECT id, content FROM parents WHERE id IN ({placeholders})", batch
+                ):
+                    found[parent_id] = zlib.decompress(content).decode("utf-8")
+        return found
+
+    def delete(self, chunk_ids: list[str]) -> None:
+        """Remove chunks, and the metadata (and parent) no remaining chunk refers to."""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                for start in range(0, len(chunk_ids), _BATCH_SIZE):
+                    batch = chunk_ids[start : start + _BATCH_SIZE]
+                    placeholders = ", ".join("?" * len(batch))
+                    metadata_ids = [
+                        row[0]
+                        for row in connection.execute(
+                            f"SELECT DISTINCT metadata_id FROM chunks WHERE id IN ({placeholders})",
+                            batch,
+                        )
+                    ]
+                    connection.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+                    for metadata_id in metadata_ids:
+                        orphan = connection.execute(
+                            "SELECT json FROM metadata WHERE id = ? AND NOT EXISTS"
+                            " (SELECT 1 FROM chunks WHERE metadata_id = metadata.id)",
+                            (metadata_id,),
+                        ).fetchone()
+                        if orphan is None:
+                            continue
+                        connection.execute("DELETE FROM metadata WHERE id = ?", (metadata_id,))
+                        parent_id = json.loads(orphan[0]).get("parent_id")
+                        if parent_id is not None:
+                            connection.execute("DELETE FROM parents WHERE id = ?", (parent_id,))
+
+    def stats(self) -> dict[str, int]:
+        """Row counts and stored (compressed) text bytes."""
+        with self._lock:
+            connection = self._connect()
+            chunks, text_bytes = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM chunks"
+            ).fetchone()
+            (metadata,) = connection.execute("SELECT COUNT(*) FROM metadata").fetchone()
+            (parents,) = connection.execute("SELECT COUNT(*) FROM parents").fetchone()
+        return {
+            "chunks": chunks,
+            "metadata": metadata,
+            "parents": parents,
+            "text_bytes": text_bytes,
+        }
@@ -0,0 +1,121 @@
+import threading
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer. Not reentrant.
+
+    A waiting writer blocks new readers, so a steady stream of queries cannot
+    starve an ingestion.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class KeyedReadWriteLocks:
+    """One ReadWriteLock per key (user id), created on first use.
+
+    Several keys are always locked in sorted order, so two multi-user calls
+    cannot deadlock each other.
+    """
+
+    def __init__(self):
+        self._locks: dict[Hashable, ReadWriteLock] = {}
+        self._mutex = threading.Lock()
+
+    def get(self, key: Hashable) -> ReadWriteLock:
+        with self._mutex:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = ReadWriteLock()
+            return lock
+
+    @contextmanager
+    def _locked(self, keys: Iterable[Hashable], mode: str) -> Iterator[None]:
+        with ExitStack() as stack:
+            for key in sorted(set(keys)):
+                stack.enter_context(getattr(self.get(key), mode)())
+            yield
+
+    def read(self, keys: Iterable[Hashable]):
+        return self._locked(keys, "read")
+
+    def write(self, keys: Iterable[Hashable]):
+        return self._locked(keys, "write")
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls: one caller per key runs, the others share its result."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, Future] = {}
+        self._mutex = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], object]):
+        with self._mutex:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._mutex:
+                del self._calls[key]
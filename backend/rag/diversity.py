@@ -0,0 +1,65 @@
+"""Diversity-aware final selection, after fusion and reranking.
+
+Neighbouring chunks of a note share their overlap, and the sub-splits of a
+section are near-duplicates: by score alone the final k often holds several
+of them, which spends prompt tokens on the same passage and leaves fewer
+distinct notes. Two selections replace the plain top k:
+
+- "mmr": maximal marginal relevance over the chunks' embeddings, picking
+  each time the candidate maximizing
+  lambda * relevance - (1 - lambda) * max cosine to the chunks already picked;
+- "note_cap": the top k by score with at most max_per_note chunks per note.
+"""
+
+import numpy as np
+
+
+def note_key(metadata: dict) -> str:
+    """The note a chunk belongs to, as the retrieval eval counts notes."""
+    return str(metadata.get("note_path") or metadata.get("source") or "")
+
+
+def mmr_select(relevance, embeddings, k: int, lambda_: float) -> list[int]:
+    """Indexes of the k candidates picked by MMR, in selection order.
+
+    `relevance` is rescaled to [0, 1] over the pool so that it weighs like a
+    cosine whatever the scorer (RRF, dense relevance, rerank); `embeddings`
+    are L2-normalized rows, one per candidate.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(count)
+    similarity = embeddings @ embeddings.T
+    # Highest cosine of each candidate to the selection so far.
+    redundancy = np.full(count, -np.inf, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    selected: list[int] = []
+    for _ in range(min(k, count)):
+        penalty = np.where(np.isinf(redundancy), 0.0, redundancy)
+        gain = lambda_ * relevance - (1 - lambda_) * penalty
+        best = int(np.argmax(np.where(available, gain, -np.inf)))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def cap_per_note(candidates: list[dict], k: int, max_per_note: int) -> list[dict]:
+    """The first k candidates, skipping those of a note that already has max_per_note.
+
+    Fewer than k remain when the pool runs out of notes.
+    """
+    counts: dict[str, int] = {}
+    selected = []
+    for candidate in candidates:
+        note = note_key(candidate["metadata"])
+        if counts.get(note, 0) >= max_per_note:
+            continue
+        counts[note] = counts.get(note, 0) + 1
+        selected.append(candidate)
+        if len(selected) == k:
+            break
+    return selected
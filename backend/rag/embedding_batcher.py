@@ -0,0 +1,88 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """Coalesces concurrent embed_query() calls into shared forward passes.
+
+    Every query is queued with its own future; a background thread takes the
+    first waiting query, lets others join for up to window_ms (or until
+    max_batch queries), embeds them with one embed_documents() call on the
+    wrapped model and resolves each caller's future. A single caller pays at
+    most window_ms extra; N concurrent callers share one pass instead of N.
+
+    embed_documents() is already a batch: it goes straight to the wrapped
+    model, so an upload's thousands of chunks never queue ahead of a query.
+    """
+
+    def __init__(self, inner: Embeddings, *, window_ms: float = 5.0, max_batch: int = 32):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.inner = inner
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._worker_pid: int | None = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork(): a wrapper created in a preloading
+        # gunicorn master starts a fresh queue and worker in each child.
+        if self._worker_pid != os.getpid():
+            with self._start_lock:
+                if self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._worker_pid = os.getpid()
+                    self._worker = threading.Thread(
+                        target=self._run, name="rag-embed-batcher", daemon=True
+                    )
+                    self._worker.start()
+
+    def _next_batch(self) -> list[tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # Texts already queued join even once the window has elapsed.
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                # embed_documents() and embed_query() encode identically unless
+                # query instructions are configured, which this app never sets.
+                vectors = self.inner.embed_documents([text for text, _ in batch])
+            except Exception as err:  # noqa: BLE001 - re-raised in every caller
+                for _, future in batch:
+                    future.set_exception(err)
+                continue
+            for (_, future), vector in zip(batch, vectors, strict=True):
+                future.set_result(vector)
+
+    def _submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.inner.embed_documents(list(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._submit(text).result()
@@ -0,0 +1,421 @@
+"""Exact dense search over one user's embeddings, kept next to the Chroma store.
+
+For a corpus of a few thousand chunks, a dot product against a contiguous
+float32 matrix is faster than Chroma's filtered HNSW search followed by a
+SQLite read of the hits, and it is exact. Each user's index lives under
+<vector store>/exact-search:
+
+- {user_id}-{token}.npy: the L2-normalized embeddings, memory-mapped, so the
+  workers of a host share them through the page cache, with their quantized
+  codes next to them ({user_id}-{token}.binary.npy, .int8.npy, .int8-scale.npy);
+- {user_id}.json: the chunk ids of the rows, the tags, folder and date of
+  each row (the FilterPostings of scoped queries), the name of the matrix
+  and the generation it was built at; texts and metadata are hydrated from
+  the chunk store;
+- {user_id}.generation: a token renewed by every write;
+- {user_id}.lock: held by a process while it checks the generation and
+  replaces the files, so two processes never interleave those steps.
+
+A scoped query only scores the rows its filter selects.
+
+With a quantization, the first pass scans the codes instead of the matrix:
+sign bits compared by Hamming distance (32x smaller than float32) or int8
+values (4x smaller). Only the best k * oversample rows are then read from
+the float32 matrix and rescored exactly.
+
+Ingestion and deletion update the saved index in place (update()): the rows
+of the deleted or re-ingested chunks are dropped, the new chunks appended,
+and the files rewritten under a new generation, with no read of the user's
+other chunks from Chroma. Without a saved index there is nothing to update:
+the generation is renewed and the next query builds one from Chroma.
+Readers check the JSON file's identity on every access, so a write by
+another worker is picked up without any signal. A rebuild records the
+generation it read before its Chroma reads: if another process wrote the
+user meanwhile, the rebuild is not saved, and a sidecar of an older
+generation counts as missing.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import uuid
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from .filters import FilterPostings, filter_fields
+
+INDEX_DIRNAME = "exact-search"
+QUANTIZATIONS = ("none", "binary", "int8")
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Contiguous float32 copy with unit-norm rows (zero rows stay zero)."""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def binary_codes(matrix: np.ndarray) -> np.ndarray:
+    """Sign bits of each row, packed into uint64 words (zero-padded)."""
+    bits = np.packbits(matrix > 0, axis=1)
+    padding = -bits.shape[1] % 8
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+
+def int8_codes(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Per-dimension scalar quantization: (int8 codes, float32 scale).
+
+    Each dimension's [min, max] over the user's vectors maps to [-128, 127],
+    so a row is about min + (codes + 128) * scale. Every term but
+    codes @ (scale * query) is the same for all rows, and ranking needs no more.
+    """
+    low = matrix.min(axis=0)
+    scale = (matrix.max(axis=0) - low) / 255
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.round((matrix - low) / scale) - 128, -128, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+@dataclass
+class ExactIndex:
+    """One user's chunks; `matrix` is None when they were too many to load."""
+
+    size: int
+    ids: list[str] = field(default_factory=list)
+    matrix: np.ndarray | None = None
+    binary: np.ndarray | None = None
+    int8: np.ndarray | None = None
+    int8_scale: np.ndarray | None = None
+    postings: FilterPostings | None = None
+    _rows: dict[str, int] | None = field(default=None, init=False, repr=False)
+
+    def embeddings(self, chunk_ids: list[str]) -> np.ndarray | None:
+        """Normalized embeddings of these chunks; None if one is not in the index."""
+        if self.matrix is None:
+            return None
+        if self._rows is None:
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        rows = [self._rows.get(chunk_id) for chunk_id in chunk_ids]
+        if None in rows:
+            return None
+        return np.asarray(self.matrix[rows])
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        k: int,
+        quantization: str = "none",
+        oversample: int = 10,
+        rows: np.ndarray | None = None,
+    ) -> list[tuple[int, float]]:
+        """(row, cosine similarity) of the k nearest chunks, best first.
+
+        `rows` (ascending) restricts the search to those rows, e.g. a filter's.
+        With a quantization, only the k * oversample best rows of the first
+        pass are rescored, so a true neighbour ranked lower by the codes is missed.
+        """
+        if self.matrix is None or not self.size or k <= 0:
+            return []
+        if rows is not None and not len(rows):
+            return []
+        query = normalize_rows(query_vector)[0]
+        count = self.size if rows is None else len(rows)
+        pool = min(count, k * oversample)
+        if quantization == "none" or pool == count:
+            if rows is None:
+                rows = np.arange(self.size)
+                scores = np.asarray(self.matrix @ query)
+            else:
+                scores = np.asarray(self.matrix[rows] @ query)
+        else:
+            first = self._first_pass(query, quantization, rows)
+            # Sorted: the rescoring reads the mapped matrix front to back.
+            best = np.sort(np.argpartition(first, -pool)[-pool:])
+            rows = best if rows is None else rows[best]
+            scores = np.asarray(self.matrix[rows] @ query)
+        top = np.argpartition(scores, -k)[-k:] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _first_pass(
+        self, query: np.ndarray, quantization: str, rows: np.ndarray | None = None
+    ) -> np.ndarray:
+        """Approximate scores of every row (or of `rows`), higher is closer."""
+        if quantization == "binary":
+            codes = self.binary if rows is None else self.binary[rows]
+            distances = np.bitwise_count(codes ^ binary_codes(query[None])[0])
+            return -distances.sum(axis=1, dtype=np.int32)
+        if quantization == "int8":
+            codes = self.int8 if rows is None else self.int8[rows]
+            return codes.astype(np.float32) @ (self.int8_scale * query)
+        raise ValueError(f"quantization must be one of {QUANTIZATIONS}")
+
+    def scanned_bytes(self, quantization: str = "none") -> int:
+        """Bytes the first pass reads for every query (the whole float matrix without one)."""
+        if self.matrix is None:
+            return 0
+        if quantization == "binary":
+            return self.binary.nbytes
+        if quantization == "int8":
+            return self.int8.nbytes + self.int8_scale.nbytes
+        return self.matrix.nbytes
+
+
+class ExactIndexStore:
+    """Per-user ExactIndex files, cached per process until they change on disk."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self._cache: dict[int, tuple[tuple[int, int], ExactIndex]] = {}
+
+    def _sidecar(self, user_id: int) -> Path:
+        return self.directory / f"{user_id}.json"
+
+    def _generation_file(self, user_id: int) -> Path:
+        return self.directory / f"{user_id}.generation"
+
+    @contextlib.contextmanager
+    def _locked(self, user_id: int) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / f"{user_id}.lock", os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def generation(self, user_id: int) -> str:
+        """The user's current generation; a rebuild reads it before reading Chroma."""
+        try:
+            return self._generation_file(user_id).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return ""
+
+    def load(self, user_id: int) -> ExactIndex | None:
+        """The user's index as last saved; None when it must be (re)built."""
+        index, stale = self._load(user_id)
+        if stale:
+            # Another process may be between its sidecar and generation writes.
+            with self._locked(user_id):
+                index, _ = self._load(user_id)
+        return index
+
+    def _load(self, user_id: int) -> tuple[ExactIndex | None, bool]:
+        """(index, whether a sidecar exists but not of the current generation)."""
+        sidecar = self._sidecar(user_id)
+        try:
+            stat = sidecar.stat()
+        except FileNotFoundError:
+            self._cache.pop(user_id, None)
+            return None, False
+        generation = self.generation(user_id)
+        version = (stat.st_ino, stat.st_mtime_ns, generation)
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == version:
+            return cached[1], False
+        try:
+            data = json.loads(sidecar.read_text(encoding="utf-8"))
+            arrays = {}
+            if data["matrix"] is not None:
+                arrays = {
+                    name: np.load(self.directory / filename, mmap_mode="r")
+                    for name, filename in _array_files(data["matrix"]).items()
+                }
+        except (FileNotFoundError, ValueError):
+            return None, False  # replaced while being read: rebuild
+        if "filters" not in data:
+            return None, False  # saved before scoped queries: rebuild
+        if data.get("generation") != generation:
+            return None, True
+        index = ExactIndex(
+            size=data["size"],
+            ids=data["ids"],
+            postings=FilterPostings(data["filters"]) if arrays else None,
+            **arrays,
+        )
+        self._cache[user_id] = (version, index)
+        return index, False
+
+    def save(
+        self,
+        user_id: int,
+        size: int,
+        ids: list[str] | None = None,
+        embeddings=None,
+        metadatas: list[dict] | None = None,
+        generation: str | None = None,
+    ) -> ExactIndex:
+        """Write a user's index; without embeddings, only its size is recorded.
+
+        `metadatas`, one per row, feed the index's filter postings.
+        `generation` is the one read before the index's data was; if the
+        user was written since, nothing is saved and the index is returned
+        from memory, for the caller's query only.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if generation is None:
+            generation = self.generation(user_id)
+        filters = [filter_fields(metadata or {}) for metadata in metadatas or []]
+        matrix = None
+        if embeddings is not None:
+            matrix = normalize_rows(embeddings) if size else np.empty((0, 0), np.float32)
+        matrix_name, arrays = self._write_arrays(user_id, matrix)
+        tmp = self._write_sidecar(user_id, size, ids or [], filters, matrix_name, generation)
+        with self._locked(user_id):
+            if self.generation(user_id) != generation:
+                tmp.unlink()
+                self._remove_arrays(matrix_name)
+                postings = FilterPostings(metadatas or []) if arrays else None
+                return ExactIndex(size=size, ids=ids or [], postings=postings, **arrays)
+            os.replace(tmp, self._sidecar(user_id))
+            self._remove_matrices(user_id, keep=matrix_name)
+        return self.load(user_id) or ExactIndex(size=size)
+
+    def update(
+        self,
+        user_id: int,
+        removed: Iterable[str] = (),
+        ids: Sequence[str] = (),
+        embeddings=None,
+        metadatas: list[dict] | None = None,
+        max_size: int | None = None,
+    ) -> None:
+        """Apply a write to the user's saved index instead of dropping it.
+
+        The rows of `removed` and of `ids` are dropped, then `ids` appended
+        with their embeddings and metadatas. Without a saved index of the
+        current generation with its embeddings, or past `max_size` rows, the
+        user is invalidated instead and the next query rebuilds from Chroma.
+        """
+        with self._locked(user_id):
+            generation = self.generation(user_id)
+            try:
+                data = json.loads(self._sidecar(user_id).read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                data = None
+            if (
+                data is None
+                or data.get("generation") != generation
+                or data["matrix"] is None
+                or "filters" not in data
+            ):
+                self._invalidate(user_id)
+                return
+            dropped = set(removed) | set(ids)
+            kept = [row for row, chunk_id in enumerate(data["ids"]) if chunk_id not in dropped]
+            size = len(kept) + len(ids)
+            if max_size is not None and size > max_size:
+                self._invalidate(user_id)
+                return
+            current = np.load(self.directory / data["matrix"], mmap_mode="r")
+            parts = [np.asarray(current[kept])] if current.size else []
+            if ids:
+                parts.append(normalize_rows(embeddings))
+            matrix = np.concatenate(parts) if size else np.empty((0, 0), np.float32)
+            filters = [data["filters"][row] for row in kept]
+            filters += [filter_fields(metadata or {}) for metadata in metadatas or [{}] * len(ids)]
+            new_ids = [data["ids"][row] for row in kept] + list(ids)
+
+            generation = uuid.uuid4().hex
+            matrix_name, _ = self._write_arrays(user_id, matrix)
+            tmp = self._write_sidecar(user_id, size, new_ids, filters, matrix_name, generation)
+            os.replace(tmp, self._sidecar(user_id))
+            self._write_generation(user_id, generation)
+            self._remove_matrices(user_id, keep=matrix_name)
+            self._cache.pop(user_id, None)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._locked(user_id):
+            self._invalidate(user_id)
+
+    def _invalidate(self, user_id: int) -> None:
+        # Renewed first: a rebuild running in another process then sees it
+        # changed before it may save.
+        self._write_generation(user_id, uuid.uuid4().hex)
+        with contextlib.suppress(FileNotFoundError):
+            self._sidecar(user_id).unlink()
+        self._remove_matrices(user_id)
+        self._cache.pop(user_id, None)
+
+    def _write_generation(self, user_id: int, generation: str) -> None:
+        tmp = self._generation_file(user_id).with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_text(generation, encoding="utf-8")
+        os.replace(tmp, self._generation_file(user_id))
+
+    def _write_arrays(
+        self, user_id: int, matrix: np.ndarray | None
+    ) -> tuple[str | None, dict[str, np.ndarray]]:
+        """Save a matrix and its codes under a new name; (None, {}) without one."""
+        if matrix is None:
+            return None, {}
+        int8, int8_scale = int8_codes(matrix) if len(matrix) else (matrix, matrix)
+        arrays = {
+            "matrix": matrix,
+            "binary": binary_codes(matrix),
+            "int8": int8,
+            "int8_scale": int8_scale,
+        }
+        matrix_name = f"{user_id}-{uuid.uuid4().hex}.npy"
+        for name, filename in _array_files(matrix_name).items():
+            np.save(self.directory / filename, arrays[name])
+        return matrix_name, arrays
+
+    def _write_sidecar(
+        self,
+        user_id: int,
+        size: int,
+        ids: list[str],
+        filters: list[dict],
+        matrix_name: str | None,
+        generation: str,
+    ) -> Path:
+        """The sidecar, written to a temporary path for the caller to move in place."""
+        tmp = self._sidecar(user_id).with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "size": size,
+                    "ids": ids,
+                    "filters": filters,
+                    "matrix": matrix_name,
+                    "generation": generation,
+                }
+            ),
+            encoding="utf-8",
+        )
+        return tmp
+
+    def _remove_arrays(self, matrix_name: str | None) -> None:
+        if matrix_name:
+            for filename in _array_files(matrix_name).values():
+                (self.directory / filename).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for sidecar in self.directory.glob("*.json"):
+            self.invalidate(int(sidecar.stem))
+
+    def _remove_matrices(self, user_id: int, keep: str | None = None) -> None:
+        # Processes that mapped a matrix keep reading it until they reload.
+        kept = set(_array_files(keep).values()) if keep else set()
+        for path in self.directory.glob(f"{user_id}-*.npy"):
+            if path.name not in kept:
+                with contextlib.suppress(FileNotFoundError):
+                    path.unlink()
+
+
+def _array_files(matrix_name: str) -> dict[str, str]:
+    stem = matrix_name.removesuffix(".npy")
+    return {
+        "matrix": matrix_name,
+        "binary": f"{stem}.binary.npy",
+        "int8": f"{stem}.int8.npy",
+        "int8_scale": f"{stem}.int8-scale.npy",
+    }
@@ -0,0 +1,195 @@
+"""Metadata filters applied inside the searches, not to their results.
+
+A question can be scoped to notes with some tags, to a folder, or to a
+modification date range. Filtering the top k afterwards would leave fewer
+than k hits, or none, whenever the scope is a small part of the notes; so
+each search only scores the chunks in scope:
+
+- BM25 and the exact dense index keep FilterPostings aligned with their
+  rows: the rows of each tag and folder, and the modification dates. A
+  filter becomes a row mask, and only the masked rows are scored;
+- Chroma gets a `where` clause built from the filter alone: each chunk is
+  stored with its tags and folder expanded to their parents, and its
+  modification time in seconds (scope_fields()), so a condition is one
+  `$contains` or a `$gte`/`$lte` bound, and Chroma's metadata index filters
+  on it before its vector search. Nothing is read from the store to build
+  the clause, so it cannot miss chunks another worker just ingested. An id
+  allowlist would be simpler but makes Chroma's query about 50 times slower.
+
+Tags and folders match their nested values: "dev" selects "dev/python",
+"Projets" selects "Projets/Client A". Several tags select the chunks with
+any of them; the date bounds are inclusive.
+"""
+
+import contextlib
+from dataclasses import asdict, dataclass
+from datetime import datetime, time
+
+import numpy as np
+
+# The only metadata the postings read, also kept by the exact index.
+FILTER_FIELDS = ("tags", "folder", "modified_at")
+
+# Derived from FILTER_FIELDS at ingestion and stored in Chroma only, for its
+# where clauses: every tag and folder with its parents, the date in seconds.
+SCOPE_FIELDS = ("tag_paths", "folder_paths", "modified_ts")
+
+
+def _parse_datetime(value: str, end_of_day: bool = False) -> np.datetime64:
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:  # a date alone: include the whole day
+        parsed = datetime.combine(parsed.date(), time.max)
+    return np.datetime64(parsed.replace(tzinfo=None), "s")
+
+
+def _timestamp(value: np.datetime64) -> int:
+    return int(value.astype("int64"))
+
+
+def _ancestors(path: str) -> list[str]:
+    """The path and its parents, shortest first: a/b/c -> a, a/b, a/b/c."""
+    parts = [part for part in path.strip("/").split("/") if part]
+    return ["/".join(parts[: i + 1]) for i in range(len(parts))]
+
+
+def chunk_tags(metadata: dict) -> list[str]:
+    """A chunk's tags; chunks stored before lists were kept have them comma-joined."""
+    value = metadata.get("tags")
+    if not value:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    return [str(item).strip().lstrip("#") for item in items if str(item).strip()]
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """Scope of a retrieval: any of `tags`, under `folder`, modified in a date range."""
+
+    tags: tuple[str, ...] = ()
+    folder: str | None = None
+    modified_after: str | None = None
+    modified_before: str | None = None
+
+    def __post_init__(self):
+        for bound in (self.modified_after, self.modified_before):
+            if bound is not None:
+                try:
+                    _parse_datetime(bound)
+                except ValueError as exc:
+                    raise ValueError(f"invalid date {bound!r}: expected ISO 8601") from exc
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "MetadataFilter | None":
+        """A filter from a request payload; None when it scopes nothing.
+
+        Raises ValueError on unknown keys or malformed values.
+        """
+        if not data:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError("filters must be an object")
+        unknown = set(data) - {"tags", "folder", "modified_after", "modified_before"}
+        if unknown:
+            raise ValueError(f"unknown filters: {', '.join(sorted(unknown))}")
+        tags = data.get("tags") or []
+        if isinstance(tags, str):
+            tags = [tags]
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            raise ValueError("tags must be a list of strings")
+        for key in ("folder", "modified_after", "modified_before"):
+            if data.get(key) is not None and not isinstance(data[key], str):
+                raise ValueError(f"{key} must be a string")
+        scope = cls(
+            tags=tuple(tag.strip().lstrip("#") for tag in tags if tag.strip()),
+            folder=(data.get("folder") or "").strip("/") or None,
+            modified_after=data.get("modified_after") or None,
+            modified_before=data.get("modified_before") or None,
+        )
+        return None if scope.is_empty() else scope
+
+    def is_empty(self) -> bool:
+        return not (self.tags or self.folder or self.modified_after or self.modified_before)
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "tags": list(self.tags)}
+
+    def chroma_clauses(self) -> list[dict]:
+        """Chroma where conditions on the SCOPE_FIELDS, selecting the same chunks as a mask."""
+        clauses: list[dict] = []
+        if self.tags:
+            alternatives = [{"tag_paths": {"$contains": tag.strip("/")}} for tag in self.tags]
+            clauses.append(alternatives[0] if len(alternatives) == 1 else {"$or": alternatives})
+        if self.folder:
+            clauses.append({"folder_paths": {"$contains": self.folder.strip("/")}})
+        if self.modified_after:
+            low = _timestamp(_parse_datetime(self.modified_after))
+            clauses.append({"modified_ts": {"$gte": low}})
+        if self.modified_before:
+            high = _timestamp(_parse_datetime(self.modified_before, end_of_day=True))
+            clauses.append({"modified_ts": {"$lte": high}})
+        return clauses
+
+
+class FilterPostings:
+    """Tag and folder postings and modification dates of an index's rows."""
+
+    def __init__(self, metadatas: list[dict]):
+        self.size = len(metadatas)
+        tags: dict[str, list[int]] = {}
+        folders: dict[str, list[int]] = {}
+        modified = np.full(self.size, np.datetime64("NaT", "s"), dtype="datetime64[s]")
+        for row, metadata in enumerate(metadatas):
+            nested = {parent for tag in chunk_tags(metadata) for parent in _ancestors(tag)}
+            for tag in nested:
+                tags.setdefault(tag, []).append(row)
+            folder = str(metadata.get("folder") or "")
+            for parent in _ancestors(folder):
+                folders.setdefault(parent, []).append(row)
+            # An unparsable date stays NaT: outside every date range.
+            if metadata.get("modified_at"):
+                with contextlib.suppress(ValueError):
+                    modified[row] = _parse_datetime(str(metadata["modified_at"]))
+        self._tags = {tag: np.array(rows, dtype=np.int64) for tag, rows in tags.items()}
+        self._folders = {folder: np.array(rows, dtype=np.int64) for folder, rows in folders.items()}
+        self._modified = modified
+
+    def mask(self, scope: MetadataFilter) -> np.ndarray:
+        """Boolean mask of the rows in scope."""
+        mask = np.ones(self.size, dtype=bool)
+        if scope.tags:
+            tagged = np.zeros(self.size, dtype=bool)
+            for tag in scope.tags:
+                tagged[self._tags.get(tag.strip("/"), [])] = True
+            mask &= tagged
+        if scope.folder:
+            in_folder = np.zeros(self.size, dtype=bool)
+            in_folder[self._folders.get(scope.folder.strip("/"), [])] = True
+            mask &= in_folder
+        # NaT compares False: chunks without a date fall outside any date range.
+        if scope.modified_after:
+            mask &= self._modified >= _parse_datetime(scope.modified_after)
+        if scope.modified_before:
+            mask &= self._modified <= _parse_datetime(scope.modified_before, end_of_day=True)
+        return mask
+
+    def rows(self, scope: MetadataFilter) -> np.ndarray:
+        """Indexes of the rows in scope, ascending."""
+        return np.flatnonzero(self.mask(scope))
+
+
+def filter_fields(metadata: dict) -> dict:
+    """The part of a chunk's metadata the postings read."""
+    return {key: metadata[key] for key in FILTER_FIELDS if metadata.get(key)}
+
+
+def scope_fields(metadata: dict) -> dict:
+    """The SCOPE_FIELDS of a chunk; empty lists are left for the caller to drop."""
+    fields: dict = {
+        "tag_paths": sorted({parent for tag in chunk_tags(metadata) for parent in _ancestors(tag)}),
+        "folder_paths": _ancestors(str(metadata.get("folder") or "")),
+    }
+    # An unparsable date gets no timestamp: outside every date range, as in a mask.
+    if metadata.get("modified_at"):
+        with contextlib.suppress(ValueError):
+            fields["modified_ts"] = _timestamp(_parse_datetime(str(metadata["modified_at"])))
+    return fields
@@ -1,14 +1,67 @@
+"""Fusion of ranked lists (dense and BM25) into one candidate ranking.
+
+- "rrf": Reciprocal Rank Fusion, optionally weighted per list; ranks only.
+- "minmax": convex combination of the lists' scores rescaled to [0, 1].
+- "zscore": convex combination of standardized scores.
+- "dbsf": distribution-based score fusion, scores rescaled from
+  [mean - 3 std, mean + 3 std] to [0, 1] and clipped.
+
+The score-based modes keep how far apart the scores are, which RRF drops.
+A chunk missing from a list gets that list's lowest possible normalized
+score: 0, or the worst z-score of the list. Under "zscore" a list whose
+scores are all equal (a single BM25 match, say) adds nothing.
+"""
+
+import numpy as np
+
 RRF_K = 60
+SCORE_FUSIONS = ("minmax", "zscore", "dbsf")
 
 
-def rrf_fuse(rankings: list[list[str]], k: int = RRF_K) -> dict[str, float]:
-    """Reciprocal Rank Fusion: score(item) = sum over lists of 1 / (k + rank).
+def rrf_fuse(
+    rankings: list[list[str]], k: int = RRF_K, weights: list[float] | None = None
+) -> dict[str, float]:
+    """Reciprocal Rank Fusion: score(item) = sum over lists of weight / (k + rank).
 
     Items appearing in several rankings accumulate; ranks are 1-based. k=60 is
-    the standard constant from Cormack et al. (2009).
+    the standard constant from Cormack et al. (2009); weights default to 1.
     """
     scores: dict[str, float] = {}
-    for ranking in rankings:
+    for i, ranking in enumerate(rankings):
+        weight = 1.0 if weights is None else weights[i]
         for rank, item in enumerate(ranking, start=1):
-            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
     return scores
+
+
+def normalize_scores(scores, method: str) -> np.ndarray:
+    """One list's scores normalized by "minmax", "zscore" or "dbsf"."""
+    scores = np.asarray(scores, dtype=np.float64)
+    if method == "minmax":
+        spread = scores.max() - scores.min()
+        return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    std = scores.std()
+    if method == "zscore":
+        return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    if method == "dbsf":
+        if std == 0:
+            return np.ones_like(scores)
+        return np.clip((scores - (scores.mean() - 3 * std)) / (6 * std), 0.0, 1.0)
+    raise ValueError(f"method must be one of {SCORE_FUSIONS}")
+
+
+def score_fuse(
+    runs: list[tuple[list[str], list[float]]], weights: list[float], method: str
+) -> dict[str, float]:
+    """Weighted sum of each list's normalized scores; runs are (ids, scores) pairs."""
+    ids = list(dict.fromkeys(item for run_ids, _ in runs for item in run_ids))
+    position = {item: i for i, item in enumerate(ids)}
+    fused = np.zeros(len(ids))
+    for (run_ids, scores), weight in zip(runs, weights, strict=True):
+        if not run_ids:
+            continue
+        normalized = normalize_scores(scores, method)
+        column = np.full(len(ids), normalized.min() if method == "zscore" else 0.0)
+        column[[position[item] for item in run_ids]] = normalized
+        fused += weight * column
+    return dict(zip(ids, fused.tolist(), strict=True))
@@ -1,11 +1,11 @@
 import hashlib
 import io
 import os
+import uuid
 from collections.abc import Iterable
 
 from langchain_core.documents import Document
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
-from pypdf import PdfReader
 
 CHUNK_SIZE = 600
 CHUNK_OVERLAP = 80
@@ -14,6 +14,10 @@ CHUNK_OVERLAP = 80
 MAX_SECTION_CHARS = 3200
 SECTION_CHUNK_OVERLAP = 200
 
+# Small-to-big: the child chunks indexed inside each section (see chunk_hierarchical).
+CHILD_CHUNK_SIZE = 400
+CHILD_CHUNK_OVERLAP = 60
+
 HEADERS_TO_SPLIT_ON = [("#", "h1"), ("##", "h2"), ("###", "h3"), ("####", "h4")]
 _HEADER_KEYS = [key for _, key in HEADERS_TO_SPLIT_ON]
 
@@ -28,6 +32,8 @@ MARKDOWN_EXTENSIONS = (".md", ".markdown")
 
 def extract_text(file_bytes: bytes, content_type: str) -> str:
     if content_type == "application/pdf":
+        from pypdf import PdfReader
+
         reader = PdfReader(io.BytesIO(file_bytes))
         pages = [page.extract_text() or "" for page in reader.pages]
         return "\n\n".join(pages).strip()
@@ -74,16 +80,114 @@ def chunk_markdown(content: str, metadata: dict | None = None) -> list[Document]
     return docs
 
 
+def _is_markdown(metadata: dict | None, content_type: str | None) -> bool:
+    source = str((metadata or {}).get("source", ""))
+    return content_type == "text/markdown" or source.lower().endswith(MARKDOWN_EXTENSIONS)
+
+
 def chunk_content(
     content: str, metadata: dict | None = None, content_type: str | None = None
 ) -> list[Document]:
     """Chunk content, using heading-aware splitting for any markdown input."""
-    source = str((metadata or {}).get("source", ""))
-    if content_type == "text/markdown" or source.lower().endswith(MARKDOWN_EXTENSIONS):
+    if _is_markdown(metadata, content_type):
         return chunk_markdown(content, metadata)
     return chunk_text(content, metadata)
 
 
+def split_sections(sections: list[Document]) -> tuple[list[Document], dict[str, str]]:
+    """Split sections into child chunks: (children, section text by parent_id).
+
+    Every child carries its section's metadata plus a parent_id, so the
+    children of a section share one interned metadata row in the chunk store.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHILD_CHUNK_SIZE, chunk_overlap=CHILD_CHUNK_OVERLAP
+    )
+    children: list[Document] = []
+    parents: dict[str, str] = {}
+    for section in sections:
+        parent_id = uuid.uuid4().hex
+        parents[parent_id] = section.page_content
+        children.extend(
+            splitter.create_documents(
+                [section.page_content], metadatas=[{**section.metadata, "parent_id": parent_id}]
+            )
+        )
+    return children, parents
+
+
+def chunk_hierarchical(
+    content: str, metadata: dict | None = None, content_type: str | None = None
+) -> tuple[list[Document], dict[str, str]]:
+    """Small-to-big chunking: small children to index, their sections to answer from.
+
+    Sections are chunk_markdown()'s for markdown, MAX_SECTION_CHARS windows
+    otherwise. Returns (children, section text by parent_id).
+    """
+    if _is_markdown(metadata, content_type):
+        sections = chunk_markdown(content, metadata)
+    else:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=MAX_SECTION_CHARS, chunk_overlap=SECTION_CHUNK_OVERLAP
+        )
+        sections = splitter.create_documents([content], metadatas=[metadata or {}])
+    return split_sections(sections)
+
+
+# Overlaps shorter than this are treated as coincidence, not splitter overlap.
+MIN_MERGE_OVERLAP = 20
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right."""
+    longest = min(len(left), len(right), max(CHUNK_OVERLAP, SECTION_CHUNK_OVERLAP))
+    for size in range(longest, MIN_MERGE_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _passage_key(metadata: dict) -> tuple | None:
+    """The split a chunk comes from: its note, section and heading; None if unknown."""
+    note = metadata.get("note_path") or metadata.get("source")
+    if not note:
+        return None
+    return note, metadata.get("parent_id"), metadata.get("heading_path")
+
+
+def merge_overlapping_chunks(hits: list[dict]) -> list[dict]:
+    """Undo the splitter overlap between retrieved neighbours before prompting.
+
+    Neighbouring chunks of one section share up to CHUNK_OVERLAP /
+    SECTION_CHUNK_OVERLAP characters; they are stitched back into a single
+    passage and chunks fully contained in another are dropped. Only hits of
+    the same note and section are compared, so a line shared by two notes
+    never merges them. Rank order is kept: a merged passage takes the
+    position and metadata of its best-ranked part.
+    """
+    merged: list[dict] = []
+    for hit in hits:
+        chunk, key = hit["content"], _passage_key(hit["metadata"])
+        for index, kept_hit in enumerate(merged):
+            kept = kept_hit["content"]
+            if key is None or key != _passage_key(kept_hit["metadata"]):
+                continue
+            if chunk in kept:
+                break
+            if kept in chunk:
+                merged[index] = {**kept_hit, "content": chunk}
+                break
+            if size := _overlap_length(kept, chunk):
+                merged[index] = {**kept_hit, "content": kept + chunk[size:]}
+                break
+            if size := _overlap_length(chunk, kept):
+                merged[index] = {**kept_hit, "content": chunk + kept[size:]}
+                break
+        else:
+            merged.append(hit)
+    return merged
+
+
 def hash_content(content: str) -> str:
     return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
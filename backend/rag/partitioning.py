@@ -0,0 +1,101 @@
+"""Vector store partitioning: which Chroma collection holds a user's chunks.
+
+With a single collection, every dense search walks an HNSW graph built over
+all users' vectors and filters on user_id afterwards, so its cost grows with
+the whole store. Partitioning bounds it:
+
+- "global": one collection, filtered by user_id (the original layout);
+- "user": one collection per user, searched without any filter, so isolation
+  is physical and search cost scales with the user's own notes;
+- "hash": users spread over a fixed number of shards (user_id modulo the shard
+  count), still filtered by user_id; for many small users, where one
+  collection each would mean too many open segments.
+
+Changing the layout does not move existing chunks: run
+`flask rag partition-store`, which calls migrate_partitions().
+"""
+
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+
+# langchain_chroma's default collection name, i.e. the pre-partitioning store.
+GLOBAL_COLLECTION = "langchain"
+MIGRATION_BATCH_SIZE = 1000
+
+_PARTITION_NAME = re.compile(r"^(user|shard)-(\d+)$")
+
+
+def collection_name(partitioning: str, user_id: int, shards: int) -> str:
+    if partitioning == "user":
+        return f"user-{user_id}"
+    if partitioning == "hash":
+        return f"shard-{user_id % shards}"
+    return GLOBAL_COLLECTION
+
+
+def in_layout(name: str, partitioning: str, shards: int) -> bool:
+    """Whether the collection `name` is one of the layout's partitions."""
+    if partitioning == "global":
+        return name == GLOBAL_COLLECTION
+    match = _PARTITION_NAME.match(name)
+    if match is None:
+        return False
+    if partitioning == "user":
+        return match.group(1) == "user"
+    return match.group(1) == "shard" and int(match.group(2)) < shards
+
+
+def is_partition(name: str) -> bool:
+    """Whether `name` is a collection of any layout (migration sources)."""
+    return name == GLOBAL_COLLECTION or _PARTITION_NAME.match(name) is not None
+
+
+def migrate_partitions(
+    client: "ClientAPI",
+    partitioning: str,
+    shards: int,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+) -> dict[str, int]:
+    """Move every chunk into the collection the layout assigns to its user.
+
+    Embeddings are copied, not recomputed. Source collections left empty are
+    dropped. Returns the number of chunks moved into each collection. Run it
+    with the app stopped: open pipelines keep handles on dropped collections.
+    """
+    moved: dict[str, int] = {}
+    for source in client.list_collections():
+        if not is_partition(source.name):
+            continue
+        offset = 0
+        while True:
+            batch = source.get(
+                include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset
+            )
+            if not batch["ids"]:
+                break
+            groups: dict[str, list[int]] = {}
+            for i, metadata in enumerate(batch["metadatas"]):
+                user_id = (metadata or {}).get("user_id")
+                target = (
+                    source.name
+                    if user_id is None
+                    else collection_name(partitioning, user_id, shards)
+                )
+                groups.setdefault(target, []).append(i)
+            # Chunks already in place stay; the next page starts after them.
+            offset += len(groups.pop(source.name, []))
+            for target, rows in groups.items():
+                client.get_or_create_collection(target).add(
+                    ids=[batch["ids"][i] for i in rows],
+                    embeddings=[batch["embeddings"][i] for i in rows],
+                    documents=[batch["documents"][i] for i in rows],
+                    metadatas=[batch["metadatas"][i] for i in rows],
+                )
+                source.delete(ids=[batch["ids"][i] for i in rows])
+                moved[target] = moved.get(target, 0) + len(rows)
+        if source.count() == 0:
+            client.delete_collection(source.name)
+    return moved
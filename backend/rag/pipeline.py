@@ -1,26 +1,81 @@
+import asyncio
+import contextvars
 import os
-from collections.abc import Iterable
-from dataclasses import replace
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
 from pathlib import Path
-from threading import RLock
+from threading import Lock, RLock
+from typing import TYPE_CHECKING
 
-from langchain_chroma import Chroma
+import numpy as np
 from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 
+from ..metrics import registry
 from .answerer import AnswerGenerator
 from .bm25 import UserBM25Index
-from .fusion import rrf_fuse
-from .ingestion import chunk_content, documents_from_texts, hash_content
+from .chunk_store import CHUNK_STORE_FILENAME, ChunkStore
+from .concurrency import KeyedReadWriteLocks, ReadWriteLock, SingleFlight
+from .diversity import cap_per_note, mmr_select
+from .embedding_batcher import MicroBatchEmbeddings
+from .exact_search import INDEX_DIRNAME, ExactIndex, ExactIndexStore, normalize_rows
+from .filters import SCOPE_FIELDS, MetadataFilter, scope_fields
+from .fusion import rrf_fuse, score_fuse
+from .ingestion import (
+    chunk_content,
+    chunk_hierarchical,
+    documents_from_texts,
+    hash_content,
+    merge_overlapping_chunks,
+)
+from .partitioning import GLOBAL_COLLECTION, MIGRATION_BATCH_SIZE, collection_name, in_layout
 from .reranker import Reranker
 from .retrieval_config import RetrievalConfig
-from .rewriter import QueryRewriter, rewrite_reason
+from .retrieval_service import RetrievalClient, RetrievalServiceError
+from .rewriter import LocalRewriter, QueryRewriter, rewrite_reason
+from .tracing import StageTrace, stage, tracing
+
+if TYPE_CHECKING:
+    from chromadb import Collection
+    from chromadb.api import ClientAPI
+    from langchain_chroma import Chroma
 
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
 
+# Micro-batching of concurrent embed calls (queries and ingestion); 0 = one
+# forward pass per call, as before. See `flask rag bench-embed`.
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "0"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+
+# Unix socket of a `flask rag serve-retrieval` process; when set, the app's
+# pipeline delegates retrieval and ingestion to it (see retrieval_service).
+RETRIEVAL_SERVICE_SOCKET = os.getenv("RETRIEVAL_SERVICE_SOCKET") or None
+
+# Counting the chunks opens and counts every collection: /metrics reuses a
+# count for this long rather than paying that on each scrape.
+COLLECTION_SIZE_TTL_S = 60.0
+
+EMPTY_KNOWLEDGE_BASE_ANSWER = (
+    "Knowledge base is empty. Upload documents or sync Notion to get started."
+)
+NO_HITS_ANSWER = "No relevant documents were found for the query."
+NOT_RELEVANT_ANSWER = "Retrieved notes do not appear relevant. Refine the query or add documents."
+
+
+def _load_embedding_model() -> Embeddings:
+    # langchain_huggingface (and chromadb below) take ~1 s each to import:
+    # deferred to first use so worker boot and CLI startup stay fast.
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
 
 def _sanitize_metadata(metadata: dict) -> dict:
-    """Chroma only accepts scalar metadata values; flatten everything else."""
+    """Chroma takes scalars and lists of one type: lists become lists of strings."""
     clean: dict = {}
     for key, value in metadata.items():
         if value is None or (isinstance(value, (list, tuple)) and not value):
@@ -28,18 +83,40 @@ def _sanitize_metadata(metadata: dict) -> dict:
         if isinstance(value, (str, int, float, bool)):
             clean[key] = value
         elif isinstance(value, (list, tuple)):
-            clean[key] = ", ".join(str(item) for item in value)
+            clean[key] = [str(item) for item in value]
         else:
             clean[key] = str(value)
     return clean
 
 
+def _with_scope_fields(docs: list[Document]) -> list[Document]:
+    """Copies for Chroma, with the SCOPE_FIELDS; the chunk store keeps the originals."""
+    return [
+        Document(
+            id=doc.id,
+            page_content=doc.page_content,
+            metadata=_sanitize_metadata({**doc.metadata, **scope_fields(doc.metadata)}),
+        )
+        for doc in docs
+    ]
+
+
+@dataclass
+class _Speculation:
+    """A rewrite submitted before retrieval; no future when the rewrite pool was full."""
+
+    reason: str
+    future: Future | None = None
+    submitted: float = 0.0
+
+
 class RAGPipeline:
     def __init__(
         self,
         persist_directory: str,
         top_k: int | None = None,
         config: RetrievalConfig | None = None,
+        retrieval_socket: str | None = None,
     ):
         self.persist_directory = Path(persist_directory)
         if config is None:
@@ -47,19 +124,68 @@ class RAGPipeline:
             if top_k is not None:
                 config = replace(config, final_k=top_k)
         self.config = config
-        self._lock = RLock()
-        self._vectorstore: Chroma | None = None
-        # Per-user BM25 indexes, rebuilt lazily from Chroma after invalidation.
+        # Reads (retrieval, BM25 builds) share a user's lock, writes (ingestion,
+        # deletion) hold it exclusively; other users are never blocked.
+        # Writes spanning unknown users take the store lock exclusively.
+        self._store_lock = ReadWriteLock()
+        self._user_locks = KeyedReadWriteLocks()
+        # One Chroma client; a wrapper per collection (partition) opened.
+        self._vectorstore_lock = RLock()
+        self._chroma_client: ClientAPI | None = None
+        self._vectorstores: dict[str, Chroma] = {}
+        # Set once a chunk is known to exist, reset by deletions: saves the
+        # store-wide emptiness check on every query.
+        self._has_chunks = False
+        # (monotonic time, count) of the last collection_size().
+        self._collection_size: tuple[float, int] | None = None
+        # Per-user BM25 indexes, rebuilt lazily from Chroma after invalidation;
+        # concurrent misses for one user share a single rebuild.
         self._bm25_cache: dict[int, UserBM25Index] = {}
-        self.embedding = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+        self._bm25_builds = SingleFlight()
+        # Users whose chunks stored before the scope fields existed were given
+        # them: checked once per process, before the user's first scoped query.
+        self._scope_backfilled: set[int] = set()
+        self._scope_backfills = SingleFlight()
+        # Per-user embedding matrices of the exact dense backend, persisted
+        # next to Chroma and rebuilt from it after invalidation, like BM25.
+        self._exact_indexes = ExactIndexStore(self.persist_directory / INDEX_DIRNAME)
+        self._exact_builds = SingleFlight()
+        # Texts and metadata by chunk id: searches return ids, and only the
+        # final candidates are hydrated from here.
+        self._chunks = ChunkStore(self.persist_directory / CHUNK_STORE_FILENAME)
+        self._embedding: Embeddings | None = None
+        # Thin-client mode: the embedding model, reranker and Chroma live in the
+        # retrieval service process and are never loaded here.
+        self._client = RetrievalClient(retrieval_socket) if retrieval_socket else None
         # LLM clients are created lazily so retrieval-only usage (retrieve(),
         # ingestion, evals) works without an Anthropic API key.
         self._answerer: AnswerGenerator | None = None
         self._rewriter: QueryRewriter | None = None
+        self.local_rewriter = LocalRewriter()
         self._reranker: Reranker | None = None
+        # Background threads, created on first use: early-generation reranks
+        # and speculative rewrites each get their own pool, so that under load
+        # neither queues behind the other.
+        self._rerank_executor: ThreadPoolExecutor | None = None
+        self._rewrite_executor: ThreadPoolExecutor | None = None
+        self._executors_lock = Lock()
+        # Speculative rewrites submitted and not finished, abandoned ones included.
+        self._rewrites_in_flight = 0
+        self._rewrites_lock = Lock()
 
         self.persist_directory.mkdir(parents=True, exist_ok=True)
 
+    @property
+    def embedding(self) -> Embeddings:
+        if self._embedding is None:
+            embedding = _load_embedding_model()
+            if EMBEDDING_BATCH_WINDOW_MS > 0:
+                embedding = MicroBatchEmbeddings(
+                    embedding, window_ms=EMBEDDING_BATCH_WINDOW_MS, max_batch=EMBEDDING_MAX_BATCH
+                )
+            self._embedding = embedding
+        return self._embedding
+
     @property
     def answerer(self) -> AnswerGenerator:
         if self._answerer is None:
@@ -78,22 +204,187 @@ class RAGPipeline:
             self._rewriter = QueryRewriter()
         return self._rewriter
 
-    def _load_vectorstore(self) -> Chroma:
-        if self._vectorstore is None:
-            self._vectorstore = Chroma(
-                embedding_function=self.embedding,
-                persist_directory=str(self.persist_directory),
-            )
-        return self._vectorstore
+    @property
+    def rerank_executor(self) -> ThreadPoolExecutor:
+        if self._rerank_executor is None:
+            with self._executors_lock:
+                if self._rerank_executor is None:
+                    self._rerank_executor = ThreadPoolExecutor(
+                        max_workers=self.config.rerank_workers, thread_name_prefix="rag-rerank"
+                    )
+        return self._rerank_executor
+
+    @property
+    def rewrite_executor(self) -> ThreadPoolExecutor:
+        if self._rewrite_executor is None:
+            with self._executors_lock:
+                if self._rewrite_executor is None:
+                    self._rewrite_executor = ThreadPoolExecutor(
+                        max_workers=self.config.rewrite_workers, thread_name_prefix="rag-rewrite"
+                    )
+        return self._rewrite_executor
+
+    def load_models(self) -> None:
+        """Load the embedding (and, if enabled, rerank) weights without running them.
+
+        Safe before a fork: no forward pass, no Chroma client. Called in the
+        gunicorn master with --preload so forked workers share the weights
+        copy-on-write. A no-op for thin clients of the retrieval service.
+        """
+        if self._client is not None:
+            return
+        _ = self.embedding
+        if self.config.rerank_enabled:
+            _ = self.reranker.model
+
+    def warmup(self) -> dict[str, float]:
+        """load_models(), the Chroma client, one dummy embed and rerank; timings (ms).
+
+        Runs after the fork, so it may open the store: readiness needs it open.
+        """
+        if self._client is not None:
+            return {}
+        timings = {}
+        start = time.perf_counter()
+        self._chroma()
+        timings["vectorstore_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        start = time.perf_counter()
+        self.load_models()
+        self.embedding.embed_query("warmup")
+        timings["embedding_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        if self.config.rerank_enabled:
+            start = time.perf_counter()
+            self.reranker.score("warmup", ["warmup"])
+            timings["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return timings
+
+    def warm_user(self, user_id: int) -> None:
+        """Build what a user's first query would: BM25 index, Chroma segment reads."""
+        if self._client is not None:
+            return
+        with self._reading([user_id]):
+            if self.config.hybrid_enabled:
+                self._bm25_index(user_id)
+            self._dense_hits("warmup", user_id, 1)
+
+    def readiness(self) -> dict:
+        """Which components are loaded; "ready" when a query pays no load cost."""
+        if self._client is not None:
+            try:
+                self._client.is_empty()
+                reachable = True
+            except RetrievalServiceError:
+                reachable = False
+            return {"ready": reachable, "retrieval_service": reachable}
+        models = {"embedding": self._embedding is not None}
+        if self.config.rerank_enabled:
+            models["reranker"] = self._reranker is not None and self._reranker.loaded
+        vectorstore = self._chroma_client is not None
+        return {
+            "ready": vectorstore and all(models.values()),
+            "models": models,
+            "vectorstore": vectorstore,
+            "bm25_users": len(self._bm25_cache),
+        }
+
+    def bm25_cache_size(self) -> int:
+        return len(self._bm25_cache)
+
+    def collection_size(self) -> int | None:
+        """Chunks in the vector store, at most COLLECTION_SIZE_TTL_S old.
+
+        None when the store is not open in this process.
+        """
+        if self._client is not None or self._chroma_client is None:
+            return None
+        now = time.monotonic()
+        if self._collection_size is None or now - self._collection_size[0] > COLLECTION_SIZE_TTL_S:
+            self._collection_size = (now, sum(c.count() for c in self._partitions()))
+        return self._collection_size[1]
+
+    def _chroma(self) -> "ClientAPI":
+        if self._chroma_client is None:
+            with self._vectorstore_lock:
+                if self._chroma_client is None:
+                    import chromadb
+
+                    self._chroma_client = chromadb.PersistentClient(
+                        path=str(self.persist_directory)
+                    )
+        return self._chroma_client
+
+    def _load_vectorstore(self, name: str = GLOBAL_COLLECTION) -> "Chroma":
+        """The Chroma wrapper of one collection, created on first use."""
+        vectorstore = self._vectorstores.get(name)
+        if vectorstore is None:
+            with self._vectorstore_lock:
+                vectorstore = self._vectorstores.get(name)
+                if vectorstore is None:
+                    from langchain_chroma import Chroma
+
+                    vectorstore = Chroma(
+                        collection_name=name,
+                        embedding_function=self.embedding,
+                        client=self._chroma(),
+                    )
+                    self._vectorstores[name] = vectorstore
+        return vectorstore
+
+    def _collection_for(self, user_id: int) -> str:
+        return collection_name(self.config.partitioning, user_id, self.config.partition_shards)
+
+    def _user_vectorstore(self, user_id: int) -> "Chroma":
+        return self._load_vectorstore(self._collection_for(user_id))
+
+    def _user_filter(self, user_id: int) -> dict | None:
+        """Metadata filter of a user's chunks; None when the collection is theirs alone."""
+        return None if self.config.partitioning == "user" else {"user_id": user_id}
+
+    def _partitions(self) -> list["Collection"]:
+        """Every collection of the configured layout, for store-wide operations.
+
+        Raw chromadb collections: no LangChain wrapper is opened per partition.
+        """
+        if self.config.partitioning == "global":
+            return [self._load_vectorstore()._collection]
+        return [
+            collection
+            for collection in self._chroma().list_collections()
+            if in_layout(collection.name, self.config.partitioning, self.config.partition_shards)
+        ]
+
+    @contextmanager
+    def _reading(self, user_ids: Iterable[int]) -> Iterator[None]:
+        with self._store_lock.read(), self._user_locks.read(user_ids):
+            yield
+
+    @contextmanager
+    def _writing(self, user_ids: Iterable[int]) -> Iterator[None]:
+        with self._store_lock.read(), self._user_locks.write(user_ids):
+            yield
 
     @staticmethod
-    def _collection_count(vectorstore: Chroma) -> int:
+    def _collection_count(vectorstore: "Chroma") -> int:
         try:
             return vectorstore._collection.count()  # type: ignore[attr-defined]
         except AttributeError:
             return 0
 
-    def ingest_documents(self, docs: list[Document], ids: list[str] | None = None) -> int:
+    def is_empty(self) -> bool:
+        """True when no user has any chunk indexed yet."""
+        if self._client is not None:
+            return self._client.is_empty()
+        if not self._has_chunks:
+            self._has_chunks = any(collection.count() for collection in self._partitions())
+        return not self._has_chunks
+
+    def ingest_documents(
+        self,
+        docs: list[Document],
+        ids: list[str] | None = None,
+        parents: dict[str, str] | None = None,
+    ) -> int:
+        """Index chunks; `parents` holds the section text of small-to-big children by parent_id."""
         if not docs:
             return 0
         if ids is not None and len(ids) != len(docs):
@@ -102,25 +393,66 @@ class RAGPipeline:
             if doc.metadata.get("user_id") is None:
                 raise ValueError("Every ingested document must carry a user_id in its metadata")
             doc.metadata = _sanitize_metadata(doc.metadata)
-        with self._lock:
-            vectorstore = self._load_vectorstore()
-            if ids is None:
-                vectorstore.add_documents(docs)
-            else:
-                vectorstore.add_documents(docs, ids=ids)
-            for doc in docs:
-                self._bm25_cache.pop(doc.metadata["user_id"], None)
+        if self._client is not None:
+            return self._client.ingest(docs, ids, parents)
+        user_ids = {doc.metadata["user_id"] for doc in docs}
+        partitions: dict[str, tuple[list[Document], list[str]]] = {}
+        for i, doc in enumerate(docs):
+            name = self._collection_for(doc.metadata["user_id"])
+            partition_docs, partition_ids = partitions.setdefault(name, ([], []))
+            partition_docs.append(doc)
+            if ids is not None:
+                partition_ids.append(ids[i])
+        added: dict[int, list[str]] = {user_id: [] for user_id in user_ids}
+        with self._writing(user_ids):
+            for name, (partition_docs, partition_ids) in partitions.items():
+                vectorstore = self._load_vectorstore(name)
+                stored = _with_scope_fields(partition_docs)
+                if ids is None:
+                    added_ids = vectorstore.add_documents(stored)
+                else:
+                    added_ids = vectorstore.add_documents(stored, ids=partition_ids)
+                for chunk_id, doc in zip(added_ids, partition_docs, strict=True):
+                    added[doc.metadata["user_id"]].append(chunk_id)
+                self._chunks.add(
+                    [
+                        (chunk_id, doc.page_content, doc.metadata)
+                        for chunk_id, doc in zip(added_ids, partition_docs, strict=True)
+                    ],
+                    parents={
+                        doc.metadata["parent_id"]: parents[doc.metadata["parent_id"]]
+                        for doc in partition_docs
+                        if doc.metadata.get("parent_id") in (parents or {})
+                    },
+                )
+            for user_id in user_ids:
+                self._bm25_cache.pop(user_id, None)
+                self._update_exact_index(user_id, added=added[user_id])
+            self._has_chunks = True
         return len(docs)
 
     def delete_chunks(self, chunk_ids: list[str], user_id: int | None = None) -> None:
         if not chunk_ids:
             return
-        with self._lock:
-            self._load_vectorstore().delete(ids=list(chunk_ids))
-            if user_id is None:
+        if self._client is not None:
+            self._client.delete(chunk_ids, user_id)
+            return
+        if user_id is None:
+            with self._store_lock.write():
+                for collection in self._partitions():
+                    collection.delete(ids=list(chunk_ids))
+                self._chunks.delete(list(chunk_ids))
                 self._bm25_cache.clear()
-            else:
-                self._bm25_cache.pop(user_id, None)
+                self._exact_indexes.clear()
+                self._has_chunks = False
+            return
+        vectorstore = self._user_vectorstore(user_id)
+        with self._writing([user_id]):
+            vectorstore.delete(ids=list(chunk_ids))
+            self._chunks.delete(list(chunk_ids))
+            self._bm25_cache.pop(user_id, None)
+            self._update_exact_index(user_id, removed=chunk_ids)
+            self._has_chunks = False
 
     def ingest_texts(self, texts: Iterable[str], base_metadata: dict | None = None) -> int:
         docs = documents_from_texts(texts, base_metadata=base_metadata)
@@ -129,136 +461,652 @@ class RAGPipeline:
     def ingest_uploaded_text(
         self, content: str, metadata: dict | None = None, content_type: str | None = None
     ) -> dict[str, int]:
-        docs = chunk_content(content, metadata=metadata, content_type=content_type)
-        added = self.ingest_documents(docs)
+        parents = None
+        if self.config.small_to_big:
+            docs, parents = chunk_hierarchical(content, metadata, content_type)
+        else:
+            docs = chunk_content(content, metadata=metadata, content_type=content_type)
+        added = self.ingest_documents(docs, parents=parents)
         return {"chunks_added": added, "content_hash": hash_content(content)}
 
-    def _dense_hits(self, query: str, user_id: int, k: int) -> list[dict]:
-        results = self._load_vectorstore().similarity_search_with_relevance_scores(
-            query, k=k, filter={"user_id": user_id}
+    def _dense_hits(
+        self,
+        query: str,
+        user_id: int,
+        k: int,
+        query_vector: list[float] | None = None,
+        filters: MetadataFilter | None = None,
+    ) -> list[dict]:
+        """{id, score} of the user's k nearest chunks in scope, best first.
+
+        No text: see _hydrate.
+        """
+        vectorstore = self._user_vectorstore(user_id)
+        if query_vector is None:
+            with stage("embedding"):
+                query_vector = self.embedding.embed_query(query)
+        # What similarity_search_with_relevance_scores() does, with the
+        # embedding step split out (and reusable from a batch), and without
+        # reading the documents and metadata of every result.
+        relevance = vectorstore._select_relevance_score_fn()
+        index = self._exact_index(user_id) if self.config.dense_backend == "exact" else None
+        registry.inc(
+            "rag_dense_search_requests_total", {"backend": "chroma" if index is None else "exact"}
         )
+        if index is not None:
+            with stage("dense_search"):
+                results = index.search(
+                    query_vector,
+                    k,
+                    self.config.dense_quantization,
+                    self.config.quantization_oversample,
+                    rows=None if filters is None else index.postings.rows(filters),
+                )
+            # Chroma's default space reports the squared L2 distance, which
+            # for unit vectors is 2 - 2 * cosine: same scores on both backends.
+            return [
+                {"id": index.ids[row], "score": float(relevance(2.0 - 2.0 * cosine))}
+                for row, cosine in results
+            ]
+        with stage("dense_search"):
+            where = self._user_filter(user_id)
+            if filters is not None:
+                self._backfill_scope_fields(user_id)
+                clauses = filters.chroma_clauses()
+                conditions = [where, *clauses] if where else clauses
+                where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+            results = vectorstore._collection.query(
+                query_embeddings=[query_vector],
+                n_results=k,
+                where=where,
+                include=["distances"],
+            )
         return [
-            {
-                "id": doc.id,
-                "content": doc.page_content,
-                "score": float(score),
-                "metadata": dict(doc.metadata),
-            }
-            for doc, score in results
+            {"id": chunk_id, "score": float(relevance(distance))}
+            for chunk_id, distance in zip(results["ids"][0], results["distances"][0], strict=True)
         ]
 
+    def _build_exact_index(self, user_id: int) -> ExactIndex:
+        # Read first: an invalidation by another process during the reads
+        # below then keeps this snapshot from being saved.
+        generation = self._exact_indexes.generation(user_id)
+        vectorstore = self._user_vectorstore(user_id)
+        where = self._user_filter(user_id)
+        size = len(vectorstore.get(where=where, include=[])["ids"])
+        if size > self.config.exact_max_chunks:
+            return self._exact_indexes.save(user_id, size, generation=generation)
+        data = vectorstore.get(where=where, include=["embeddings", "metadatas"])
+        return self._exact_indexes.save(
+            user_id,
+            len(data["ids"]),
+            ids=data["ids"],
+            embeddings=data["embeddings"],
+            metadatas=data["metadatas"],
+            generation=generation,
+        )
+
+    def _update_exact_index(
+        self, user_id: int, added: Iterable[str] = (), removed: Iterable[str] = ()
+    ) -> None:
+        """Apply a write to the user's saved exact index; callers hold the user's write lock.
+
+        Only the added chunks are read back from Chroma, for their embeddings.
+        Without a saved index (the Chroma backend, or a user never queried),
+        the write only invalidates.
+        """
+        index = self._exact_indexes.load(user_id)
+        if index is None or index.matrix is None:
+            self._exact_indexes.invalidate(user_id)
+            return
+        data = {"ids": [], "embeddings": None, "metadatas": []}
+        if added:
+            data = self._user_vectorstore(user_id)._collection.get(
+                ids=list(added), include=["embeddings", "metadatas"]
+            )
+        self._exact_indexes.update(
+            user_id,
+            removed=removed,
+            ids=data["ids"],
+            embeddings=data["embeddings"],
+            metadatas=data["metadatas"],
+            max_size=self.config.exact_max_chunks,
+        )
+
+    def _exact_index(self, user_id: int) -> ExactIndex | None:
+        """The user's exact-search index; None when Chroma must serve them.
+
+        Built on first use (callers hold the user's read lock, as for BM25)
+        and only for users with at most exact_max_chunks chunks.
+        """
+        index = self._exact_indexes.load(user_id)
+        if index is None or (index.matrix is None and index.size <= self.config.exact_max_chunks):
+            index = self._exact_builds.do(user_id, lambda: self._build_exact_index(user_id))
+        if index.matrix is None or index.size > self.config.exact_max_chunks:
+            return None
+        return index
+
+    def dense_index_bytes(self, user_id: int) -> int | None:
+        """Bytes a dense query of the user scans first; None when Chroma serves them."""
+        if self.config.dense_backend != "exact" or self._client is not None:
+            return None
+        with self._reading([user_id]):
+            index = self._exact_index(user_id)
+        return None if index is None else index.scanned_bytes(self.config.dense_quantization)
+
+    def _build_bm25_index(self, user_id: int) -> UserBM25Index:
+        data = self._user_vectorstore(user_id).get(
+            where=self._user_filter(user_id), include=["documents", "metadatas"]
+        )
+        index = UserBM25Index(
+            ids=data["ids"], contents=data["documents"] or [], metadatas=data["metadatas"]
+        )
+        self._bm25_cache[user_id] = index
+        return index
+
     def _bm25_index(self, user_id: int) -> UserBM25Index:
+        """The user's cached index; callers hold the user's read lock.
+
+        The lock keeps writers (and their cache invalidation) out while an
+        index is built, so a stale index is never cached.
+        """
         index = self._bm25_cache.get(user_id)
+        registry.inc(
+            "rag_bm25_cache_requests_total", {"result": "miss" if index is None else "hit"}
+        )
         if index is None:
-            data = self._load_vectorstore().get(
-                where={"user_id": user_id}, include=["documents", "metadatas"]
-            )
-            index = UserBM25Index(
-                ids=data["ids"],
-                contents=data["documents"] or [],
-                metadatas=data["metadatas"] or [],
-            )
-            self._bm25_cache[user_id] = index
+            index = self._bm25_builds.do(user_id, lambda: self._build_bm25_index(user_id))
         return index
 
-    def _hybrid_candidates(self, query: str, user_id: int) -> list[dict]:
-        """Dense + BM25 candidates fused with Reciprocal Rank Fusion."""
+    def _write_scope_fields(self, user_id: int) -> None:
+        collection = self._user_vectorstore(user_id)._collection
+        data = collection.get(where=self._user_filter(user_id), include=["metadatas"])
+        ids, updates = [], []
+        for chunk_id, metadata in zip(data["ids"], data["metadatas"] or [], strict=True):
+            fields = _sanitize_metadata(scope_fields(metadata or {}))
+            missing = {key: value for key, value in fields.items() if key not in (metadata or {})}
+            if missing:
+                ids.append(chunk_id)
+                updates.append(missing)
+        # Chroma merges updated metadata into the stored one.
+        for start in range(0, len(ids), MIGRATION_BATCH_SIZE):
+            end = start + MIGRATION_BATCH_SIZE
+            collection.update(ids=ids[start:end], metadatas=updates[start:end])
+        self._scope_backfilled.add(user_id)
+
+    def _backfill_scope_fields(self, user_id: int) -> None:
+        """Give the scope fields to the user's chunks ingested before they existed.
+
+        Callers hold the user's read lock: only derived metadata is written,
+        which no cached index reads.
+        """
+        if user_id not in self._scope_backfilled:
+            self._scope_backfills.do(user_id, lambda: self._write_scope_fields(user_id))
+
+    def _hybrid_candidates(
+        self,
+        query: str,
+        user_id: int,
+        query_vector: list[float] | None = None,
+        filters: MetadataFilter | None = None,
+    ) -> list[dict]:
+        """Dense + BM25 candidates, fused per config.fusion (RRF by default)."""
         candidate_k = self.config.candidate_k
-        dense = self._dense_hits(query, user_id, candidate_k)
-        bm25_hits = self._bm25_index(user_id).search(query, candidate_k)
+        dense = self._dense_hits(query, user_id, candidate_k, query_vector, filters)
+        with stage("bm25"):
+            bm25_hits = self._bm25_index(user_id).search(query, candidate_k, filters)
+
+        with stage("fusion"):
+            return self._fuse_dense_and_bm25(dense, bm25_hits)
 
-        rrf_scores = rrf_fuse([[hit["id"] for hit in dense], [hit.chunk_id for hit in bm25_hits]])
+    def _fuse_dense_and_bm25(self, dense: list[dict], bm25_hits: list) -> list[dict]:
+        dense_ids = [hit["id"] for hit in dense]
+        bm25_ids = [hit.chunk_id for hit in bm25_hits]
+        weights = [self.config.fusion_dense_weight, 1.0 - self.config.fusion_dense_weight]
+        if self.config.fusion == "rrf":
+            # Weights relative to an even split: 0.5 is plain RRF.
+            fused = rrf_fuse(
+                [dense_ids, bm25_ids], k=self.config.rrf_k, weights=[2 * w for w in weights]
+            )
+            score_key = "rrf_score"
+        else:
+            fused = score_fuse(
+                [
+                    (dense_ids, [hit["score"] for hit in dense]),
+                    (bm25_ids, [hit.score for hit in bm25_hits]),
+                ],
+                weights,
+                self.config.fusion,
+            )
+            score_key = "fusion_score"
 
-        merged: dict[str, dict] = {}
+        ranks: dict[str, dict] = {}
         for rank, hit in enumerate(dense, start=1):
-            merged[hit["id"]] = {
-                "content": hit["content"],
-                "metadata": hit["metadata"],
-                "dense_rank": rank,
-            }
+            ranks[hit["id"]] = {"dense_rank": rank, "dense_score": round(hit["score"], 6)}
         for hit in bm25_hits:
-            entry = merged.setdefault(
-                hit.chunk_id, {"content": hit.content, "metadata": dict(hit.metadata)}
-            )
-            entry["bm25_rank"] = hit.rank
+            entry = ranks.setdefault(hit.chunk_id, {})
+            entry.update(bm25_rank=hit.rank, bm25_score=round(hit.score, 6))
 
         candidates = []
-        for chunk_id, entry in merged.items():
-            metadata = dict(entry["metadata"])
-            metadata["retrieval_mode"] = "hybrid"
-            metadata["rrf_score"] = round(rrf_scores[chunk_id], 6)
-            for key in ("dense_rank", "bm25_rank"):
-                if key in entry:
-                    metadata[key] = entry[key]
-            candidates.append(
-                {"content": entry["content"], "score": rrf_scores[chunk_id], "metadata": metadata}
-            )
+        for chunk_id, entry in ranks.items():
+            metadata = {
+                "chunk_id": chunk_id,
+                "retrieval_mode": "hybrid",
+                score_key: round(fused[chunk_id], 6),
+                **entry,
+            }
+            candidates.append({"score": fused[chunk_id], "metadata": metadata})
         candidates.sort(key=lambda candidate: candidate["score"], reverse=True)
         return candidates
 
-    def retrieve(self, query: str, *, user_id: int, top_k: int | None = None) -> list[dict]:
+    def _candidates(
+        self,
+        query: str,
+        user_id: int,
+        k_final: int,
+        query_vector: list[float] | None = None,
+        filters: MetadataFilter | None = None,
+    ) -> list[dict]:
+        """First-stage candidates (dense or hybrid) in scope, before hydration and reranking.
+
+        Each is {score, metadata} where the metadata only holds chunk_id and
+        the retrieval ranks and scores.
+        """
+        if self.config.hybrid_enabled:
+            return self._hybrid_candidates(query, user_id, query_vector, filters)
+        # Reranking and diversity need a wide candidate pool even in dense-only mode.
+        dense_k = self._pool_size(k_final)
+        return [
+            {
+                "score": hit["score"],
+                "metadata": {
+                    "chunk_id": hit["id"],
+                    "retrieval_mode": "dense",
+                    "dense_rank": rank,
+                },
+            }
+            for rank, hit in enumerate(
+                self._dense_hits(query, user_id, dense_k, query_vector, filters), start=1
+            )
+        ]
+
+    def retrieve(
+        self,
+        query: str,
+        *,
+        user_id: int,
+        top_k: int | None = None,
+        filters: MetadataFilter | None = None,
+    ) -> list[dict]:
         """User-filtered retrieval: no rewriter, no answerer.
 
         Returns one dict per chunk: {content, score, metadata}, best first.
-        In hybrid mode the score is the RRF score and the metadata carries
-        retrieval_mode, rrf_score and the individual dense/bm25 ranks.
+        With filters, only the user's chunks in scope are searched.
+        In hybrid mode the score is the fused score and the metadata carries
+        retrieval_mode, rrf_score (fusion_score for the score-based fusions)
+        and the individual dense/bm25 ranks and raw scores.
         """
-        vectorstore = self._load_vectorstore()
-        if self._collection_count(vectorstore) == 0:
+        if self._client is not None:
+            return self._client.retrieve(query, user_id=user_id, top_k=top_k, filters=filters)
+        if self.is_empty():
             return []
         k_final = top_k or self.config.final_k
-        # Reranking needs a wide candidate pool even in dense-only mode.
-        dense_k = self.config.candidate_k if self.config.rerank_enabled else k_final
+        with self._reading([user_id]):
+            candidates = self._candidates(query, user_id, k_final, filters=filters)
+            candidates = self._hydrate(candidates[: self._pool_size(k_final)], user_id)
+        if self.config.rerank_enabled and candidates:
+            candidates = self._rerank(query, candidates)
+        return self._expand_parents(self._select(candidates, user_id, k_final))
 
-        if self.config.hybrid_enabled:
-            candidates = self._hybrid_candidates(query, user_id)
-        else:
-            candidates = [
+    def _select(self, candidates: list[dict], user_id: int, k_final: int) -> list[dict]:
+        """The final k of the ranked candidates, diversified per config.diversity."""
+        mode = self.config.diversity
+        if mode == "none" or not candidates:
+            return candidates[:k_final]
+        with stage("selection"):
+            if mode == "note_cap":
+                return cap_per_note(candidates, k_final, self.config.max_chunks_per_note)
+            embeddings = self._candidate_embeddings(
+                user_id, [candidate["metadata"]["chunk_id"] for candidate in candidates]
+            )
+            order = mmr_select(
+                [candidate["score"] for candidate in candidates],
+                embeddings,
+                k_final,
+                self.config.mmr_lambda,
+            )
+            return [candidates[i] for i in order]
+
+    def _candidate_embeddings(self, user_id: int, chunk_ids: list[str]) -> np.ndarray:
+        """Normalized embeddings of candidates: the exact index's if saved, else Chroma's.
+
+        A chunk deleted since it was retrieved gets a zero vector.
+        """
+        if self.config.dense_backend == "exact":
+            index = self._exact_indexes.load(user_id)
+            embeddings = index.embeddings(chunk_ids) if index is not None else None
+            if embeddings is not None:
+                return embeddings
+        data = self._user_vectorstore(user_id)._collection.get(
+            ids=chunk_ids, include=["embeddings"]
+        )
+        by_id = dict(zip(data["ids"], data["embeddings"], strict=True))
+        rows = [by_id.get(chunk_id) for chunk_id in chunk_ids]
+        width = max((len(row) for row in rows if row is not None), default=1)
+        return normalize_rows([row if row is not None else np.zeros(width) for row in rows])
+
+    def _expand_parents(self, hits: list[dict]) -> list[dict]:
+        """Small-to-big: each hit's section instead of its child chunk.
+
+        Hits of an already expanded section are dropped, so fewer than k may
+        remain. Hits without a stored section (flat chunks) are kept as is.
+        """
+        if not self.config.small_to_big:
+            return hits
+        parent_ids = [hit["metadata"].get("parent_id") for hit in hits]
+        sections = self._chunks.parents([parent_id for parent_id in parent_ids if parent_id])
+        expanded, seen = [], set()
+        for hit, parent_id in zip(hits, parent_ids, strict=True):
+            if parent_id not in sections:
+                expanded.append(hit)
+            elif parent_id not in seen:
+                seen.add(parent_id)
+                expanded.append({**hit, "content": sections[parent_id]})
+        return expanded
+
+    def _pool_size(self, k_final: int) -> int:
+        """Candidates that need their text: the rerank or selection pool, or the final k."""
+        if self.config.rerank_enabled or self.config.diversity != "none":
+            return self.config.candidate_k
+        return k_final
+
+    def _hydrate(self, candidates: list[dict], user_id: int) -> list[dict]:
+        """Candidates with their text and stored metadata, from the chunk store.
+
+        Chunks ingested before the chunk store existed are read from Chroma
+        and copied into it. Callers hold the user's read lock.
+        """
+        if not candidates:
+            return []
+        with stage("hydration"):
+            chunk_ids = [candidate["metadata"]["chunk_id"] for candidate in candidates]
+            chunks = self._chunks.get(chunk_ids)
+            missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in chunks]
+            if missing:
+                data = self._user_vectorstore(user_id)._collection.get(
+                    ids=missing, include=["documents", "metadatas"]
+                )
+                copied = [
+                    (chunk_id, text, {k: v for k, v in metadata.items() if k not in SCOPE_FIELDS})
+                    for chunk_id, text, metadata in zip(
+                        data["ids"], data["documents"], data["metadatas"], strict=True
+                    )
+                ]
+                self._chunks.add(copied)
+                chunks.update((chunk_id, (text, metadata)) for chunk_id, text, metadata in copied)
+            return [
                 {
-                    "content": hit["content"],
-                    "score": hit["score"],
-                    "metadata": {
-                        **hit["metadata"],
-                        "retrieval_mode": "dense",
-                        "dense_rank": rank,
-                    },
+                    **candidate,
+                    "content": chunks[chunk_id][0],
+                    "metadata": {**chunks[chunk_id][1], **candidate["metadata"]},
                 }
-                for rank, hit in enumerate(self._dense_hits(query, user_id, dense_k), start=1)
+                for chunk_id, candidate in zip(chunk_ids, candidates, strict=True)
+                if chunk_id in chunks
             ]
 
-        if self.config.rerank_enabled and candidates:
-            candidates = self._rerank(query, candidates[: self.config.candidate_k])
-        return candidates[:k_final]
+    def retrieve_batch(self, requests: list[dict]) -> list[list[dict]]:
+        """retrieve() for several {query, user_id, top_k, filters} requests at once.
+
+        All queries are embedded in one forward pass and all (query, chunk)
+        pairs are reranked in one cross-encoder call; used by the retrieval
+        service to coalesce concurrent clients. Results match retrieve().
+        A request may carry a StageTrace under "trace": its own stages are
+        recorded there, and so are the shared passes it waited for.
+        """
+        if not requests:
+            return []
+        if self.is_empty():
+            return [[] for _ in requests]
+        traces = [request.get("trace") or StageTrace() for request in requests]
+        shared = StageTrace()
+        # embed_documents() and embed_query() encode identically unless query
+        # instructions are configured, which EMBEDDING_MODEL_NAME never sets.
+        with tracing(shared), stage("embedding"):
+            vectors = self.embedding.embed_documents([request["query"] for request in requests])
+        limits = [request.get("top_k") or self.config.final_k for request in requests]
+        pools = []
+        with self._reading(request["user_id"] for request in requests):
+            for request, trace, k_final, vector in zip(
+                requests, traces, limits, vectors, strict=True
+            ):
+                with tracing(trace):
+                    candidates = self._candidates(
+                        request["query"],
+                        request["user_id"],
+                        k_final,
+                        vector,
+                        request.get("filters"),
+                    )
+                    pools.append(
+                        self._hydrate(candidates[: self._pool_size(k_final)], request["user_id"])
+                    )
+        if self.config.rerank_enabled:
+            with tracing(shared), stage("rerank"):
+                batch_scores = self.reranker.score_batch(
+                    [
+                        (request["query"], [candidate["content"] for candidate in pool])
+                        for request, pool in zip(requests, pools, strict=True)
+                    ]
+                )
+            pools = [
+                self._apply_rerank_scores(pool, scores)
+                for pool, scores in zip(pools, batch_scores, strict=True)
+            ]
+        results = []
+        for request, trace, pool, k_final in zip(requests, traces, pools, limits, strict=True):
+            with tracing(trace):
+                results.append(
+                    self._expand_parents(self._select(pool, request["user_id"], k_final))
+                )
+            for name, duration_ms in shared.as_dict().items():
+                trace.add(name, duration_ms)
+        return results
+
+    @staticmethod
+    def _apply_rerank_scores(candidates: list[dict], scores: list[float]) -> list[dict]:
+        """Scored copies, best first: the candidates may be in use by another thread."""
+        reranked = [
+            {
+                **candidate,
+                "score": score,
+                "metadata": {**candidate["metadata"], "rerank_score": round(score, 6)},
+            }
+            for candidate, score in zip(candidates, scores, strict=True)
+        ]
+        reranked.sort(key=lambda candidate: candidate["score"], reverse=True)
+        return reranked
 
     def _rerank(self, query: str, candidates: list[dict]) -> list[dict]:
-        scores = self.reranker.score(query, [candidate["content"] for candidate in candidates])
-        for candidate, score in zip(candidates, scores, strict=True):
-            candidate["score"] = score
-            candidate["metadata"]["rerank_score"] = round(score, 6)
-        candidates.sort(key=lambda candidate: candidate["score"], reverse=True)
-        return candidates
+        with stage("rerank"):
+            scores = self.reranker.score(query, [candidate["content"] for candidate in candidates])
+        return self._apply_rerank_scores(candidates, scores)
 
-    def _maybe_rewrite(self, query: str, history: list[dict]) -> tuple[str, str]:
-        """Apply the configured rewrite policy; returns (query, reason)."""
+    def _rewrite_policy(self, query: str) -> str | None:
+        """Why the configured policy rewrites this query, or None to keep it."""
         mode = self.config.rewrite_mode
         if mode == "never":
-            return query, "none"
+            return None
         reason = rewrite_reason(query)
         if mode == "auto" and reason is None:
-            return query, "none"
+            return None
+        return reason or "always"
+
+    def _llm_rewrite(self, query: str, history: list[dict], reason: str) -> str:
         if reason == "anaphoric" and history:
-            return self.rewriter.condense(query, history), "anaphoric"
-        return self.rewriter.rewrite(query), reason or "always"
+            return self.rewriter.condense(query, history)
+        return self.rewriter.rewrite(query)
+
+    def _rewrite_with_tier(
+        self, query: str, history: list[dict], reason: str, tier: str | None = None
+    ) -> dict:
+        """Rewrite through the local and/or LLM tier: {query, tier, confidence}.
+
+        tier=None follows the config: the local tier first when local_rewrite
+        is enabled, the LLM only when its confidence is below
+        local_rewrite_min_confidence. "local" and "llm" force a single tier
+        (used by eval-retrieval to compare them).
+        """
+        if tier == "llm" or (tier is None and not self.config.local_rewrite):
+            return {"query": self._llm_rewrite(query, history, reason), "tier": "llm"}
+        local = self.local_rewriter.rewrite(query, history)
+        if tier == "local" or local.confidence >= self.config.local_rewrite_min_confidence:
+            return {"query": local.query, "tier": "local", "confidence": local.confidence}
+        return {
+            "query": self._llm_rewrite(query, history, reason),
+            "tier": "llm",
+            "confidence": local.confidence,
+        }
+
+    def _rewrite(self, query: str, history: list[dict], reason: str) -> str:
+        with stage("rewrite"):
+            return self._rewrite_with_tier(query, history, reason)["query"]
+
+    def rewrite_query(self, query: str, history: list[dict], *, tier: str | None = None) -> dict:
+        """Apply the rewrite policy alone; returns {query, reason, tier, confidence?}."""
+        reason = self._rewrite_policy(query)
+        if reason is None:
+            return {"query": query, "reason": "none", "tier": "none"}
+        return {"reason": reason, **self._rewrite_with_tier(query, history, reason, tier)}
+
+    def summarize_history(self, summary: str, messages: list[dict]) -> dict:
+        """Fold messages that left the history window into a session's running summary.
+
+        Returns {"summary", "timings", "usage"}; the LLM call is traced as the
+        "summary" stage.
+        """
+        with tracing() as trace, stage("summary"):
+            updated = self.rewriter.summarize(summary, messages)
+        return {"summary": updated, "timings": trace.as_dict(), "usage": trace.usage()}
+
+    def _maybe_rewrite(self, query: str, history: list[dict]) -> tuple[str, str]:
+        """Apply the configured rewrite policy; returns (query, reason)."""
+        reason = self._rewrite_policy(query)
+        if reason is None:
+            return query, "none"
+        return self._rewrite(query, history, reason), reason
+
+    @staticmethod
+    def _fuse_hits(hit_lists: list[list[dict]], k: int) -> list[dict]:
+        """RRF over several ranked hit lists of the same user, deduplicated by chunk id."""
+        rrf_scores = rrf_fuse([[hit["metadata"]["chunk_id"] for hit in hits] for hits in hit_lists])
+        by_id: dict[str, dict] = {}
+        for hits in hit_lists:
+            for hit in hits:
+                by_id.setdefault(hit["metadata"]["chunk_id"], hit)
+        fused = sorted(
+            by_id.values(), key=lambda hit: rrf_scores[hit["metadata"]["chunk_id"]], reverse=True
+        )
+        for hit in fused:
+            hit["metadata"]["speculative_rrf_score"] = round(
+                rrf_scores[hit["metadata"]["chunk_id"]], 6
+            )
+        return fused[:k]
+
+    def _start_speculative_rewrite(self, query: str, history: list[dict]) -> "_Speculation | None":
+        """Submit the rewrite in the background when the policy asks for one.
+
+        When every rewrite worker is already taken, nothing is submitted: the
+        rewrite would only start after the others, so it is skipped instead.
+        """
+        reason = self._rewrite_policy(query)
+        if reason is None:
+            return None
+        speculation = _Speculation(reason)
+        with self._rewrites_lock:
+            if self._rewrites_in_flight >= self.config.rewrite_workers:
+                return speculation
+            self._rewrites_in_flight += 1
+        speculation.submitted = time.perf_counter()
+        # copy_context(): the background rewrite records into the caller's trace.
+        speculation.future = self.rewrite_executor.submit(
+            contextvars.copy_context().run, self._rewrite, query, history, reason
+        )
+        speculation.future.add_done_callback(self._rewrite_done)
+        return speculation
+
+    def _rewrite_done(self, _future: Future) -> None:
+        with self._rewrites_lock:
+            self._rewrites_in_flight -= 1
+
+    def _finish_speculative_rewrite(
+        self,
+        speculation: "_Speculation",
+        query: str,
+        hits: list[dict],
+        *,
+        user_id: int,
+        k: int,
+        filters: MetadataFilter | None = None,
+    ) -> tuple[str, str, list[dict]]:
+        """Join the rewrite started before retrieval; returns (query, reason, hits).
+
+        A rewrite that misses rewrite_deadline_ms, counted from its
+        submission, is abandoned (reason "deadline") and the original hits are
+        kept; one skipped because the pool was full has reason "saturated".
+        Otherwise the rewritten query is retrieved too and both rankings are
+        fused with RRF.
+
+        A rewrite still queued at the deadline is cancelled before it costs
+        anything. One already running keeps running: its tokens count in the
+        call's usage if it returns before the answer is done, and are dropped
+        after.
+        """
+        if speculation.future is None:
+            return query, "saturated", hits
+        elapsed = time.perf_counter() - speculation.submitted
+        try:
+            rewritten = speculation.future.result(
+                timeout=max(0.0, self.config.rewrite_deadline_ms / 1000 - elapsed)
+            )
+        except FutureTimeoutError:
+            speculation.future.cancel()
+            return query, "deadline", hits
+        if rewritten.strip() == query.strip():
+            return query, speculation.reason, hits
+        rewritten_hits = self.retrieve(rewritten, user_id=user_id, top_k=k, filters=filters)
+        return rewritten, speculation.reason, self._fuse_hits([hits, rewritten_hits], k)
+
+    def _rewrite_and_retrieve(
+        self,
+        query: str,
+        history: list[dict],
+        *,
+        user_id: int,
+        k: int,
+        filters: MetadataFilter | None = None,
+    ) -> tuple[str, str, list[dict]]:
+        if self.config.speculative_rewrite:
+            speculation = self._start_speculative_rewrite(query, history)
+            hits = self.retrieve(query, user_id=user_id, top_k=k, filters=filters)
+            if speculation is None:
+                return query, "none", hits
+            return self._finish_speculative_rewrite(
+                speculation, query, hits, user_id=user_id, k=k, filters=filters
+            )
+        rewritten_query, reason = self._maybe_rewrite(query, history)
+        return (
+            rewritten_query,
+            reason,
+            self.retrieve(rewritten_query, user_id=user_id, top_k=k, filters=filters),
+        )
 
     @staticmethod
     def _build_source_entries(hits: list[dict], k: int) -> tuple[list[str], list[dict]]:
-        chunks = []
+        """(answer context, source entries); overlapping neighbours are merged in the context."""
         source_entries = []
         for hit in hits[: max(3, k)]:
             content = hit["content"]
             metadata = hit["metadata"]
             score = hit["score"]
-            chunks.append(content)
             confidence = min(1.0, max(0.0, score))
             entry = {
                 "source": metadata.get("source", "unknown"),
@@ -275,6 +1123,7 @@ class RAGPipeline:
                 if value:
                     entry[key] = value
             source_entries.append(entry)
+        chunks = [passage["content"] for passage in merge_overlapping_chunks(hits[: max(3, k)])]
         return chunks, source_entries
 
     def _below_rerank_threshold(self, hits: list[dict]) -> bool:
@@ -290,24 +1139,44 @@ class RAGPipeline:
         user_id: int,
         top_k: int | None = None,
         history: list[dict] | None = None,
+        filters: MetadataFilter | None = None,
     ) -> dict:
-        vectorstore = self._load_vectorstore()
-        if self._collection_count(vectorstore) == 0:
+        """Rewrite, retrieve (within filters, if any) and answer.
+
+        "timings" holds milliseconds per stage, "usage" LLM tokens per stage and model.
+        """
+        with tracing() as trace:
+            result = self._query(
+                query, user_id=user_id, top_k=top_k, history=history, filters=filters
+            )
+        result["timings"] = trace.as_dict()
+        result["usage"] = trace.usage()
+        return result
+
+    def _query(
+        self,
+        query: str,
+        *,
+        user_id: int,
+        top_k: int | None,
+        history: list[dict] | None,
+        filters: MetadataFilter | None = None,
+    ) -> dict:
+        if self.is_empty():
             return {
-                "answer": (
-                    "Knowledge base is empty. Upload documents or sync Notion to get started."
-                ),
+                "answer": EMPTY_KNOWLEDGE_BASE_ANSWER,
                 "sources": [],
                 "query_original": query,
             }
 
-        rewritten_query, reason = self._maybe_rewrite(query, history or [])
         k = top_k or self.config.final_k
-        hits = self.retrieve(rewritten_query, user_id=user_id, top_k=k)
+        rewritten_query, reason, hits = self._rewrite_and_retrieve(
+            query, history or [], user_id=user_id, k=k, filters=filters
+        )
 
         if not hits:
             return {
-                "answer": "No relevant documents were found for the query.",
+                "answer": NO_HITS_ANSWER,
                 "sources": [],
                 "query_original": query,
                 "query_rewritten": rewritten_query,
@@ -320,16 +1189,15 @@ class RAGPipeline:
         # score: if no chunk clears it, the pipeline says it found nothing.
         if self._below_rerank_threshold(hits):
             return {
-                "answer": (
-                    "Retrieved notes do not appear relevant. Refine the query or add documents."
-                ),
+                "answer": NOT_RELEVANT_ANSWER,
                 "sources": source_entries[:3],
                 "query_original": query,
                 "query_rewritten": rewritten_query,
                 "rewrite_reason": reason,
             }
 
-        answer = self.answerer.generate(rewritten_query, chunks)
+        with stage("generation"):
+            answer = self.answerer.generate(rewritten_query, chunks)
         return {
             "answer": answer,
             "sources": source_entries[:3],
@@ -338,32 +1206,53 @@ class RAGPipeline:
             "rewrite_reason": reason,
         }
 
-    def stream_query(
+    def _stream_sources(
         self,
         query: str,
         *,
         user_id: int,
-        top_k: int | None = None,
-        history: list[dict] | None = None,
+        k: int,
+        history: list[dict],
+        filters: MetadataFilter | None = None,
     ):
-        """Streaming variant of query(): yields 'sources' then 'delta' events.
+        """Head shared by the streaming paths: yields the 'sources' events.
 
-        Events: {"type": "sources", "sources", "query_rewritten",
-        "rewrite_reason"} as soon as retrieval is done, then one
-        {"type": "delta", "text"} per answer fragment.
+        Returns (answer_query, chunks, fallback_text, refined); when
+        fallback_text is set it is the whole answer and no LLM call must be
+        made. refined, with early generation, is a Future of the reranked
+        'sources' event to send while the answer streams.
         """
-        vectorstore = self._load_vectorstore()
-        if self._collection_count(vectorstore) == 0:
+        if self.is_empty():
             yield {"type": "sources", "sources": [], "query_rewritten": None}
-            yield {
-                "type": "delta",
-                "text": "Knowledge base is empty. Upload documents or sync Notion to get started.",
-            }
-            return
+            return query, [], EMPTY_KNOWLEDGE_BASE_ANSWER, None
+        if self._early_generation():
+            return (
+                yield from self._early_stream_sources(
+                    query, user_id=user_id, k=k, history=history, filters=filters
+                )
+            )
 
-        rewritten_query, reason = self._maybe_rewrite(query, history or [])
-        k = top_k or self.config.final_k
-        hits = self.retrieve(rewritten_query, user_id=user_id, top_k=k)
+        speculation = None
+        if self.config.speculative_rewrite:
+            speculation = self._start_speculative_rewrite(query, history)
+        if speculation is not None:
+            hits = self.retrieve(query, user_id=user_id, top_k=k, filters=filters)
+            if speculation.future is not None:
+                _, provisional_entries = self._build_source_entries(hits, k)
+                yield {
+                    "type": "sources",
+                    "sources": provisional_entries[:3],
+                    "query_rewritten": None,
+                    "rewrite_reason": speculation.reason,
+                    "provisional": True,
+                }
+            rewritten_query, reason, hits = self._finish_speculative_rewrite(
+                speculation, query, hits, user_id=user_id, k=k, filters=filters
+            )
+        else:
+            rewritten_query, reason, hits = self._rewrite_and_retrieve(
+                query, history, user_id=user_id, k=k, filters=filters
+            )
         chunks, source_entries = self._build_source_entries(hits, k)
 
         yield {
@@ -374,22 +1263,167 @@ class RAGPipeline:
         }
 
         if not hits:
-            yield {"type": "delta", "text": "No relevant documents were found for the query."}
-            return
+            return rewritten_query, [], NO_HITS_ANSWER, None
         if self._below_rerank_threshold(hits):
-            yield {
-                "type": "delta",
-                "text": (
-                    "Retrieved notes do not appear relevant. Refine the query or add documents."
-                ),
-            }
-            return
+            return rewritten_query, [], NOT_RELEVANT_ANSWER, None
+        return rewritten_query, chunks, None, None
 
-        yield from (
-            {"type": "delta", "text": text}
-            for text in self.answerer.generate_stream(rewritten_query, chunks)
+    def _early_generation(self) -> bool:
+        # Without threshold gating the rerank cannot turn the answer into a
+        # refusal, so the LLM does not have to wait for it.
+        return (
+            self.config.early_generation
+            and self.config.rerank_enabled
+            and self.config.rerank_threshold <= 0
+            and not self.config.speculative_rewrite
+            and self._client is None
         )
 
+    def _early_stream_sources(
+        self,
+        query: str,
+        *,
+        user_id: int,
+        k: int,
+        history: list[dict],
+        filters: MetadataFilter | None = None,
+    ):
+        """_stream_sources() answering from the first-stage hits; they are reranked meanwhile."""
+        rewritten_query, reason = self._maybe_rewrite(query, history)
+        with self._reading([user_id]):
+            candidates = self._candidates(rewritten_query, user_id, k, filters=filters)
+            # The pool retrieve() reranks: the refined sources are what it returns.
+            pool = self._hydrate(candidates[: self._pool_size(k)], user_id)
+        hits = self._select(pool, user_id, k)
+        # The background rerank scores the child chunks; only the answer gets sections.
+        chunks, source_entries = self._build_source_entries(self._expand_parents(hits), k)
+        yield {
+            "type": "sources",
+            "sources": source_entries[:3],
+            "query_rewritten": rewritten_query,
+            "rewrite_reason": reason,
+            "provisional": True,
+        }
+        if not hits:
+            return rewritten_query, [], NO_HITS_ANSWER, None
+        refined = self.rerank_executor.submit(
+            contextvars.copy_context().run,
+            self._reranked_sources_event,
+            rewritten_query,
+            user_id,
+            pool,
+            k,
+            reason,
+        )
+        return rewritten_query, chunks, None, refined
+
+    def _reranked_sources_event(
+        self, query: str, user_id: int, pool: list[dict], k: int, reason: str
+    ) -> dict:
+        """The sources retrieve() would return: the whole pool reranked, then selected."""
+        hits = self._select(self._rerank(query, pool), user_id, k)
+        _, source_entries = self._build_source_entries(self._expand_parents(hits), k)
+        return {
+            "type": "sources",
+            "sources": source_entries[:3],
+            "query_rewritten": query,
+            "rewrite_reason": reason,
+        }
+
+    def stream_query(
+        self,
+        query: str,
+        *,
+        user_id: int,
+        top_k: int | None = None,
+        history: list[dict] | None = None,
+        filters: MetadataFilter | None = None,
+    ):
+        """Streaming variant of query(): yields 'sources' then 'delta' events.
+
+        Events: {"type": "sources", "sources", "query_rewritten",
+        "rewrite_reason"} as soon as retrieval is done, then one
+        {"type": "delta", "text"} per answer fragment. In speculative mode a
+        first 'sources' event with "provisional": True is sent from the
+        original query before the rewrite returns; the final one follows once
+        the rewrite is joined (or abandoned at its deadline). With early
+        generation the answer starts from a provisional 'sources' event and
+        the reranked one arrives between deltas. A last
+        {"type": "timings", "timings", "usage"} event carries milliseconds per
+        stage and LLM tokens per stage and model.
+        """
+        with tracing() as trace:
+            answer_query, chunks, fallback, refined = yield from self._stream_sources(
+                query,
+                user_id=user_id,
+                k=top_k or self.config.final_k,
+                history=history or [],
+                filters=filters,
+            )
+            if fallback:
+                yield {"type": "delta", "text": fallback}
+            else:
+                with stage("generation"):
+                    for text in self.answerer.generate_stream(answer_query, chunks):
+                        yield {"type": "delta", "text": text}
+                        if refined is not None and refined.done():
+                            yield refined.result()
+                            refined = None
+            if refined is not None:
+                yield refined.result()
+        yield {"type": "timings", "timings": trace.as_dict(), "usage": trace.usage()}
+
+    async def astream_query(
+        self,
+        query: str,
+        *,
+        user_id: int,
+        top_k: int | None = None,
+        history: list[dict] | None = None,
+        filters: MetadataFilter | None = None,
+    ):
+        """Async counterpart of stream_query(), same events, for the ASGI path.
+
+        Rewrite, embedding, search and rerank are blocking: each step of the
+        shared head runs in a worker thread, so the event loop only waits on
+        the LLM's async stream and can hold many concurrent answers.
+        """
+        with tracing() as trace:
+            head = self._stream_sources(
+                query,
+                user_id=user_id,
+                k=top_k or self.config.final_k,
+                history=history or [],
+                filters=filters,
+            )
+            while True:
+                # to_thread() copies the context: the head records into this trace.
+                finished, value = await asyncio.to_thread(_advance, head)
+                if finished:
+                    answer_query, chunks, fallback, refined = value
+                    break
+                yield value
+            if fallback:
+                yield {"type": "delta", "text": fallback}
+            else:
+                with stage("generation"):
+                    async for text in self.answerer.agenerate_stream(answer_query, chunks):
+                        yield {"type": "delta", "text": text}
+                        if refined is not None and refined.done():
+                            yield refined.result()
+                            refined = None
+            if refined is not None:
+                yield await asyncio.wrap_future(refined)
+        yield {"type": "timings", "timings": trace.as_dict(), "usage": trace.usage()}
+
+
+def _advance(generator) -> tuple[bool, object]:
+    """next() that reports exhaustion as a value: StopIteration cannot cross a Future."""
+    try:
+        return False, next(generator)
+    except StopIteration as stop:
+        return True, stop.value
+
 
 _pipeline: RAGPipeline | None = None
 
@@ -397,5 +1431,10 @@ _pipeline: RAGPipeline | None = None
 def get_pipeline(persist_directory: str, top_k: int = 4) -> RAGPipeline:
     global _pipeline
     if _pipeline is None:
-        _pipeline = RAGPipeline(persist_directory=persist_directory, top_k=top_k)
+        _pipeline = RAGPipeline(
+            persist_directory=persist_directory,
+            top_k=top_k,
+            retrieval_socket=RETRIEVAL_SERVICE_SOCKET,
+        )
+        registry.gauge_function("rag_bm25_cache_users", _pipeline.bm25_cache_size)
     return _pipeline
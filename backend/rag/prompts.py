@@ -13,6 +13,21 @@ Follow-up question:
 Self-contained question:
 """
 
+SUMMARY_PROMPT = """
+Update the running summary of a conversation between a user and an assistant
+answering from the user's notes, with the new messages below. Keep the topics,
+entities, note titles and conclusions a later follow-up question could refer
+to, in the language of the conversation. At most 120 words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:
+"""
+
 REWRITE_PROMPT = """
 Rewrite the following user query into a clearer, more specific question that would help an assistant
 answer using notes. Keep it short and on-point.
@@ -23,15 +38,22 @@ Original query:
 Rewritten question:
 """
 
-ANSWER_PROMPT = """
+# The answer request is split so the provider can cache its stable prefix: the
+# system block never changes between turns, and the retrieved context is often
+# resent unchanged by a follow-up turn on the same notes. Only the question
+# comes after the cacheable prefix.
+ANSWER_SYSTEM_PROMPT = """
 You are an assistant that MUST use only the provided context to answer the user's question.
 If the context does not contain the answer, say "I don't know based on the provided notes."
+Answer concisely and prefer structured bullet points or tables when it improves clarity.
+"""
 
-User question:
-{question}
-
+ANSWER_CONTEXT_PROMPT = """
 Context (retrieved notes):
 {context}
+"""
 
-Answer concisely and prefer structured bullet points or tables when it improves clarity.
+ANSWER_QUESTION_PROMPT = """
+User question:
+{question}
 """
@@ -19,7 +19,21 @@ class Reranker:
             self._model = CrossEncoder(self.model_name)
         return self._model
 
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
     def score(self, query: str, texts: list[str]) -> list[float]:
         """Sigmoid-normalized relevance scores in [0, 1], one per text."""
-        raw = self.model.predict([(query, text) for text in texts])
-        return [1.0 / (1.0 + math.exp(-float(score))) for score in raw]
+        return self.score_batch([(query, texts)])[0]
+
+    def score_batch(self, batch: list[tuple[str, list[str]]]) -> list[list[float]]:
+        """score() for several (query, texts) pairs in a single forward pass."""
+        pairs = [(query, text) for query, texts in batch for text in texts]
+        raw = self.model.predict(pairs) if pairs else []
+        flat = [1.0 / (1.0 + math.exp(-float(score))) for score in raw]
+        scores, start = [], 0
+        for _, texts in batch:
+            scores.append(flat[start : start + len(texts)])
+            start += len(texts)
+        return scores
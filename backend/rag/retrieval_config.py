@@ -2,6 +2,20 @@ import os
 from dataclasses import dataclass
 
 REWRITE_MODES = ("always", "auto", "never")
+# Rewrite tiers that eval-retrieval can force ("tiered" = local, then LLM).
+REWRITE_TIERS = ("local", "llm", "tiered")
+# Vector store layouts: one collection for everyone (filtered by user_id), one
+# collection per user, or users hashed onto a fixed number of shards.
+PARTITIONING_MODES = ("global", "user", "hash")
+# Dense search: Chroma's HNSW index, or brute force over a per-user matrix
+# (exact_search) for users with at most exact_max_chunks chunks.
+DENSE_BACKENDS = ("chroma", "exact")
+# First pass of the exact backend over quantized codes, rescored in float32.
+DENSE_QUANTIZATIONS = ("none", "binary", "int8")
+# Hybrid fusion of the dense and BM25 lists (see fusion).
+FUSION_MODES = ("rrf", "minmax", "zscore", "dbsf")
+# Final selection: plain top k, maximal marginal relevance, or a per-note cap.
+DIVERSITY_MODES = ("none", "mmr", "note_cap")
 
 
 def _env_bool(name: str, default: bool) -> bool:
@@ -35,10 +49,84 @@ class RetrievalConfig:
     rerank_threshold: float = 0.3
     # Number of past chat messages passed to query() as history.
     history_window: int = 6
+    # Fold the messages older than the window into a per-session running
+    # summary (one background LLM call per turn once the session outgrows
+    # the window), passed ahead of the window as history.
+    history_summary: bool = False
+    # Retrieve with the original query while the rewrite is in flight, then
+    # fuse with the rewritten query's hits; a rewrite slower than the
+    # deadline (from submission) is abandoned, and none is submitted while
+    # every rewrite worker is busy.
+    speculative_rewrite: bool = False
+    rewrite_deadline_ms: int = 1500
+    # Threads running speculative rewrites, per process.
+    rewrite_workers: int = 8
+    # Heuristic rewrite of follow-ups (source titles, carried-over entities)
+    # tried before the LLM; the LLM is only called below this confidence.
+    local_rewrite: bool = False
+    local_rewrite_min_confidence: float = 0.6
+    # Streaming only, with reranking on and threshold gating off
+    # (rerank_threshold <= 0): start the answer from the first-stage hits and
+    # rerank them meanwhile; the reranked sources follow in a later event.
+    early_generation: bool = False
+    # Threads running the early-generation background reranks, per process.
+    rerank_workers: int = 4
+    # Which Chroma collection holds a user's chunks (see partitioning); after
+    # a change, `flask rag partition-store` moves the existing chunks.
+    partitioning: str = "global"
+    partition_shards: int = 16
+    dense_backend: str = "chroma"
+    exact_max_chunks: int = 20000
+    # Exact backend only: scan binary or int8 codes first, then rescore the
+    # best final k * quantization_oversample rows with the float32 vectors.
+    dense_quantization: str = "none"
+    quantization_oversample: int = 10
+    # Small-to-big: ingestion indexes small child chunks of each section, and
+    # the final hits are expanded to their sections for the answer. Search,
+    # BM25 and reranking only see the children. Existing notes keep their
+    # chunks until re-ingested.
+    small_to_big: bool = False
+    # Hybrid mode: rank-based RRF, or a convex combination of normalized
+    # scores. fusion_dense_weight is the dense list's share (BM25 gets the
+    # rest); with RRF, 0.5 weighs both lists equally.
+    fusion: str = "rrf"
+    fusion_dense_weight: float = 0.5
+    rrf_k: int = 60
+    # Final selection after fusion and rerank (see diversity): plain top k,
+    # maximal marginal relevance over the chunk embeddings, or at most
+    # max_chunks_per_note chunks of one note. Either widens the hydrated pool
+    # to candidate_k.
+    diversity: str = "none"
+    mmr_lambda: float = 0.7
+    max_chunks_per_note: int = 2
 
     def __post_init__(self):
         if self.rewrite_mode not in REWRITE_MODES:
             raise ValueError(f"rewrite_mode must be one of {REWRITE_MODES}")
+        if self.partitioning not in PARTITIONING_MODES:
+            raise ValueError(f"partitioning must be one of {PARTITIONING_MODES}")
+        if self.rewrite_workers < 1:
+            raise ValueError("rewrite_workers must be at least 1")
+        if self.rerank_workers < 1:
+            raise ValueError("rerank_workers must be at least 1")
+        if self.partition_shards < 1:
+            raise ValueError("partition_shards must be at least 1")
+        if self.dense_backend not in DENSE_BACKENDS:
+            raise ValueError(f"dense_backend must be one of {DENSE_BACKENDS}")
+        if self.dense_quantization not in DENSE_QUANTIZATIONS:
+            raise ValueError(f"dense_quantization must be one of {DENSE_QUANTIZATIONS}")
+        if self.fusion not in FUSION_MODES:
+            raise ValueError(f"fusion must be one of {FUSION_MODES}")
+        if not 0.0 <= self.fusion_dense_weight <= 1.0:
+            raise ValueError("fusion_dense_weight must be between 0 and 1")
+        if self.rrf_k < 1:
+            raise ValueError("rrf_k must be at least 1")
+        if self.diversity not in DIVERSITY_MODES:
+            raise ValueError(f"diversity must be one of {DIVERSITY_MODES}")
+        if not 0.0 <= self.mmr_lambda <= 1.0:
+            raise ValueError("mmr_lambda must be between 0 and 1")
+        if self.max_chunks_per_note < 1:
+            raise ValueError("max_chunks_per_note must be at least 1")
 
     @classmethod
     def from_env(cls) -> "RetrievalConfig":
@@ -50,4 +138,31 @@ class RetrievalConfig:
             final_k=_env_int("RETRIEVAL_FINAL_K", cls.final_k),
             rerank_threshold=_env_float("RERANK_THRESHOLD", cls.rerank_threshold),
             history_window=_env_int("CHAT_HISTORY_WINDOW", cls.history_window),
+            history_summary=_env_bool("CHAT_HISTORY_SUMMARY", cls.history_summary),
+            speculative_rewrite=_env_bool("REWRITE_SPECULATIVE", cls.speculative_rewrite),
+            rewrite_deadline_ms=_env_int("REWRITE_DEADLINE_MS", cls.rewrite_deadline_ms),
+            rewrite_workers=_env_int("REWRITE_WORKERS", cls.rewrite_workers),
+            local_rewrite=_env_bool("REWRITE_LOCAL", cls.local_rewrite),
+            local_rewrite_min_confidence=_env_float(
+                "REWRITE_LOCAL_MIN_CONFIDENCE", cls.local_rewrite_min_confidence
+            ),
+            early_generation=_env_bool("RERANK_EARLY_GENERATION", cls.early_generation),
+            rerank_workers=_env_int("RERANK_WORKERS", cls.rerank_workers),
+            partitioning=os.getenv("VECTOR_STORE_PARTITIONING", cls.partitioning),
+            partition_shards=_env_int("VECTOR_STORE_SHARDS", cls.partition_shards),
+            dense_backend=os.getenv("DENSE_BACKEND", cls.dense_backend),
+            exact_max_chunks=_env_int("EXACT_SEARCH_MAX_CHUNKS", cls.exact_max_chunks),
+            dense_quantization=os.getenv("DENSE_QUANTIZATION", cls.dense_quantization),
+            quantization_oversample=_env_int(
+                "DENSE_QUANTIZATION_OVERSAMPLE", cls.quantization_oversample
+            ),
+            small_to_big=_env_bool("RETRIEVAL_SMALL_TO_BIG", cls.small_to_big),
+            fusion=os.getenv("RETRIEVAL_FUSION", cls.fusion),
+            fusion_dense_weight=_env_float(
+                "RETRIEVAL_FUSION_DENSE_WEIGHT", cls.fusion_dense_weight
+            ),
+            rrf_k=_env_int("RETRIEVAL_RRF_K", cls.rrf_k),
+            diversity=os.getenv("RETRIEVAL_DIVERSITY", cls.diversity),
+            mmr_lambda=_env_float("RETRIEVAL_MMR_LAMBDA", cls.mmr_lambda),
+            max_chunks_per_note=_env_int("RETRIEVAL_MAX_CHUNKS_PER_NOTE", cls.max_chunks_per_note),
         )
@@ -0,0 +1,268 @@
+"""Out-of-process retrieval: one process owns the models, web workers are thin clients.
+
+    flask rag serve-retrieval --socket /run/rag/retrieval.sock
+    RETRIEVAL_SERVICE_SOCKET=/run/rag/retrieval.sock gunicorn ...
+
+With RETRIEVAL_SERVICE_SOCKET set, get_pipeline() builds a pipeline that
+forwards retrieval, ingestion and deletion to this service and never loads
+the embedding model, the cross-encoder or Chroma itself. Concurrent retrieve
+requests from every worker are held for up to batch_window_ms and served by
+one RAGPipeline.retrieve_batch() call: one embedding forward pass and one
+cross-encoder forward pass per batch. Up to `workers` batches run at once, so
+a slow batch does not hold up the requests that arrive behind it.
+
+Wire format, both directions: a 4-byte big-endian length, then a UTF-8 JSON
+object. Requests carry an "op"; responses are {"ok": true, "result": ...}
+or {"ok": false, "error": "..."}.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from .filters import MetadataFilter
+from .tracing import StageTrace, current_trace
+
+_HEADER = struct.Struct(">I")
+
+# How long the first request of a batch waits for others to join it.
+BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+MAX_BATCH = int(os.getenv("RETRIEVAL_MAX_BATCH", "32"))
+# Batches served concurrently; requests queue up into the next batch meanwhile.
+WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+
+
+class RetrievalServiceError(RuntimeError):
+    """The retrieval service could not be reached or answered with an error."""
+
+
+def _encode(payload: dict) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by the retrieval service")
+        data += chunk
+    return data
+
+
+class RetrievalClient:
+    """Blocking client, one connection per call: safe to share between threads."""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _call(self, op: str, **params):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(_encode({"op": op, **params}))
+                (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+                response = json.loads(_recv_exactly(sock, size))
+        except OSError as err:
+            raise RetrievalServiceError(
+                f"retrieval service unreachable at {self.socket_path}: {err}"
+            ) from err
+        if not response.get("ok"):
+            raise RetrievalServiceError(response.get("error", "unknown error"))
+        return response.get("result")
+
+    def is_empty(self) -> bool:
+        return self._call("is_empty")
+
+    def retrieve(
+        self,
+        query: str,
+        *,
+        user_id: int,
+        top_k: int | None = None,
+        filters: MetadataFilter | None = None,
+    ) -> list[dict]:
+        """Remote retrieve(); the service's stages go into the caller's trace, if any."""
+        trace = current_trace()
+        result = self._call(
+            "retrieve",
+            query=query,
+            user_id=user_id,
+            top_k=top_k,
+            filters=None if filters is None else filters.as_dict(),
+            trace=trace is not None,
+        )
+        if trace is not None:
+            for name, duration_ms in result["stages"].items():
+                trace.add(name, duration_ms)
+        return result["hits"]
+
+    def ingest(
+        self,
+        docs: list[Document],
+        ids: list[str] | None = None,
+        parents: dict[str, str] | None = None,
+    ) -> int:
+        return self._call(
+            "ingest",
+            docs=[{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+            ids=ids,
+            parents=parents,
+        )
+
+    def delete(self, chunk_ids: list[str], user_id: int | None = None) -> None:
+        self._call("delete", chunk_ids=list(chunk_ids), user_id=user_id)
+
+
+class RetrievalServer:
+    """Serves a local RAGPipeline on a Unix socket, batching retrieve requests."""
+
+    def __init__(
+        self,
+        pipeline,
+        socket_path: str,
+        *,
+        batch_window_ms: float = BATCH_WINDOW_MS,
+        max_batch: int = MAX_BATCH,
+        workers: int = WORKERS,
+    ):
+        self.pipeline = pipeline
+        self.socket_path = socket_path
+        self.batch_window_ms = batch_window_ms
+        self.max_batch = max_batch
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._queue: asyncio.Queue | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: asyncio.Event | None = None
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        # A batch is only collected once a worker can take it: while all are
+        # busy, arriving requests wait in the queue and join the next batch.
+        slots = asyncio.Semaphore(self.workers)
+        running = set()
+        while True:
+            await slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window_ms / 1000
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(batch))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, batch: list) -> None:
+        requests = [request for request, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.pipeline.retrieve_batch, requests
+            )
+        except Exception as err:  # noqa: BLE001 - reported to every waiting client
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        for (_, future), hits in zip(batch, results, strict=True):
+            if not future.done():
+                future.set_result(hits)
+
+    async def _dispatch(self, request: dict):
+        op = request.get("op")
+        if op == "retrieve":
+            future = asyncio.get_running_loop().create_future()
+            trace = StageTrace() if request.get("trace") else None
+            await self._queue.put(
+                (
+                    {
+                        "query": request["query"],
+                        "user_id": request["user_id"],
+                        "top_k": request.get("top_k"),
+                        "filters": MetadataFilter.from_dict(request.get("filters")),
+                        "trace": trace,
+                    },
+                    future,
+                )
+            )
+            hits = await future
+            return {"hits": hits, "stages": {} if trace is None else trace.as_dict()}
+        if op == "is_empty":
+            return await asyncio.to_thread(self.pipeline.is_empty)
+        if op == "ingest":
+            docs = [
+                Document(page_content=doc["page_content"], metadata=doc["metadata"])
+                for doc in request["docs"]
+            ]
+            return await asyncio.to_thread(
+                self.pipeline.ingest_documents, docs, request.get("ids"), request.get("parents")
+            )
+        if op == "delete":
+            await asyncio.to_thread(
+                self.pipeline.delete_chunks, request["chunk_ids"], request.get("user_id")
+            )
+            return None
+        raise ValueError(f"unknown op {op!r}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                    request = json.loads(await reader.readexactly(size))
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    response = {"ok": True, "result": await self._dispatch(request)}
+                except Exception as err:  # noqa: BLE001 - sent back to the client
+                    response = {"ok": False, "error": f"{type(err).__name__}: {err}"}
+                writer.write(_encode(response))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, ready: threading.Event | None = None) -> None:
+        """Serve until close(); sets `ready` once the socket accepts connections."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stop = asyncio.Event()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="rag-retrieval"
+        )
+        batcher = asyncio.create_task(self._batch_loop())
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        try:
+            async with server:
+                if ready is not None:
+                    ready.set()
+                await self._stop.wait()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def close(self) -> None:
+        """Stop serve(); callable from any thread."""
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
@@ -1,10 +1,10 @@
 import re
+from dataclasses import dataclass, field
 
 from dotenv import find_dotenv, load_dotenv
-from langchain.chat_models import init_chat_model
 from pydantic import BaseModel, Field
 
-from .prompts import CONDENSE_PROMPT, REWRITE_PROMPT
+from .prompts import CONDENSE_PROMPT, REWRITE_PROMPT, SUMMARY_PROMPT
 
 load_dotenv(find_dotenv())
 
@@ -38,12 +38,119 @@ def rewrite_reason(question: str) -> str | None:
     return None
 
 
+# Capitalized words, acronyms, words with digits and quoted spans: the tokens
+# of a previous turn most likely to name the entity a follow-up refers to.
+_ENTITY_RE = re.compile(r"\"([^\"]{2,60})\"|«\s*([^»]{2,60}?)\s*»|\b([A-ZÀ-Ý][\w-]+|\w*\d\w*)\b")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?:;\n])\s+")
+
+# Maximum number of expansion terms appended to the question.
+MAX_LOCAL_TERMS = 8
+
+
+@dataclass
+class LocalRewrite:
+    query: str
+    confidence: float
+    terms: list[str] = field(default_factory=list)
+
+
+def _last_message(history: list[dict], role: str) -> dict | None:
+    return next((msg for msg in reversed(history) if msg.get("role") == role), None)
+
+
+def _source_terms(message: dict | None) -> tuple[list[str], list[str]]:
+    """(distinct note titles, heading path segments) cited by an assistant turn."""
+    titles: list[str] = []
+    headings: list[str] = []
+    for source in (message or {}).get("sources") or []:
+        title = source.get("note_title") or (source.get("metadata") or {}).get("note_title")
+        if title and title not in titles:
+            titles.append(title)
+        heading_path = source.get("heading_path") or ""
+        for segment in heading_path.split(" > "):
+            segment = segment.strip()
+            if segment and segment not in headings:
+                headings.append(segment)
+    return titles, headings
+
+
+def _mentions(question: str, terms: list[str]) -> bool:
+    """Whether the question names one of the terms, as whole words."""
+    return any(
+        re.search(rf"(?<!\w){re.escape(term)}(?!\w)", question, re.IGNORECASE) for term in terms
+    )
+
+
+def _entities(text: str) -> list[str]:
+    """Entity-like tokens of a message, skipping each sentence's first word."""
+    found: list[str] = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        first_word = re.match(r"\W*(\w[\w-]*)", sentence)
+        for match in _ENTITY_RE.finditer(sentence):
+            entity = next(group for group in match.groups() if group)
+            if match.group(3) and first_word and match.start(3) == first_word.start(1):
+                continue
+            if entity not in found:
+                found.append(entity)
+    return found
+
+
+class LocalRewriter:
+    """LLM-free rewrite tier for follow-ups, tried before QueryRewriter.
+
+    The question is expanded with the note titles and heading segments cited
+    by the last assistant turn, plus entities carried over from the last user
+    turn. Confidence reflects how unambiguous the referent is: one cited note
+    is a strong signal, several notes or bare entities are weaker, and nothing
+    to expand with gives 0.0 so the caller falls back to the LLM tier.
+
+    Only follow-ups are expanded: the question must contain a pronoun or
+    follow-up marker, or name something from the last turn. A short new
+    question ("What is Docker?") gets 0.0 instead of the previous note's title.
+    """
+
+    def rewrite(self, question: str, history: list[dict]) -> LocalRewrite:
+        titles, headings = _source_terms(_last_message(history, "assistant"))
+        last_user = _last_message(history, "user")
+        entities = _entities(last_user["content"]) if last_user else []
+        if not _ANAPHORIC_RE.search(question) and not _mentions(
+            question, [*titles, *headings, *entities]
+        ):
+            return LocalRewrite(query=question, confidence=0.0)
+
+        present = question.lower()
+        terms: list[str] = []
+        for term in [*titles, *headings, *entities]:
+            if term.lower() not in present and term.lower() not in (t.lower() for t in terms):
+                terms.append(term)
+        terms = terms[:MAX_LOCAL_TERMS]
+        if not terms:
+            return LocalRewrite(query=question, confidence=0.0)
+
+        confidence = 0.0
+        if titles:
+            confidence += 0.6 if len(titles) == 1 else 0.3
+        if entities:
+            confidence += 0.3
+        return LocalRewrite(
+            query=f"{question.strip()} {' '.join(terms)}",
+            confidence=round(min(1.0, confidence), 2),
+            terms=terms,
+        )
+
+
 class RewrittenQuestion(BaseModel):
     rewritten: str = Field(description="A clearer, more specific question")
 
 
+class RunningSummary(BaseModel):
+    summary: str = Field(description="The updated conversation summary")
+
+
 class QueryRewriter:
     def __init__(self, model_name: str = DEFAULT_MODEL, temperature: float = 0.2):
+        from langchain.chat_models import init_chat_model
+
         self.llm = init_chat_model(model_name, model_provider="anthropic", temperature=temperature)
 
     def _invoke(self, prompt: str) -> str:
@@ -59,3 +166,12 @@ class QueryRewriter:
         """Fold an anaphoric follow-up + history into a standalone question."""
         transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
         return self._invoke(CONDENSE_PROMPT.format(history=transcript, question=question))
+
+    def summarize(self, summary: str, messages: list[dict]) -> str:
+        """Fold messages that left the history window into the running summary."""
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", messages=transcript)
+        response = self.llm.with_structured_output(RunningSummary).invoke(
+            [{"role": "user", "content": prompt}]
+        )
+        return response.summary.strip()
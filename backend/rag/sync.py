@@ -7,7 +7,7 @@ from uuid import uuid4
 from ..extensions import db
 from ..models import SyncedNote
 from .connectors import ObsidianConnector
-from .ingestion import chunk_markdown, hash_content
+from .ingestion import chunk_markdown, hash_content, split_sections
 from .pipeline import RAGPipeline
 
 
@@ -55,12 +55,15 @@ def sync_vault(
 
         metadata = {**doc.metadata, "user_id": user_id, "source": note_path}
         chunks = chunk_markdown(doc.content, metadata=metadata)
+        parents = None
+        if pipeline.config.small_to_big:
+            chunks, parents = split_sections(chunks)
         chunk_ids = [str(uuid4()) for _ in chunks]
 
         if record:
             pipeline.delete_chunks(record.chunk_ids or [], user_id=user_id)
         if chunks:
-            pipeline.ingest_documents(chunks, ids=chunk_ids)
+            pipeline.ingest_documents(chunks, ids=chunk_ids, parents=parents)
 
         if record:
             record.content_hash = content_hash
@@ -0,0 +1,133 @@
+"""Per-stage latency tracing for one pipeline call.
+
+query() and the streaming paths open a StageTrace; the stages below it
+(rewrite, embedding, dense_search, bm25, fusion, hydration, rerank,
+selection, generation) record
+into whichever trace is current, through a context variable, so no signature
+changes are needed and stages are free when nothing traces. Worker threads
+started with contextvars.copy_context() (or asyncio.to_thread) record into
+the same trace. LLM token usage of the calls made under a trace is collected
+the same way, by stage and model ("other" for calls outside any stage).
+The retrieval service records its stages per request and sends them back,
+so a traced call keeps them when retrieval runs out of process.
+"""
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .usage import usage_by_model
+
+try:
+    from langchain_core.callbacks import UsageMetadataCallbackHandler
+    from langchain_core.tracers.context import register_configure_hook
+except ImportError:  # pragma: no cover - older langchain-core
+    UsageMetadataCallbackHandler = None
+
+STAGES = (
+    "rewrite",
+    "embedding",
+    "dense_search",
+    "bm25",
+    "fusion",
+    "hydration",
+    "rerank",
+    "selection",
+    "generation",
+)
+
+
+class StageTrace:
+    def __init__(self):
+        self._durations: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._usage: dict[str, UsageMetadataCallbackHandler] = {}
+
+    def add(self, stage: str, duration_ms: float) -> None:
+        with self._lock:
+            self._durations[stage] = self._durations.get(stage, 0.0) + duration_ms
+
+    def as_dict(self) -> dict[str, float]:
+        """Milliseconds per stage, in pipeline order; repeated stages are summed."""
+        with self._lock:
+            ordered = sorted(
+                self._durations.items(),
+                key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES),
+            )
+            return {stage: round(duration, 2) for stage, duration in ordered}
+
+    def usage_handler(self, stage: str):
+        """Callback collecting the LLM usage of one stage (None without langchain support)."""
+        if UsageMetadataCallbackHandler is None:
+            return None
+        with self._lock:
+            handler = self._usage.get(stage)
+            if handler is None:
+                handler = self._usage[stage] = UsageMetadataCallbackHandler()
+            return handler
+
+    def usage(self) -> dict[str, dict[str, dict]]:
+        """LLM tokens of the calls made under this trace: {stage: {model: counts}}."""
+        with self._lock:
+            handlers = list(self._usage.items())
+        usage = {}
+        for stage, handler in handlers:
+            counts = usage_by_model(handler.usage_metadata)
+            if counts:
+                usage[stage] = counts
+        return usage
+
+
+_current: ContextVar[StageTrace | None] = ContextVar("rag_stage_trace", default=None)
+# One hook for the process: langchain hands the current trace's handler to every
+# chat model call. (get_usage_metadata_callback() registers a new hook per call.)
+_usage_handler: ContextVar = ContextVar("rag_llm_usage", default=None)
+if UsageMetadataCallbackHandler is not None:
+    register_configure_hook(_usage_handler, inheritable=True)
+
+
+def current_trace() -> StageTrace | None:
+    return _current.get()
+
+
+@contextmanager
+def tracing(trace: StageTrace | None = None) -> Iterator[StageTrace]:
+    """Make a fresh trace (or the given one) current for the enclosed pipeline call."""
+    if trace is None:
+        trace = StageTrace()
+    tokens = [
+        (_current, _current.set(trace)),
+        (_usage_handler, _usage_handler.set(trace.usage_handler("other"))),
+    ]
+    try:
+        yield trace
+    finally:
+        _reset(tokens)
+
+
+def _reset(tokens: list) -> None:
+    for var, token in reversed(tokens):
+        try:
+            var.reset(token)
+        except ValueError:
+            # A streaming generator finalized from another context (e.g.
+            # closed by the garbage collector): nothing to restore there.
+            var.set(None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block into the current trace, if any."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    tokens = [(_usage_handler, _usage_handler.set(trace.usage_handler(name)))]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, (time.perf_counter() - start) * 1000)
+        _reset(tokens)
@@ -0,0 +1,50 @@
+"""LLM token counts and their estimated cost, shared by serving and evals."""
+
+# USD per million tokens (input, output) - used for cost estimates only.
+PRICING_PER_MTOK = {
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-sonnet-4-6": (3.0, 15.0),
+}
+# Prompt-cache pricing relative to the base input price.
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+
+def usage_by_model(usage_metadata: dict) -> dict[str, dict]:
+    """Flatten langchain usage metadata ({model: UsageMetadata}) to token counts."""
+    usage = {}
+    for model, data in usage_metadata.items():
+        details = data.get("input_token_details") or {}
+        usage[model] = {
+            "input_tokens": data.get("input_tokens", 0),
+            "output_tokens": data.get("output_tokens", 0),
+            # Prompt-caching breakdown; both are included in input_tokens.
+            "cache_read_input_tokens": details.get("cache_read", 0) or 0,
+            "cache_creation_input_tokens": details.get("cache_creation", 0) or 0,
+        }
+    return usage
+
+
+def estimate_cost(usage: dict | None) -> float | None:
+    """USD for {model: token counts}; None when no model has a known price."""
+    if not usage:
+        return None
+    total = 0.0
+    priced = False
+    for model, data in usage.items():
+        for name, (price_in, price_out) in PRICING_PER_MTOK.items():
+            if name in model:
+                cache_read = data.get("cache_read_input_tokens", 0)
+                cache_write = data.get("cache_creation_input_tokens", 0)
+                uncached = data["input_tokens"] - cache_read - cache_write
+                total += uncached / 1e6 * price_in
+                total += cache_read / 1e6 * price_in * CACHE_READ_PRICE_FACTOR
+                total += cache_write / 1e6 * price_in * CACHE_WRITE_PRICE_FACTOR
+                total += data["output_tokens"] / 1e6 * price_out
+                priced = True
+    return round(total, 6) if priced else None
+
+
+def cached_input_tokens(usage: dict | None) -> int:
+    """Input tokens served from the provider prompt cache (the per-request saving)."""
+    return sum(data.get("cache_read_input_tokens", 0) for data in (usage or {}).values())
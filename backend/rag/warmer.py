@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func
+
+from ..extensions import db
+from ..models import UsageLog
+from .pipeline import RAGPipeline, get_pipeline
+
+_start_lock = threading.Lock()
+
+
+@dataclass
+class WarmupStatus:
+    state: str = "pending"  # pending | running | done | failed
+    users_total: int = 0
+    users_warmed: int = 0
+    duration_ms: float | None = None
+    error: str | None = None
+    pid: int = field(default_factory=os.getpid)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def most_active_users(limit: int, lookback_days: int) -> list[int]:
+    """User ids with the most UsageLog rows over the lookback window, busiest first."""
+    since = datetime.now(UTC) - timedelta(days=lookback_days)
+    rows = (
+        db.session.query(UsageLog.user_id, func.count(UsageLog.id).label("calls"))
+        .filter(UsageLog.created_at >= since)
+        .group_by(UsageLog.user_id)
+        .order_by(func.count(UsageLog.id).desc(), UsageLog.user_id)
+        .limit(limit)
+        .all()
+    )
+    return [row.user_id for row in rows]
+
+
+def warm_pipeline(app: Flask, pipeline: RAGPipeline, status: WarmupStatus) -> None:
+    """Load models, then prebuild per-user caches for the most active users."""
+    start = time.perf_counter()
+    status.state = "running"
+    try:
+        pipeline.warmup()
+        with app.app_context():
+            user_ids = most_active_users(
+                app.config["RAG_WARMER_TOP_USERS"], app.config["RAG_WARMER_LOOKBACK_DAYS"]
+            )
+        status.users_total = len(user_ids)
+        pipeline.is_empty()  # opens the vector store even when no user qualifies
+        for user_id in user_ids:
+            pipeline.warm_user(user_id)
+            status.users_warmed += 1
+        status.state = "done"
+    except Exception as err:  # noqa: BLE001 - surfaced by /api/health/ready
+        status.state = "failed"
+        status.error = f"{type(err).__name__}: {err}"
+    finally:
+        status.duration_ms = round((time.perf_counter() - start) * 1000, 2)
+
+
+def start_warmer(app: Flask, pipeline: RAGPipeline) -> threading.Thread | None:
+    """Run warm_pipeline() in a daemon thread; progress in app.extensions["rag_warmer"].
+
+    Once per process: None when this process already started one. A status
+    inherited through fork (gunicorn --preload) belongs to a thread that did
+    not survive it, so a forked worker starts its own.
+    """
+    with _start_lock:
+        current = app.extensions.get("rag_warmer")
+        if current is not None and current.pid == os.getpid():
+            return None
+        status = WarmupStatus()
+        app.extensions["rag_warmer"] = status
+    thread = threading.Thread(
+        target=warm_pipeline, args=(app, pipeline, status), name="rag-warmer", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def init_warmer(app: Flask) -> None:
+    """With RAG_WARMER, start the warmer on each process's first request.
+
+    Covers the WSGI entry point (flask run, gunicorn sync workers), which has
+    no startup hook after the fork; the readiness probe itself is enough to
+    start it. CLI commands serve no request and so never load the models.
+    """
+    if not app.config["RAG_WARMER"]:
+        return
+
+    @app.before_request
+    def _start_warmer():
+        start_warmer(
+            app,
+            get_pipeline(
+                persist_directory=app.config["VECTOR_STORE_FOLDER"], top_k=app.config["RAG_TOP_K"]
+            ),
+        )
@@ -4,12 +4,17 @@ auth_bp = Blueprint("auth", __name__, url_prefix="/api/auth")
 chat_bp = Blueprint("chat", __name__, url_prefix="/api/chat")
 docs_bp = Blueprint("documents", __name__, url_prefix="/api/documents")
 analytics_bp = Blueprint("analytics", __name__, url_prefix="/api/analytics")
+health_bp = Blueprint("health", __name__, url_prefix="/api/health")
+metrics_bp = Blueprint("metrics", __name__)
 
 
 def register_blueprints(app):
-    from . import analytics, auth, chat, documents  # noqa: F401
+    from . import analytics, auth, chat, documents, health, metrics  # noqa: F401
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(chat_bp)
     app.register_blueprint(docs_bp)
     app.register_blueprint(analytics_bp)
+    app.register_blueprint(health_bp)
+    if app.config["METRICS_ENABLED"]:
+        app.register_blueprint(metrics_bp)
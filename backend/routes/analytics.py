@@ -3,7 +3,14 @@ from datetime import UTC, datetime, timedelta
 from flask import jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
-from ..models import ChatMessage, ChatSession, UploadedDocument, UsageLog, calculate_usage_summary
+from ..models import (
+    ChatMessage,
+    ChatSession,
+    UploadedDocument,
+    calculate_token_summary,
+    calculate_usage_summary,
+    daily_calls,
+)
 from . import analytics_bp
 
 
@@ -20,27 +27,18 @@ def summary():
     )
     total_docs = UploadedDocument.query.filter_by(user_id=user_id).count()
 
-    last_7_days = datetime.now(UTC) - timedelta(days=7)
-    last_week_usage = (
-        UsageLog.query.filter(UsageLog.user_id == user_id, UsageLog.created_at >= last_7_days)
-        .order_by(UsageLog.created_at.desc())
-        .all()
-    )
-
-    daily_calls = {}
-    for entry in last_week_usage:
-        day = entry.created_at.strftime("%Y-%m-%d")
-        daily_calls.setdefault(day, 0)
-        daily_calls[day] += 1
+    # Today and the 6 days before it.
+    last_7_days = datetime.now(UTC).date() - timedelta(days=6)
 
     return jsonify(
         {
             "usage": usage,
+            "tokens": calculate_token_summary(user_id),
             "totals": {
                 "sessions": total_sessions,
                 "assistant_messages": total_messages,
                 "documents": total_docs,
             },
-            "last_7_days": daily_calls,
+            "last_7_days": daily_calls(user_id, last_7_days),
         }
     )
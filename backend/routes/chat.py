@@ -1,20 +1,168 @@
+import base64
 import json
 import time
+from datetime import datetime
 
 from flask import Response, current_app, jsonify, request, stream_with_context
 from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import defer, selectinload
 
+from ..background_tasks import submit_task
 from ..extensions import db, limiter
-from ..models import ChatMessage, ChatSession, UsageLog
+from ..metrics import record_query, record_stages
+from ..models import (
+    ChatMessage,
+    ChatSession,
+    ChatSummary,
+    UsageLog,
+    UsageStage,
+    UsageTokens,
+)
 from ..rag import get_pipeline
+from ..rag.filters import MetadataFilter
+from ..rag.usage import estimate_cost
+from ..usage_buffer import save_usage
 from . import chat_bp
 
+HISTORY_PAGE_SIZE = 20
+MESSAGES_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 
 def _public_sources(sources: list[dict] | None) -> list[dict]:
     """Sources as exposed over HTTP: full chunk content stays internal."""
     return [{k: v for k, v in src.items() if k != "content"} for src in sources or []]
 
 
+def _load_history(pipeline, session_id: int) -> list[dict]:
+    """Rewrite context of a turn: the session's last history_window messages.
+
+    Only those rows are read, through the (session_id, created_at) index, and
+    sources are loaded for the latest assistant turn alone (the one the local
+    rewriter expands from), so a turn costs the same however long the session.
+    With history_summary, the session's running summary comes first.
+    """
+    rows = (
+        ChatMessage.query.filter_by(session_id=session_id)
+        .options(defer(ChatMessage.sources))
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(pipeline.config.history_window)
+        .all()
+    )[::-1]
+    history = [{"role": msg.role, "content": msg.content} for msg in rows]
+    last_answer = next((i for i in reversed(range(len(rows))) if rows[i].role == "assistant"), None)
+    if last_answer is not None and rows[last_answer].sources:
+        history[last_answer]["sources"] = rows[last_answer].sources
+
+    if pipeline.config.history_summary:
+        summary = ChatSummary.query.filter_by(session_id=session_id).first()
+        if summary:
+            history.insert(0, {"role": "summary", "content": summary.content})
+    return history
+
+
+def _fold_history(pipeline, session_id: int) -> dict:
+    """Fold the messages that left the history window into the session summary.
+
+    Returns the fold's {"timings", "usage"}, empty when nothing was folded.
+    """
+    if not pipeline.config.history_summary:
+        return {}
+    oldest_in_window = (
+        db.session.query(ChatMessage.id)
+        .filter_by(session_id=session_id)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .offset(pipeline.config.history_window - 1)
+        .limit(1)
+        .scalar()
+    )
+    if oldest_in_window is None:
+        return {}
+    summary = ChatSummary.query.filter_by(session_id=session_id).first()
+    query = ChatMessage.query.filter(
+        ChatMessage.session_id == session_id, ChatMessage.id < oldest_in_window
+    )
+    if summary:
+        query = query.filter(ChatMessage.id > summary.last_message_id)
+    left = query.options(defer(ChatMessage.sources)).order_by(ChatMessage.id).all()
+    if not left:
+        return {}
+
+    folded = pipeline.summarize_history(
+        summary.content if summary else "",
+        [{"role": msg.role, "content": msg.content} for msg in left],
+    )
+    if summary is None:
+        summary = ChatSummary(session_id=session_id, content="", last_message_id=0)
+        db.session.add(summary)
+    summary.content = folded["summary"]
+    summary.last_message_id = left[-1].id
+    return folded
+
+
+def _fold_after_turn(pipeline, user_id: int, session_id: int, message_id: int) -> None:
+    """Queue the session's summary fold after a committed turn, off the request path.
+
+    The turn was answered with the summary already stored; the fold only
+    serves the next turns. Its LLM usage is logged as a "chat.summary" row.
+    """
+    if not pipeline.config.history_summary:
+        return
+
+    def fold():
+        start = time.perf_counter()
+        folded = _fold_history(pipeline, session_id)
+        if not folded:
+            return
+        message = db.session.get(ChatMessage, message_id)
+        latency_ms = (time.perf_counter() - start) * 1000
+        save_usage(
+            _usage_entry(
+                user_id, "chat.summary", latency_ms, folded["timings"], folded["usage"], message
+            )
+        )
+        db.session.commit()
+        record_stages(folded["timings"], folded["usage"])
+
+    submit_task(fold)
+
+
+def _usage_entry(
+    user_id: int,
+    endpoint: str,
+    latency_ms: float,
+    timings: dict[str, float] | None,
+    usage: dict[str, dict[str, dict]] | None = None,
+    message: ChatMessage | None = None,
+) -> UsageLog:
+    """Usage log row of a call, with its stage timings and LLM tokens ({stage: {model: counts}})."""
+    token_usage = [
+        UsageTokens(
+            stage=stage,
+            model=model,
+            chat_message_id=message.id if message else None,
+            cost_usd=estimate_cost({model: counts}),
+            **counts,
+        )
+        for stage, by_model in (usage or {}).items()
+        for model, counts in by_model.items()
+    ]
+    return UsageLog(
+        user_id=user_id,
+        endpoint=endpoint,
+        latency_ms=latency_ms,
+        tokens_used=sum(row.input_tokens + row.output_tokens for row in token_usage)
+        if token_usage
+        else None,
+        stages=[
+            UsageStage(stage=name, duration_ms=duration)
+            for name, duration in (timings or {}).items()
+        ],
+        token_usage=token_usage,
+    )
+
+
 def _get_or_create_session(
     user_id: int, session_id: int | None, title: str | None = None
 ) -> ChatSession:
@@ -39,6 +187,11 @@ def query_chat():
 
     if not message:
         return jsonify({"error": "message is required"}), 400
+    # Optional scope: {"tags": [...], "folder": "...", "modified_after": "2025-01-01", ...}
+    try:
+        filters = MetadataFilter.from_dict(payload.get("filters"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
 
     user_id = int(get_jwt_identity())
     pipeline = get_pipeline(
@@ -50,120 +203,221 @@ def query_chat():
 
     # Conversation window used to condense anaphoric follow-ups
     # ("et pour X ?") into standalone questions before retrieval.
-    window = pipeline.config.history_window
-    chat_history = [
-        {"role": msg.role, "content": msg.content} for msg in session.messages[-window:]
-    ]
+    chat_history = _load_history(pipeline, session.id)
 
-    user_msg = ChatMessage(session=session, role="user", content=message)
+    user_msg = ChatMessage(session_id=session.id, role="user", content=message)
     db.session.add(user_msg)
     db.session.flush()
 
     start = time.perf_counter()
-    result = pipeline.query(message, user_id=user_id, history=chat_history)
+    result = pipeline.query(message, user_id=user_id, history=chat_history, filters=filters)
     latency_ms = (time.perf_counter() - start) * 1000
 
     sources = _public_sources(result.get("sources"))
     assistant_msg = ChatMessage(
-        session=session,
+        session_id=session.id,
         role="assistant",
         content=result.get("answer", ""),
         sources=sources,
         response_time_ms=latency_ms,
     )
     db.session.add(assistant_msg)
+    db.session.flush()
+    timings, usage = result.get("timings", {}), result.get("usage", {})
 
-    usage_entry = UsageLog(user_id=user_id, endpoint="chat.query", latency_ms=latency_ms)
-    db.session.add(usage_entry)
+    save_usage(_usage_entry(user_id, "chat.query", latency_ms, timings, usage, assistant_msg))
+    record_query("chat.query", latency_ms, timings, usage)
 
     db.session.commit()
+    _fold_after_turn(pipeline, user_id, session.id, assistant_msg.id)
+
+    response = {
+        "session_id": session.id,
+        "answer": result.get("answer"),
+        "sources": sources,
+        "query_rewritten": result.get("query_rewritten"),
+        "rewrite_reason": result.get("rewrite_reason"),
+        "latency_ms": round(latency_ms, 2),
+    }
+    if payload.get("include_timings"):
+        response["timings"] = result.get("timings", {})
+    return jsonify(response)
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    return jsonify(
+
+def open_stream(user_id: int, message: str, session_id: int | None, title: str | None):
+    """Session and history for a streaming turn; returns (pipeline, session_pk, history).
+
+    The stream may run after the request transaction is torn down (or in
+    another thread on the ASGI path): the session row is committed now and
+    only its primary key is carried along.
+    """
+    pipeline = get_pipeline(
+        persist_directory=current_app.config["VECTOR_STORE_FOLDER"],
+        top_k=current_app.config["RAG_TOP_K"],
+    )
+    session = _get_or_create_session(user_id, session_id, title)
+    chat_history = _load_history(pipeline, session.id)
+    db.session.commit()
+    return pipeline, session.id, chat_history
+
+
+def sources_frame(event: dict) -> tuple[list[dict], str]:
+    """Public sources of a 'sources' pipeline event and its SSE frame."""
+    public_sources = _public_sources(event["sources"])
+    frame = sse(
+        "sources",
         {
-            "session_id": session.id,
-            "answer": result.get("answer"),
-            "sources": sources,
-            "query_rewritten": result.get("query_rewritten"),
-            "rewrite_reason": result.get("rewrite_reason"),
-            "latency_ms": round(latency_ms, 2),
-        }
+            "sources": public_sources,
+            "query_rewritten": event.get("query_rewritten"),
+            "rewrite_reason": event.get("rewrite_reason"),
+            "provisional": bool(event.get("provisional")),
+        },
     )
+    return public_sources, frame
 
 
-def _sse(event: str, data: dict) -> str:
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+class StreamTurn:
+    """One streamed answer, fed with the pipeline's events as they are sent.
+
+    Milestones are milliseconds since the stream started: "time_to_sources"
+    (first 'sources' event, provisional ones included) and "ttft" (first
+    answer delta).
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.answer_parts: list[str] = []
+        self.sources: list[dict] = []
+        self.milestones: dict[str, float] = {}
+        self.timings: dict[str, float] = {}
+        self.usage: dict[str, dict] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def frame(self, event: dict) -> str | None:
+        """SSE frame of a pipeline event; None for the closing 'timings' event."""
+        if event["type"] == "timings":
+            self.timings, self.usage = event["timings"], event["usage"]
+            return None
+        milestone = "time_to_sources" if event["type"] == "sources" else "ttft"
+        self.milestones.setdefault(milestone, round(self.elapsed_ms(), 2))
+        if event["type"] == "sources":
+            self.sources, frame = sources_frame(event)
+            return frame
+        self.answer_parts.append(event["text"])
+        return sse("delta", {"text": event["text"]})
+
+
+def close_stream(
+    *,
+    pipeline,
+    user_id: int,
+    session_pk: int,
+    message: str,
+    turn: StreamTurn,
+    endpoint: str,
+    include_timings: bool = False,
+) -> str:
+    """Persist a finished streaming turn and return the 'done' SSE frame.
+
+    The history summary, if enabled, is folded afterwards in the background.
+    """
+    latency_ms = turn.elapsed_ms()
+    db.session.add(ChatMessage(session_id=session_pk, role="user", content=message))
+    assistant_msg = ChatMessage(
+        session_id=session_pk,
+        role="assistant",
+        content="".join(turn.answer_parts),
+        sources=turn.sources,
+        response_time_ms=latency_ms,
+    )
+    db.session.add(assistant_msg)
+    db.session.flush()
+    save_usage(
+        _usage_entry(
+            user_id,
+            endpoint,
+            latency_ms,
+            {**turn.timings, **turn.milestones},
+            turn.usage,
+            assistant_msg,
+        )
+    )
+    db.session.commit()
+    _fold_after_turn(pipeline, user_id, session_pk, assistant_msg.id)
+    record_query(endpoint, latency_ms, turn.timings, turn.usage, turn.milestones)
+    done = {
+        "session_id": session_pk,
+        "latency_ms": round(latency_ms, 2),
+        "time_to_sources_ms": turn.milestones.get("time_to_sources"),
+        "ttft_ms": turn.milestones.get("ttft"),
+    }
+    if include_timings:
+        done["timings"] = turn.timings
+    return sse("done", done)
+
+
+@limiter.limit(lambda: current_app.config.get("RATE_LIMIT"))
+def check_stream_rate_limit() -> None:
+    """Count one /query/stream request against its rate limit.
+
+    Called in the route's request context by both the WSGI view and the ASGI
+    handler, so they share one limit, keyed like every other route. Raises
+    RateLimitExceeded once it is exhausted.
+    """
 
 
 @chat_bp.route("/query/stream", methods=["POST"])
 @jwt_required()
-@limiter.limit(lambda: current_app.config.get("RATE_LIMIT"))
 def query_chat_stream():
     """SSE variant of /query: 'sources' event, then 'delta' events, then 'done'.
 
+    'done' carries the latency, time to sources and time to first token (ms).
+
     DB persistence (messages, usage log) happens once the stream is complete.
     The non-streaming route stays untouched (used by the eval harness).
+    Under the ASGI entry point (backend.asgi) this path is served by an async
+    handler instead; this sync route remains for WSGI deployments.
     """
+    check_stream_rate_limit()
     payload = request.get_json() or {}
     message = payload.get("message", "").strip()
-    session_id = payload.get("session_id")
-    title = payload.get("title")
 
     if not message:
         return jsonify({"error": "message is required"}), 400
+    try:
+        filters = MetadataFilter.from_dict(payload.get("filters"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
 
     user_id = int(get_jwt_identity())
-    pipeline = get_pipeline(
-        persist_directory=current_app.config["VECTOR_STORE_FOLDER"],
-        top_k=current_app.config["RAG_TOP_K"],
+    pipeline, session_pk, chat_history = open_stream(
+        user_id, message, payload.get("session_id"), payload.get("title")
     )
 
-    session = _get_or_create_session(user_id, session_id, title)
-    window = pipeline.config.history_window
-    chat_history = [
-        {"role": msg.role, "content": msg.content} for msg in session.messages[-window:]
-    ]
-    # The generator may run after the request transaction is torn down:
-    # persist the session row now and only carry its primary key inside.
-    db.session.commit()
-    session_pk = session.id
-
     def generate():
-        start = time.perf_counter()
-        answer_parts: list[str] = []
-        public_sources: list[dict] = []
-
-        for event in pipeline.stream_query(message, user_id=user_id, history=chat_history):
-            if event["type"] == "sources":
-                public_sources = _public_sources(event["sources"])
-                yield _sse(
-                    "sources",
-                    {
-                        "sources": public_sources,
-                        "query_rewritten": event.get("query_rewritten"),
-                        "rewrite_reason": event.get("rewrite_reason"),
-                    },
-                )
-            elif event["type"] == "delta":
-                answer_parts.append(event["text"])
-                yield _sse("delta", {"text": event["text"]})
-
-        latency_ms = (time.perf_counter() - start) * 1000
-        db.session.add(ChatMessage(session_id=session_pk, role="user", content=message))
-        db.session.add(
-            ChatMessage(
-                session_id=session_pk,
-                role="assistant",
-                content="".join(answer_parts),
-                sources=public_sources,
-                response_time_ms=latency_ms,
-            )
-        )
-        db.session.add(
-            UsageLog(user_id=user_id, endpoint="chat.query.stream", latency_ms=latency_ms)
+        turn = StreamTurn()
+        for event in pipeline.stream_query(
+            message, user_id=user_id, history=chat_history, filters=filters
+        ):
+            frame = turn.frame(event)
+            if frame is not None:
+                yield frame
+
+        yield close_stream(
+            pipeline=pipeline,
+            user_id=user_id,
+            session_pk=session_pk,
+            message=message,
+            turn=turn,
+            endpoint="chat.query.stream",
+            include_timings=bool(payload.get("include_timings")),
         )
-        db.session.commit()
-
-        yield _sse("done", {"session_id": session_pk, "latency_ms": round(latency_ms, 2)})
 
     return Response(
         stream_with_context(generate()),
@@ -172,31 +426,132 @@ def query_chat_stream():
     )
 
 
+def _page_size(default: int) -> int:
+    return max(1, min(request.args.get("limit", default, type=int), MAX_PAGE_SIZE))
+
+
+def _flag(name: str, default: bool) -> bool:
+    value = request.args.get(name)
+    return default if value is None else value.lower() in {"1", "true", "yes"}
+
+
+def _encode_cursor(session: ChatSession) -> str:
+    raw = f"{session.created_at.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """(created_at, id) of the last session of the previous page; ValueError if malformed."""
+    created_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(created_at), int(session_id)
+
+
+def _message_entry(msg: ChatMessage, include_sources: bool) -> dict:
+    entry = {
+        "id": msg.id,
+        "role": msg.role,
+        "content": msg.content,
+        "created_at": msg.created_at.isoformat(),
+        "response_time_ms": msg.response_time_ms,
+    }
+    if include_sources:
+        entry["sources"] = msg.sources
+    return entry
+
+
 @chat_bp.route("/history", methods=["GET"])
 @jwt_required()
 def history():
+    """The user's sessions, newest first, one page at a time.
+
+    Query string: limit, cursor (the previous page's next_cursor),
+    include_messages (embed every message of the page's sessions, batch-loaded)
+    and include_sources (with include_messages; default true). Messages of a
+    single session are better fetched from /sessions/<id>/messages.
+    """
     user_id = int(get_jwt_identity())
+    limit = _page_size(HISTORY_PAGE_SIZE)
+    include_messages = _flag("include_messages", False)
+    include_sources = _flag("include_sources", True)
+
+    query = ChatSession.query.filter_by(user_id=user_id)
+    if cursor := request.args.get("cursor"):
+        try:
+            created_at, session_id = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        query = query.filter(
+            or_(
+                ChatSession.created_at < created_at,
+                and_(ChatSession.created_at == created_at, ChatSession.id < session_id),
+            )
+        )
+    if include_messages:
+        messages = selectinload(ChatSession.messages)
+        query = query.options(messages if include_sources else messages.defer(ChatMessage.sources))
     sessions = (
-        ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.created_at.desc()).all()
+        query.order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).limit(limit + 1).all()
     )
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
+
+    if include_messages:
+        counts = {session.id: len(session.messages) for session in sessions}
+    else:
+        counts = dict(
+            db.session.query(ChatMessage.session_id, func.count(ChatMessage.id))
+            .filter(ChatMessage.session_id.in_([session.id for session in sessions]))
+            .group_by(ChatMessage.session_id)
+            .all()
+        )
+
     serialized = []
     for session in sessions:
-        serialized.append(
-            {
-                "session_id": session.id,
-                "title": session.title,
-                "created_at": session.created_at.isoformat(),
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "role": msg.role,
-                        "content": msg.content,
-                        "created_at": msg.created_at.isoformat(),
-                        "sources": msg.sources,
-                        "response_time_ms": msg.response_time_ms,
-                    }
-                    for msg in session.messages
-                ],
-            }
-        )
-    return jsonify({"sessions": serialized})
+        entry = {
+            "session_id": session.id,
+            "title": session.title,
+            "created_at": session.created_at.isoformat(),
+            "message_count": counts.get(session.id, 0),
+        }
+        if include_messages:
+            entry["messages"] = [_message_entry(msg, include_sources) for msg in session.messages]
+        serialized.append(entry)
+    return jsonify(
+        {
+            "sessions": serialized,
+            "next_cursor": _encode_cursor(sessions[-1]) if has_more else None,
+        }
+    )
+
+
+@chat_bp.route("/sessions/<int:session_id>/messages", methods=["GET"])
+@jwt_required()
+def session_messages(session_id: int):
+    """Messages of one session in chronological order, latest page first.
+
+    Query string: limit, before (the previous page's next_before message id)
+    and include_sources (default true).
+    """
+    user_id = int(get_jwt_identity())
+    session = ChatSession.query.filter_by(id=session_id, user_id=user_id).first()
+    if not session:
+        return jsonify({"error": "session not found"}), 404
+    limit = _page_size(MESSAGES_PAGE_SIZE)
+    include_sources = _flag("include_sources", True)
+
+    query = ChatMessage.query.filter_by(session_id=session.id)
+    if before := request.args.get("before", type=int):
+        query = query.filter(ChatMessage.id < before)
+    if not include_sources:
+        query = query.options(defer(ChatMessage.sources))
+    rows = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    messages = rows[:limit][::-1]
+
+    return jsonify(
+        {
+            "session_id": session.id,
+            "messages": [_message_entry(msg, include_sources) for msg in messages],
+            "next_before": messages[0].id if has_more else None,
+        }
+    )
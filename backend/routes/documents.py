@@ -14,6 +14,7 @@ from ..rag.ingestion import (
     hash_content,
     save_upload_to_disk,
 )
+from ..usage_buffer import save_usage
 from . import docs_bp
 
 
@@ -104,8 +105,7 @@ def upload_document():
     db.session.add(document)
 
     latency_ms = (time.perf_counter() - start) * 1000
-    usage_entry = UsageLog(user_id=user_id, endpoint="documents.upload", latency_ms=latency_ms)
-    db.session.add(usage_entry)
+    save_usage(UsageLog(user_id=user_id, endpoint="documents.upload", latency_ms=latency_ms))
 
     db.session.commit()
 
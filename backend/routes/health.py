@@ -0,0 +1,22 @@
+from flask import current_app, jsonify
+
+from ..rag import get_pipeline
+from . import health_bp
+
+
+@health_bp.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 200 once a query pays no model, store or warmup cost, else 503.
+
+    Unauthenticated, and cheap: it only inspects what is already loaded.
+    """
+    pipeline = get_pipeline(
+        persist_directory=current_app.config["VECTOR_STORE_FOLDER"],
+        top_k=current_app.config["RAG_TOP_K"],
+    )
+    report = pipeline.readiness()
+    warmer = current_app.extensions.get("rag_warmer")
+    if warmer is not None:
+        report["warmer"] = warmer.to_dict()
+        report["ready"] = report["ready"] and warmer.finished
+    return jsonify(report), 200 if report["ready"] else 503
@@ -0,0 +1,44 @@
+import time
+
+from flask import Response, current_app, g, request
+
+from ..metrics import registry
+from ..rag import get_pipeline
+from . import metrics_bp
+
+
+@metrics_bp.before_app_request
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        registry.observe(
+            "rag_http_request_duration_seconds",
+            time.perf_counter() - start,
+            {
+                "endpoint": request.endpoint or "unmatched",
+                "method": request.method,
+                "status": response.status_code,
+            },
+        )
+    return response
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint, every worker included. Unauthenticated, like /api/health."""
+    pipeline = get_pipeline(
+        persist_directory=current_app.config["VECTOR_STORE_FOLDER"],
+        top_k=current_app.config["RAG_TOP_K"],
+    )
+    gauges = {}
+    chunks = pipeline.collection_size()
+    if chunks is not None:
+        gauges["rag_chroma_chunks"] = chunks
+    return Response(
+        registry.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,94 @@
+"""Buffered usage logging: UsageLog rows written in batches, off the request path.
+
+A chat turn's usage row (with its stage timings, tokens and rollup increments)
+is not needed to answer, yet it costs the turn's transaction several writes.
+With USAGE_BUFFER on, save_usage() only queues the row; a background thread
+per worker writes the queue in one transaction every USAGE_BUFFER_INTERVAL_MS,
+or sooner once USAGE_BUFFER_MAX_BATCH rows are waiting. Rows still queued
+when a worker is killed are lost: usage rows are statistics, not data.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from flask import Flask, current_app
+
+from .extensions import db
+from .models import UsageLog, record_usage
+
+logger = logging.getLogger(__name__)
+
+
+class UsageBuffer:
+    def __init__(self, app: Flask, interval_ms: float, max_batch: int):
+        self._app = app
+        self._interval = interval_ms / 1000
+        self._max_batch = max_batch
+        self._queue: queue.SimpleQueue[UsageLog] = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+
+    def _ensure_thread(self) -> None:
+        # Started lazily, and again after a fork: gunicorn --preload workers
+        # inherit the buffer but not its thread.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name="usage-buffer", daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, entry: UsageLog) -> None:
+        """Queue a transient usage row (not added to any session)."""
+        self._ensure_thread()
+        self._queue.put(entry)
+        if self._queue.qsize() >= self._max_batch:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write every queued row in one transaction; returns the number written."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return 0
+        with self._app.app_context():
+            try:
+                record_usage(*batch)
+                db.session.commit()
+            except Exception:  # noqa: BLE001 - a lost batch must not kill the thread
+                db.session.rollback()
+                logger.exception("Dropped %d buffered usage rows", len(batch))
+                return 0
+        return len(batch)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self.flush()
+
+
+def init_usage_buffer(app: Flask) -> None:
+    if app.config["USAGE_BUFFER"]:
+        buffer = UsageBuffer(
+            app, app.config["USAGE_BUFFER_INTERVAL_MS"], app.config["USAGE_BUFFER_MAX_BATCH"]
+        )
+        app.extensions["usage_buffer"] = buffer
+        atexit.register(buffer.flush)
+
+
+def save_usage(entry: UsageLog) -> None:
+    """Persist a usage row: queued with USAGE_BUFFER, else in the current transaction."""
+    buffer = current_app.extensions.get("usage_buffer")
+    if buffer is None:
+        record_usage(entry)
+    else:
+        buffer.submit(entry)
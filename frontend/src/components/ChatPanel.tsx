@@ -14,6 +14,8 @@ function ChatPanel() {
     streaming,
     sendMessage,
     createSession,
+    hasMoreSessions,
+    loadMoreSessions,
   } = useChat();
   const [message, setMessage] = useState("");
   const messageEndRef = useRef<HTMLDivElement | null>(null);
@@ -63,6 +65,15 @@ function ChatPanel() {
               </p>
             </button>
           ))}
+          {hasMoreSessions && (
+            <button
+              type="button"
+              onClick={loadMoreSessions}
+              className="rounded-lg px-3 py-2 text-xs text-muted hover:text-foreground"
+            >
+              Load older sessions
+            </button>
+          )}
         </div>
       </aside>
 
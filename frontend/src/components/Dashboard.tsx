@@ -7,6 +7,12 @@ type Summary = {
     total_calls: number;
     average_latency_ms: number;
   };
+  tokens: {
+    input_tokens: number;
+    output_tokens: number;
+    cache_read_input_tokens: number;
+    cost_usd: number;
+  };
   totals: {
     sessions: number;
     assistant_messages: number;
@@ -41,12 +47,12 @@ function Dashboard() {
     };
     const fetchHistory = async () => {
       try {
-        const { data } = await client.get("/api/chat/history");
-        const mapped = data.sessions.slice(0, 5).map((session: any) => ({
+        const { data } = await client.get("/api/chat/history", { params: { limit: 5 } });
+        const mapped = data.sessions.map((session: any) => ({
           sessionId: session.session_id,
           title: session.title,
           createdAt: session.created_at,
-          messages: session.messages.length,
+          messages: session.message_count,
         }));
         setRecentSessions(mapped);
       } catch (err) {
@@ -75,7 +81,7 @@ function Dashboard() {
 
   return (
     <div className="flex flex-1 flex-col gap-6 overflow-y-auto bg-surface p-6">
-      <div className="grid gap-4 md:grid-cols-3">
+      <div className="grid gap-4 md:grid-cols-4">
         <motion.div
           variants={cardVariants}
           initial="hidden"
@@ -110,6 +116,23 @@ function Dashboard() {
           <p className="text-sm text-muted">Documents Ingested</p>
           <p className="mt-2 text-3xl font-semibold text-foreground">{summary?.totals.documents ?? 0}</p>
         </motion.div>
+
+        <motion.div
+          variants={cardVariants}
+          initial="hidden"
+          animate="visible"
+          transition={{ delay: 0.35 }}
+          className="rounded-xl border border-border bg-panel p-5 shadow"
+        >
+          <p className="text-sm text-muted">Estimated LLM Cost</p>
+          <p className="mt-2 text-3xl font-semibold text-foreground">
+            ${(summary?.tokens.cost_usd ?? 0).toFixed(2)}
+          </p>
+          <p className="mt-1 text-xs text-muted">
+            {(summary?.tokens.input_tokens ?? 0).toLocaleString()} in /{" "}
+            {(summary?.tokens.output_tokens ?? 0).toLocaleString()} out tokens
+          </p>
+        </motion.div>
       </div>
 
       <section className="grid gap-6 md:grid-cols-2">
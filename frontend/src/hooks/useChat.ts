@@ -23,6 +23,8 @@ type Session = {
   title: string;
   createdAt: string;
   messages: ChatMessage[];
+  // Messages are fetched when the session is first opened.
+  messagesLoaded: boolean;
 };
 
 export type StreamingExchange = {
@@ -55,42 +57,83 @@ function parseSseFrames(buffer: string): { events: SseEvent[]; rest: string } {
   return { events, rest };
 }
 
+function toChatMessage(msg: any): ChatMessage {
+  return {
+    id: msg.id,
+    role: msg.role,
+    content: msg.content,
+    createdAt: msg.created_at,
+    sources: msg.sources,
+    latencyMs: msg.response_time_ms,
+  };
+}
+
 export function useChat() {
   const [sessions, setSessions] = useState<Session[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [activeSessionId, setActiveSessionId] = useState<number | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [streaming, setStreaming] = useState<StreamingExchange | null>(null);
 
-  const loadHistory = useCallback(async () => {
+  const loadSessions = useCallback(async (cursor: string | null) => {
     try {
-      const { data } = await client.get("/api/chat/history");
+      const { data } = await client.get("/api/chat/history", {
+        params: cursor ? { cursor } : {},
+      });
       const mapped: Session[] = data.sessions.map((session: any) => ({
         sessionId: session.session_id,
         title: session.title,
         createdAt: session.created_at,
-        messages: session.messages.map((msg: any) => ({
-          id: msg.id,
-          role: msg.role,
-          content: msg.content,
-          createdAt: msg.created_at,
-          sources: msg.sources,
-          latencyMs: msg.response_time_ms,
-        })),
+        messages: [],
+        messagesLoaded: session.message_count === 0,
       }));
-      setSessions(mapped);
-      if (mapped.length && !activeSessionId) {
-        setActiveSessionId(mapped[0].sessionId);
+      setSessions((prev) => (cursor ? [...prev, ...mapped] : mapped));
+      setNextCursor(data.next_cursor);
+      if (!cursor && mapped.length) {
+        setActiveSessionId((prev) => prev ?? mapped[0].sessionId);
       }
     } catch (err) {
       setError("Failed to load history.");
     }
-  }, [activeSessionId]);
+  }, []);
+
+  const loadHistory = useCallback(() => loadSessions(null), [loadSessions]);
+
+  const loadMoreSessions = useCallback(() => {
+    if (nextCursor) loadSessions(nextCursor);
+  }, [loadSessions, nextCursor]);
 
   useEffect(() => {
     loadHistory();
   }, [loadHistory]);
 
+  const activeNeedsMessages = sessions.some(
+    (session) => session.sessionId === activeSessionId && !session.messagesLoaded,
+  );
+
+  useEffect(() => {
+    if (activeSessionId === null || !activeNeedsMessages) return;
+    const loadMessages = async () => {
+      try {
+        const { data } = await client.get(`/api/chat/sessions/${activeSessionId}/messages`, {
+          params: { limit: 200 },
+        });
+        const messages = data.messages.map(toChatMessage);
+        setSessions((prev) =>
+          prev.map((session) =>
+            session.sessionId === activeSessionId
+              ? { ...session, messages, messagesLoaded: true }
+              : session,
+          ),
+        );
+      } catch (err) {
+        setError("Failed to load messages.");
+      }
+    };
+    loadMessages();
+  }, [activeSessionId, activeNeedsMessages]);
+
   const activeSession = useMemo(
     () => sessions.find((session) => session.sessionId === activeSessionId),
     [sessions, activeSessionId],
@@ -171,6 +214,7 @@ export function useChat() {
                 title: content.slice(0, 36) || "New session",
                 createdAt: new Date().toISOString(),
                 messages: [newUserMessage, newAssistantMessage],
+                messagesLoaded: true,
               },
               ...prev,
             ];
@@ -208,6 +252,8 @@ export function useChat() {
     sendMessage,
     createSession,
     reloadHistory: loadHistory,
+    hasMoreSessions: nextCursor !== null,
+    loadMoreSessions,
   };
 }
 
@@ -15,6 +15,10 @@ class FakeAnswerer:
         yield "Answer based on "
         yield f"{len(chunks)} chunk(s)."
 
+    async def agenerate_stream(self, question, chunks):
+        for text in self.generate_stream(question, chunks):
+            yield text
+
 
 class FakeRewriter:
     def rewrite(self, original_query):
@@ -23,13 +27,21 @@ class FakeRewriter:
     def condense(self, question, history):
         return question
 
+    def summarize(self, summary, messages):
+        return " | ".join([summary, *(msg["content"] for msg in messages)]).strip(" |")
+
 
 class FakeReranker:
     """High constant relevance: never triggers the rerank threshold."""
 
+    loaded = True
+
     def score(self, query, texts):
         return [0.9] * len(texts)
 
+    def score_batch(self, batch):
+        return [self.score(query, texts) for query, texts in batch]
+
 
 @pytest.fixture(autouse=True)
 def _patch_rag(monkeypatch):
@@ -39,9 +51,7 @@ def _patch_rag(monkeypatch):
     module attributes is enough — no network access or API key required.
     """
     monkeypatch.setattr(
-        pipeline_module,
-        "HuggingFaceEmbeddings",
-        lambda **kwargs: DeterministicFakeEmbedding(size=64),
+        pipeline_module, "_load_embedding_model", lambda: DeterministicFakeEmbedding(size=64)
     )
     monkeypatch.setattr(pipeline_module, "AnswerGenerator", FakeAnswerer)
     monkeypatch.setattr(pipeline_module, "QueryRewriter", FakeRewriter)
@@ -0,0 +1,84 @@
+from backend.rag.answerer import AnswerGenerator, cache_min_tokens
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.prompts import ANSWER_SYSTEM_PROMPT
+from backend.rag.usage import cached_input_tokens, estimate_cost, usage_by_model
+
+
+class RecordingAnswerer:
+    def __init__(self):
+        self.chunks = []
+
+    def generate(self, question, chunks):
+        self.chunks.append(list(chunks))
+        return "ok"
+
+
+def test_answer_messages_put_the_stable_block_first():
+    first = AnswerGenerator._messages("Question A ?", ["chunk a"])
+    second = AnswerGenerator._messages("Question B ?", ["chunk b", "chunk c"])
+
+    # The system block is byte-identical across turns.
+    assert first[0] == second[0]
+    assert first[0]["role"] == "system"
+    assert first[0]["content"][0]["text"] == ANSWER_SYSTEM_PROMPT
+
+    # Context before the question: the question never breaks a cached prefix.
+    context, question = second[1]["content"]
+    assert second[1]["role"] == "user"
+    assert "(chunk 2) chunk c" in context["text"]
+    assert "Question B ?" in question["text"]
+    assert all("cache_control" not in part for part in second[1]["content"])
+
+    cached = AnswerGenerator._messages("Question B ?", ["chunk b"], cache=True)
+    assert cached[1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_only_a_long_resent_context_is_marked_for_caching(monkeypatch):
+    monkeypatch.setattr("langchain.chat_models.init_chat_model", lambda *a, **k: None)
+    answerer = AnswerGenerator("claude-sonnet-4-6")
+    long_chunks = ["mot " * 1200]
+
+    # Too short for the provider to cache, however often it is sent.
+    assert not answerer._reused_prefix(["chunk a"])
+    assert not answerer._reused_prefix(["chunk a"])
+    # Long enough: cached only once a later turn resends the same context.
+    assert not answerer._reused_prefix(long_chunks)
+    assert answerer._reused_prefix(long_chunks)
+    assert not answerer._reused_prefix(["autre " * 1200])
+
+    # Haiku's minimum is twice as long.
+    assert cache_min_tokens("claude-haiku-4-5") == 2048
+    haiku = AnswerGenerator("claude-haiku-4-5")
+    assert not haiku._reused_prefix(long_chunks)
+    assert not haiku._reused_prefix(long_chunks)
+
+
+def test_query_merges_overlapping_chunks_before_answering(tmp_path):
+    pipeline = RAGPipeline(persist_directory=str(tmp_path / "vs"), top_k=10)
+    answerer = RecordingAnswerer()
+    pipeline._answerer = answerer
+    text = " ".join(f"mot{i}" for i in range(300))
+    pipeline.ingest_uploaded_text(text, metadata={"source": "long.txt", "user_id": 1})
+
+    result = pipeline.query("Que contiennent mes notes longues exactement ?", user_id=1)
+
+    assert len(result["sources"]) > 1
+    assert answerer.chunks == [[text]]
+
+
+def test_usage_tracks_prompt_cache_savings():
+    usage = usage_by_model(
+        {
+            "claude-sonnet-4-6": {
+                "input_tokens": 2000,
+                "output_tokens": 100,
+                "input_token_details": {"cache_read": 1500, "cache_creation": 0},
+            }
+        }
+    )
+
+    assert usage["claude-sonnet-4-6"]["cache_read_input_tokens"] == 1500
+    assert cached_input_tokens(usage) == 1500
+    # 500 uncached + 1500 at 10% of the input price, plus output.
+    expected = 500 / 1e6 * 3.0 + 1500 / 1e6 * 0.3 + 100 / 1e6 * 15.0
+    assert estimate_cost(usage) == round(expected, 6)
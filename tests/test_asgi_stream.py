@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+from flask_jwt_extended import create_refresh_token
+
+from backend.asgi import STREAM_PATH, asgi_app
+from backend.extensions import jwt, limiter
+from backend.models import ChatMessage
+
+from .conftest import FakeAnswerer, auth_headers, register
+from .test_stream_route import _parse_sse, _upload
+
+
+def _call(app, method, path, body=b"", headers=None, disconnect_after=None):
+    """Drive one HTTP request through an ASGI app; returns (status, headers, body).
+
+    With disconnect_after=n, the client goes away once n body frames are sent.
+    """
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "http_version": "1.1",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 12345),
+        "headers": [
+            (name.lower().encode("latin1"), value.encode("latin1"))
+            for name, value in (headers or {}).items()
+        ],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    gone = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        frames = sum(m["type"] == "http.response.body" for m in sent)
+        if disconnect_after is not None and frames >= disconnect_after:
+            gone.set()
+
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), timeout=10))
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    response_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    payload = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], response_headers, payload.decode("utf-8")
+
+
+def _post_stream(app, token, message, origin=None):
+    headers = {**auth_headers(token), "Content-Type": "application/json"}
+    if origin:
+        headers["Origin"] = origin
+    return _call(app, "POST", STREAM_PATH, json.dumps({"message": message}).encode(), headers)
+
+
+def test_asgi_stream_emits_the_same_events_and_persists(app, client):
+    token, _ = register(client, "asgi@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend du projet utilise Flask.")
+
+    status, headers, body = _post_stream(
+        asgi_app(app),
+        token,
+        "Quel framework backend utilise le projet selon mes notes ?",
+        origin="http://localhost:5173",
+    )
+
+    assert status == 200
+    assert headers["content-type"].startswith("text/event-stream")
+    assert headers["access-control-allow-origin"] == "http://localhost:5173"
+    events = _parse_sse(body)
+    names = [name for name, _ in events]
+    assert names[0] == "sources" and names[-1] == "done"
+    assert set(names[1:-1]) == {"delta"}
+    assert all("content" not in src for src in events[0][1]["sources"])
+
+    session_id = events[-1][1]["session_id"]
+    page = client.get(
+        f"/api/chat/sessions/{session_id}/messages", headers=auth_headers(token)
+    ).get_json()
+    assert [m["role"] for m in page["messages"]] == ["user", "assistant"]
+
+
+def test_asgi_stream_rejects_missing_token_and_message(app, client):
+    token, _ = register(client, "asgi-errors@example.com")
+    wrapped = asgi_app(app)
+
+    status, _, _ = _call(wrapped, "POST", STREAM_PATH, b"{}", {"Content-Type": "application/json"})
+    assert status == 401
+
+    status, _, body = _post_stream(wrapped, token, "   ")
+    assert status == 400
+    assert json.loads(body)["error"] == "message is required"
+
+
+def test_asgi_stream_applies_jwt_required_checks(app, client, monkeypatch):
+    token, user_id = register(client, "asgi-jwt@example.com")
+    wrapped = asgi_app(app)
+    with app.app_context():
+        refresh = create_refresh_token(identity=str(user_id))
+
+    status, _, body = _post_stream(wrapped, refresh, "Bonjour ?")
+    assert status == 422
+    assert json.loads(body) == {"msg": "Only non-refresh tokens are allowed"}
+
+    monkeypatch.setattr(jwt, "_token_in_blocklist_callback", lambda header, payload: True)
+    status, _, body = _post_stream(wrapped, token, "Bonjour ?")
+    assert status == 401
+    assert json.loads(body) == {"msg": "Token has been revoked"}
+
+
+def test_asgi_and_wsgi_stream_routes_share_the_rate_limit(app, client, monkeypatch):
+    # The fixture app is created with rate limiting off: turn it on before any request.
+    monkeypatch.setattr(limiter, "enabled", True)
+    app.config.update(RATELIMIT_ENABLED=True, RATELIMIT_STORAGE_URI="memory://")
+    limiter.init_app(app)
+    token, _ = register(client, "asgi-limit@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend du projet utilise Flask.")
+    app.config["RATE_LIMIT"] = "2/minute"
+    wrapped = asgi_app(app)
+
+    resp = client.post(
+        STREAM_PATH, headers=auth_headers(token), json={"message": "Quel framework ?"}
+    )
+    assert resp.status_code == 200
+    resp.get_data()
+    assert _post_stream(wrapped, token, "Quel framework ?")[0] == 200
+
+    status, _, body = _post_stream(wrapped, token, "Quel framework ?")
+    assert status == 429
+    assert json.loads(body) == {"error": "rate limit exceeded", "details": "2 per 1 minute"}
+
+
+def test_asgi_stream_stops_generating_when_the_client_disconnects(app, client, monkeypatch):
+    token, _ = register(client, "asgi-gone@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend du projet utilise Flask.")
+    state = {"closed": False, "deltas": 0}
+
+    async def endless(self, question, chunks):
+        try:
+            while True:
+                state["deltas"] += 1
+                yield "token "
+                await asyncio.sleep(0.01)
+        finally:
+            state["closed"] = True
+
+    monkeypatch.setattr(FakeAnswerer, "agenerate_stream", endless)
+
+    status, _, body = _call(
+        asgi_app(app),
+        "POST",
+        STREAM_PATH,
+        json.dumps({"message": "Quel framework backend ?"}).encode(),
+        {**auth_headers(token), "Content-Type": "application/json"},
+        disconnect_after=3,
+    )
+
+    assert status == 200
+    assert state["closed"] and state["deltas"] < 10
+    assert "done" not in [name for name, _ in _parse_sse(body)]
+    with app.app_context():
+        assert ChatMessage.query.count() == 0
+
+
+def test_other_routes_are_served_by_flask(app, client):
+    token, _ = register(client, "asgi-wsgi@example.com")
+
+    status, _, body = _call(asgi_app(app), "GET", "/api/chat/history", headers=auth_headers(token))
+
+    assert status == 200
+    assert json.loads(body) == {"sessions": [], "next_cursor": None}
@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import event
+
+from backend.extensions import db
+from backend.models import ChatMessage, ChatSession
+
+from .conftest import auth_headers, register
+
+
+def _seed(app, user_id, sessions, messages):
+    """Sessions one minute apart (the last one newest), each with its messages."""
+    start = datetime(2026, 10, 1, tzinfo=UTC)
+    with app.app_context():
+        for i in range(sessions):
+            session = ChatSession(
+                user_id=user_id, title=f"S{i}", created_at=start + timedelta(minutes=i)
+            )
+            session.messages = [
+                ChatMessage(
+                    role="user" if j % 2 == 0 else "assistant",
+                    content=f"m{j}",
+                    sources=[{"source": "notes.md"}],
+                    created_at=session.created_at + timedelta(seconds=j),
+                )
+                for j in range(messages)
+            ]
+            db.session.add(session)
+        db.session.commit()
+        return [s.id for s in ChatSession.query.order_by(ChatSession.id)]
+
+
+@contextmanager
+def _count_queries(app):
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+def test_history_pages_through_sessions_newest_first(app, client):
+    token, user_id = register(client, "pages@example.com")
+    _seed(app, user_id, sessions=5, messages=3)
+
+    titles, cursor = [], None
+    while True:
+        url = "/api/chat/history?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        page = client.get(url, headers=auth_headers(token)).get_json()
+        titles += [s["title"] for s in page["sessions"]]
+        assert all(s["message_count"] == 3 and "messages" not in s for s in page["sessions"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert titles == ["S4", "S3", "S2", "S1", "S0"]
+
+
+def test_history_rejects_a_malformed_cursor(client):
+    token, _ = register(client, "cursor@example.com")
+
+    resp = client.get("/api/chat/history?cursor=not-a-cursor", headers=auth_headers(token))
+
+    assert resp.status_code == 400
+
+
+def test_history_with_messages_does_not_query_per_session(app, client):
+    token, user_id = register(client, "n-plus-one@example.com")
+    _seed(app, user_id, sessions=3, messages=2)
+    with _count_queries(app) as few:
+        client.get("/api/chat/history?include_messages=1", headers=auth_headers(token))
+
+    _seed(app, user_id, sessions=30, messages=2)
+    with _count_queries(app) as many:
+        page = client.get(
+            "/api/chat/history?include_messages=1&include_sources=0&limit=100",
+            headers=auth_headers(token),
+        ).get_json()
+
+    assert len(many) == len(few)
+    assert len(page["sessions"]) == 33
+    assert all("sources" not in m for s in page["sessions"] for m in s["messages"])
+
+
+def test_session_messages_page_backwards_in_chronological_order(app, client):
+    token, user_id = register(client, "messages@example.com")
+    (session_id,) = _seed(app, user_id, sessions=1, messages=5)
+    url = f"/api/chat/sessions/{session_id}/messages?limit=2"
+
+    latest = client.get(url, headers=auth_headers(token)).get_json()
+    older = client.get(
+        f"{url}&before={latest['next_before']}&include_sources=false", headers=auth_headers(token)
+    ).get_json()
+
+    assert [m["content"] for m in latest["messages"]] == ["m3", "m4"]
+    assert latest["messages"][0]["sources"] == [{"source": "notes.md"}]
+    assert [m["content"] for m in older["messages"]] == ["m1", "m2"]
+    assert all("sources" not in m for m in older["messages"])
+
+
+def test_session_messages_of_another_user_are_not_found(app, client):
+    _, owner_id = register(client, "owner@example.com")
+    other_token, _ = register(client, "other@example.com")
+    (session_id,) = _seed(app, owner_id, sessions=1, messages=1)
+
+    resp = client.get(
+        f"/api/chat/sessions/{session_id}/messages", headers=auth_headers(other_token)
+    )
+
+    assert resp.status_code == 404
@@ -0,0 +1,69 @@
+from backend.rag.chunk_store import ChunkStore
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+NOTE = "# Projet\n\n## Backend\n\nLe backend utilise Flask.\n\n## Frontend\n\nVue."
+
+
+def _pipeline(tmp_path, **config):
+    return RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(final_k=5, **config)
+    )
+
+
+def test_metadata_is_stored_once_and_dropped_with_its_last_chunk(tmp_path):
+    store = ChunkStore(tmp_path / "chunks.sqlite3")
+    shared = {"source": "a.md", "user_id": 1}
+    store.add(
+        [("a", "premier", shared), ("b", "second", dict(shared)), ("c", "autre", {"user_id": 2})]
+    )
+
+    assert store.get(["a", "c", "missing"]) == {
+        "a": ("premier", shared),
+        "c": ("autre", {"user_id": 2}),
+    }
+    assert store.stats()["metadata"] == 2
+
+    store.delete(["a", "c"])
+    stats = store.stats()
+    assert (stats["chunks"], stats["metadata"]) == (1, 1)
+    store.delete(["b"])
+    assert store.stats()["metadata"] == 0
+
+
+def test_only_the_returned_hits_are_hydrated(tmp_path):
+    pipeline = _pipeline(tmp_path, hybrid_enabled=True)
+    pipeline.ingest_uploaded_text(NOTE, metadata={"source": "projet.md", "user_id": 1})
+
+    hits = pipeline.retrieve("Flask backend", user_id=1, top_k=1)
+
+    assert len(hits) == 1
+    assert "Flask" in hits[0]["content"]
+    metadata = hits[0]["metadata"]
+    assert metadata["source"] == "projet.md" and metadata["heading_path"] == "Projet > Backend"
+    assert metadata["retrieval_mode"] == "hybrid" and "chunk_id" in metadata
+    assert not hasattr(pipeline._bm25_index(1), "contents")
+
+
+def test_chunks_missing_from_the_store_are_copied_from_chroma(tmp_path):
+    _pipeline(tmp_path).ingest_uploaded_text(NOTE, metadata={"source": "projet.md", "user_id": 1})
+    # A store written before the chunk store existed.
+    for path in (tmp_path / "vs").glob("chunks.sqlite3*"):
+        path.unlink()
+    pipeline = _pipeline(tmp_path, dense_backend="exact")
+
+    hits = pipeline.retrieve("frontend Vue", user_id=1)
+
+    assert {hit["metadata"]["source"] for hit in hits} == {"projet.md"}
+    assert pipeline._chunks.stats()["chunks"] == len(hits)
+
+
+def test_deleted_chunks_leave_the_store(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    pipeline.ingest_uploaded_text(NOTE, metadata={"source": "projet.md", "user_id": 1})
+    chunk_ids = [hit["metadata"]["chunk_id"] for hit in pipeline.retrieve("backend", user_id=1)]
+
+    pipeline.delete_chunks(chunk_ids[:1], user_id=1)
+    pipeline.delete_chunks(chunk_ids[1:])
+
+    assert pipeline._chunks.stats()["chunks"] == 0
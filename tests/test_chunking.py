@@ -1,4 +1,9 @@
-from backend.rag.ingestion import MAX_SECTION_CHARS, chunk_content, chunk_markdown
+from backend.rag.ingestion import (
+    MAX_SECTION_CHARS,
+    chunk_content,
+    chunk_markdown,
+    merge_overlapping_chunks,
+)
 
 NESTED_MARKDOWN = """# Projet X
 
@@ -47,3 +52,39 @@ def test_chunk_content_dispatches_on_markdown():
 
     txt_docs = chunk_content("# pas du markdown", content_type="text/plain")
     assert "heading_path" not in txt_docs[0].metadata
+
+
+def _hits(chunks, source="note.md"):
+    return [{"content": chunk, "metadata": {"source": source}} for chunk in chunks]
+
+
+def test_merge_overlapping_chunks_stitches_splitter_neighbours():
+    text = " ".join(f"mot{i}" for i in range(400))
+    docs = chunk_content(text, content_type="text/plain")
+    assert len(docs) > 2
+    chunks = [doc.page_content for doc in docs]
+
+    # Rank order is arbitrary: neighbours are found in either direction.
+    merged = merge_overlapping_chunks(_hits([chunks[1], chunks[0], chunks[2]]))
+
+    assert len(merged) == 1
+    passage = merged[0]["content"]
+    assert passage == " ".join(text.split()[: len(passage.split())])
+
+
+def test_merge_overlapping_chunks_keeps_unrelated_and_drops_contained():
+    chunks = ["Le backend est en Flask.", "La recette demande trois pommes.", "est en Flask"]
+    assert merge_overlapping_chunks(_hits(chunks)) == _hits(chunks[:2])
+
+
+def test_merge_overlapping_chunks_never_joins_different_notes():
+    boilerplate = "Modèle de note : revoir chaque lundi matin."
+    first = {
+        "content": f"Projet Alpha, budget validé. {boilerplate}",
+        "metadata": {"note_path": "a.md"},
+    }
+    second = {"content": f"{boilerplate} Recette de la tarte.", "metadata": {"note_path": "b.md"}}
+    contained = {"content": boilerplate, "metadata": {"note_path": "c.md"}}
+
+    hits = [first, second, contained]
+    assert merge_overlapping_chunks(hits) == hits
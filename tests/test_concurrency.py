@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.rag import pipeline as pipeline_module
+from backend.rag.bm25 import UserBM25Index
+from backend.rag.concurrency import ReadWriteLock, SingleFlight
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+
+def _pipeline(tmp_path):
+    return RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(hybrid_enabled=True)
+    )
+
+
+def _ingest(pipeline, user_id, text, source="note.md"):
+    pipeline.ingest_uploaded_text(
+        f"# {source}\n\n{text}",
+        metadata={"source": source, "user_id": user_id},
+        content_type="text/markdown",
+    )
+
+
+def _in_thread(fn):
+    thread = threading.Thread(target=fn, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_readers_share_the_lock_and_writers_exclude_them():
+    lock = ReadWriteLock()
+    both_inside = threading.Barrier(2, timeout=2)
+
+    def _reader():
+        with lock.read():
+            both_inside.wait()
+
+    readers = [_in_thread(_reader) for _ in range(2)]
+    for reader in readers:
+        reader.join(2)
+    assert not any(reader.is_alive() for reader in readers)
+
+    lock.acquire_write()
+    entered = threading.Event()
+
+    def _blocked_reader():
+        with lock.read():
+            entered.set()
+
+    blocked = _in_thread(_blocked_reader)
+    assert not entered.wait(0.1)
+    lock.release_write()
+    assert entered.wait(2)
+    blocked.join(2)
+
+
+def test_single_flight_runs_one_call_per_key():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def _build():
+        calls.append(1)
+        release.wait(2)
+        return "index"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = [pool.submit(flight.do, "user-1", _build) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+    assert [future.result() for future in results] == ["index"] * 4
+    assert len(calls) == 1
+
+
+def test_a_writer_only_blocks_its_own_user(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    _ingest(pipeline, 1, "Le backend utilise Flask.")
+    _ingest(pipeline, 2, "Le frontend utilise Vue.")
+
+    pipeline._user_locks.get(1).acquire_write()  # a long upload for user 1
+    other_user = _in_thread(lambda: _ingest(pipeline, 2, "Et Vite.", source="vite.md"))
+    other_user.join(5)
+    assert not other_user.is_alive()
+    assert pipeline.retrieve("Vite", user_id=2)
+
+    same_user = _in_thread(lambda: pipeline.retrieve("Flask", user_id=1))
+    same_user.join(0.2)
+    assert same_user.is_alive()
+    pipeline._user_locks.get(1).release_write()
+    same_user.join(5)
+    assert not same_user.is_alive()
+
+
+def test_concurrent_misses_trigger_a_single_bm25_rebuild(tmp_path, monkeypatch):
+    pipeline = _pipeline(tmp_path)
+    _ingest(pipeline, 1, "Le backend utilise Flask et SQLAlchemy.")
+    builds = []
+
+    class SlowIndex(UserBM25Index):
+        def __init__(self, *args, **kwargs):
+            builds.append(1)
+            time.sleep(0.2)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline_module, "UserBM25Index", SlowIndex)
+    start = threading.Barrier(8)
+
+    def _query(_):
+        start.wait()
+        return pipeline.retrieve("Flask", user_id=1)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(_query, range(8)))
+
+    assert len(builds) == 1
+    assert results[0] and all(hits == results[0] for hits in results)
+
+
+def test_mixed_query_and_ingest_stress_leaves_fresh_indexes(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    users = [1, 2, 3]
+    for user_id in users:
+        _ingest(pipeline, user_id, f"Note de départ de l'utilisateur {user_id}.")
+    rng = random.Random(7)
+    errors = []
+
+    def _worker(worker_id):
+        try:
+            for step in range(10):
+                user_id = rng.choice(users)
+                if worker_id % 3 == 0:
+                    _ingest(
+                        pipeline, user_id, f"Ajout {worker_id}-{step}.", f"n{worker_id}-{step}.md"
+                    )
+                else:
+                    hits = pipeline.retrieve("utilisateur ajout", user_id=user_id)
+                    assert all(hit["metadata"]["user_id"] == user_id for hit in hits)
+        except Exception as err:  # noqa: BLE001 - reported below
+            errors.append(err)
+
+    threads = [_in_thread(lambda worker_id=i: _worker(worker_id)) for i in range(9)]
+    for thread in threads:
+        thread.join(60)
+
+    assert not errors
+    for user_id in users:
+        stored = pipeline._load_vectorstore().get(where={"user_id": user_id})["ids"]
+        assert sorted(pipeline._bm25_index(user_id).ids) == sorted(stored)
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import text
+
+from backend.app import create_app
+from backend.config import BaseConfig
+from backend.extensions import db
+from backend.models import UsageDaily, UsageLog
+
+from .conftest import auth_headers, register
+
+
+def _file_app(tmp_path, **overrides):
+    config = type(
+        "FileConfig",
+        (BaseConfig,),
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path}/app.db",
+            "JWT_SECRET_KEY": "test-secret-key-long-enough-for-hs256-signing",
+            "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+            "VECTOR_STORE_FOLDER": str(tmp_path / "vectorstore"),
+            "RATELIMIT_ENABLED": False,
+            **overrides,
+        },
+    )
+    return create_app(config)
+
+
+def _pragmas(app):
+    with app.app_context():
+        return {
+            name: db.session.execute(text(f"PRAGMA {name}")).scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout")
+        }
+
+
+def test_file_sqlite_is_tuned_for_concurrent_workers(tmp_path):
+    app = _file_app(tmp_path, SQLITE_BUSY_TIMEOUT_MS=2500, DB_POOL_SIZE=3)
+
+    assert _pragmas(app) == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 2500}
+    with app.app_context():
+        assert db.engine.pool.size() == 3
+
+
+def test_tuning_can_be_turned_off(tmp_path):
+    app = _file_app(tmp_path, SQLITE_TUNING=False)
+
+    assert _pragmas(app)["journal_mode"] == "delete"
+
+
+def test_invalid_synchronous_mode_fails_at_startup(tmp_path):
+    with pytest.raises(ValueError, match="SQLITE_SYNCHRONOUS"):
+        _file_app(tmp_path, SQLITE_SYNCHRONOUS="SOMETIMES")
+
+
+def test_buffered_usage_rows_are_written_in_one_batch(tmp_path):
+    app = _file_app(tmp_path, USAGE_BUFFER=True, USAGE_BUFFER_INTERVAL_MS=60_000)
+    client = app.test_client()
+    token, _ = register(client, "buffer@example.com")
+
+    for _ in range(3):
+        client.post("/api/chat/query", json={"message": "Bonjour"}, headers=auth_headers(token))
+    with app.app_context():
+        assert UsageLog.query.count() == 0
+
+    assert app.extensions["usage_buffer"].flush() == 3
+    with app.app_context():
+        assert UsageLog.query.count() == 3
+        assert UsageDaily.query.one().calls == 3
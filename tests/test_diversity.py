@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from backend.rag.diversity import cap_per_note, mmr_select
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+DUPLICATE = "Compte rendu du comité produit : la roadmap est validée."
+
+
+def test_mmr_skips_a_near_duplicate_of_the_first_pick():
+    embeddings = np.array([[1.0, 0.0], [0.999, 0.045], [0.0, 1.0]])
+
+    assert mmr_select([0.9, 0.89, 0.5], embeddings, 2, lambda_=0.5) == [0, 2]
+    assert mmr_select([0.9, 0.89, 0.5], embeddings, 2, lambda_=1.0) == [0, 1]
+    assert mmr_select([], np.empty((0, 2)), 2, lambda_=0.5) == []
+
+
+def test_note_cap_keeps_the_best_chunks_of_each_note():
+    candidates = [{"metadata": {"source": source}} for source in ("a", "a", "b", "a", "c")]
+
+    selected = cap_per_note(candidates, 3, max_per_note=1)
+
+    assert [c["metadata"]["source"] for c in selected] == ["a", "b", "c"]
+
+
+def _ingest(pipeline):
+    for source in ("a.md", "a.md", "a.md"):
+        pipeline.ingest_uploaded_text(DUPLICATE, metadata={"source": source, "user_id": 1})
+    for source in ("b.md", "c.md"):
+        pipeline.ingest_uploaded_text(
+            f"Autre note {source} sur le budget.", metadata={"source": source, "user_id": 1}
+        )
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"diversity": "note_cap", "max_chunks_per_note": 1},
+        {"diversity": "mmr", "mmr_lambda": 0.3},
+        {"diversity": "mmr", "mmr_lambda": 0.3, "dense_backend": "exact"},
+    ],
+)
+def test_duplicate_chunks_of_a_note_make_room_for_other_notes(tmp_path, config):
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(final_k=3, **config)
+    )
+    _ingest(pipeline)
+
+    hits = pipeline.retrieve(DUPLICATE, user_id=1)
+
+    assert hits[0]["metadata"]["source"] == "a.md"
+    assert sorted(hit["metadata"]["source"] for hit in hits) == ["a.md", "b.md", "c.md"]
+
+
+def test_without_diversity_the_duplicates_fill_the_top_k(tmp_path):
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(final_k=3)
+    )
+    _ingest(pipeline)
+
+    hits = pipeline.retrieve(DUPLICATE, user_id=1)
+
+    assert [hit["metadata"]["source"] for hit in hits] == ["a.md"] * 3
+
+
+def test_diversity_settings_are_validated():
+    with pytest.raises(ValueError, match="diversity"):
+        RetrievalConfig(diversity="random")
+    with pytest.raises(ValueError, match="mmr_lambda"):
+        RetrievalConfig(mmr_lambda=1.5)
@@ -0,0 +1,117 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.evals.benchmarks import bench_embeddings
+from backend.rag import pipeline as pipeline_module
+from backend.rag.embedding_batcher import MicroBatchEmbeddings
+from backend.rag.pipeline import RAGPipeline
+
+
+class RecordingEmbedding(DeterministicFakeEmbedding):
+    """Fake model recording the size of every forward pass."""
+
+    batches: list[int] = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return super().embed_documents(texts)
+
+
+def _model():
+    return RecordingEmbedding(size=16)
+
+
+def test_concurrent_queries_share_a_forward_pass():
+    model = _model()
+    batcher = MicroBatchEmbeddings(model, window_ms=200, max_batch=32)
+    queries = [f"question {i}" for i in range(8)]
+    barrier = threading.Barrier(len(queries))
+
+    def _embed(query):
+        barrier.wait()
+        return batcher.embed_query(query)
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        vectors = list(pool.map(_embed, queries))
+
+    assert sum(model.batches) == len(queries)
+    assert len(model.batches) < len(queries)
+    assert vectors == [model.embed_query(query) for query in queries]
+
+
+def test_queries_are_split_at_max_batch():
+    model = _model()
+    batcher = MicroBatchEmbeddings(model, window_ms=200, max_batch=4)
+    queries = [f"question {i}" for i in range(10)]
+    barrier = threading.Barrier(len(queries))
+
+    def _embed(query):
+        barrier.wait()
+        return batcher.embed_query(query)
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        list(pool.map(_embed, queries))
+
+    assert sum(model.batches) == len(queries)
+    assert max(model.batches) <= 4
+
+
+def test_queries_do_not_wait_behind_bulk_documents():
+    release = threading.Event()
+
+    class SlowBulk(RecordingEmbedding):
+        def embed_documents(self, texts):
+            if len(texts) > 1:
+                release.wait(timeout=5)
+            return super().embed_documents(texts)
+
+    batcher = MicroBatchEmbeddings(SlowBulk(size=16), window_ms=1)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        upload = pool.submit(batcher.embed_documents, [f"chunk {i}" for i in range(1000)])
+        # The upload is still embedding: the query is served meanwhile.
+        assert batcher.embed_query("question") == DeterministicFakeEmbedding(size=16).embed_query(
+            "question"
+        )
+        assert not upload.done()
+        release.set()
+        assert len(upload.result()) == 1000
+
+
+def test_model_errors_reach_every_caller():
+    class Failing(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            raise RuntimeError("model unavailable")
+
+    batcher = MicroBatchEmbeddings(Failing(size=4), window_ms=1)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        batcher.embed_query("question")
+
+
+def test_pipeline_wraps_the_model_when_a_window_is_set(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_module, "EMBEDDING_BATCH_WINDOW_MS", 2.0)
+    pipeline = RAGPipeline(persist_directory=str(tmp_path / "vs"))
+    pipeline.ingest_uploaded_text(
+        "# Docker\n\nLe déploiement passe par Docker.",
+        metadata={"source": "docker.md", "user_id": 1},
+        content_type="text/markdown",
+    )
+
+    assert isinstance(pipeline.embedding, MicroBatchEmbeddings)
+    assert pipeline.retrieve("Docker", user_id=1)[0]["metadata"]["source"] == "docker.md"
+
+
+def test_bench_embeddings_reports_latency_and_throughput():
+    results = bench_embeddings(
+        {"per-call": _model(), "micro-batch": MicroBatchEmbeddings(_model(), window_ms=1)},
+        [f"q{i}" for i in range(20)],
+        concurrency=4,
+    )
+
+    assert set(results) == {"per-call", "micro-batch"}
+    for summary in results.values():
+        assert summary["requests"] == 20
+        assert 0 <= summary["p50_ms"] <= summary["p99_ms"]
+        assert summary["qps"] > 0
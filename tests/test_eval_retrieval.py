@@ -3,12 +3,13 @@ import shutil
 from pathlib import Path
 
 from backend.evals.goldset import GoldItem, save_goldset
-from backend.evals.retrieval import evaluate_retrieval
+from backend.evals.retrieval import evaluate_retrieval, sweep_fusion
 from backend.extensions import db
 from backend.models import User
 from backend.rag.connectors import ObsidianConnector
 from backend.rag.ingestion import chunk_markdown
 from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
 from backend.rag.sync import sync_vault
 
 FIXTURE_VAULT = Path(__file__).parent / "fixtures" / "vault"
@@ -119,3 +120,44 @@ def test_cli_eval_retrieval_writes_run_file(app, tmp_path, monkeypatch):
     assert payload["config"]["chunking"]["markdown_max_section_chars"]
     assert len(payload["questions"]) == 2
     assert {"expected_note_paths", "retrieved_note_paths"} <= set(payload["questions"][0])
+
+
+def test_eval_retrieval_reports_dense_latency_and_scanned_bytes(app, tmp_path):
+    pipeline, user_id, _ = _synced_pipeline(app, tmp_path)
+    pipeline.config = RetrievalConfig(dense_backend="exact", dense_quantization="int8")
+
+    with app.app_context():
+        result = evaluate_retrieval(_goldset(), pipeline=pipeline, user_id=user_id, k=5)
+
+    assert result["metrics"]["recall@1"] == 1.0
+    assert result["metrics"]["dense_search_p50_ms"] >= 0
+    chunks = pipeline._exact_index(user_id).size
+    # int8 codes (one byte per dimension) plus the per-dimension scale.
+    assert result["metrics"]["dense_scanned_bytes"] == chunks * 64 + 64 * 4
+
+
+def test_fusion_sweep_ranks_every_setting(app, tmp_path):
+    pipeline, user_id, _ = _synced_pipeline(app, tmp_path)
+    config = pipeline.config
+
+    with app.app_context():
+        sweep = sweep_fusion(
+            _goldset(),
+            pipeline=pipeline,
+            user_id=user_id,
+            modes=("rrf", "zscore"),
+            dense_weights=(0.2, 0.8),
+            metric="mrr",
+        )
+
+    settings = sweep["settings"]
+    assert {(s["fusion"], s["fusion_dense_weight"]) for s in settings} == {
+        ("rrf", 0.2),
+        ("rrf", 0.8),
+        ("zscore", 0.2),
+        ("zscore", 0.8),
+    }
+    scores = [s["metrics"]["mrr"] for s in settings]
+    assert scores == sorted(scores, reverse=True)
+    assert sweep["best"]["metrics"] == settings[0]["metrics"]
+    assert pipeline.config == config
@@ -0,0 +1,181 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.evals.benchmarks import UnitFakeEmbedding
+from backend.rag.exact_search import ExactIndex, binary_codes, int8_codes, normalize_rows
+from backend.rag.filters import MetadataFilter
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+QUERY = "notes sur la roadmap"
+
+
+def _pipeline(tmp_path, **config):
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(final_k=5, **config)
+    )
+    pipeline._embedding = UnitFakeEmbedding(size=64)
+    return pipeline
+
+
+def _ingest(pipeline, user_id, count, start=0):
+    pipeline.ingest_texts(
+        [f"Note {i} de l'utilisateur {user_id}." for i in range(start, start + count)],
+        base_metadata={"source": f"{user_id}.md", "user_id": user_id},
+    )
+
+
+def test_search_returns_the_top_k_by_cosine():
+    vectors = np.array([[1.0, 0.0], [0.0, 2.0], [3.0, 3.0], [-1.0, 0.0]])
+    index = ExactIndex(size=4, matrix=normalize_rows(vectors))
+
+    hits = index.search([0.0, 1.0], 2)
+
+    assert [row for row, _ in hits] == [1, 2]
+    assert np.isclose(hits[0][1], 1.0)
+    assert [row for row, _ in index.search([0.0, 1.0], 10)] == [1, 2, 0, 3]
+
+
+def test_exact_backend_matches_chroma(tmp_path):
+    _ingest(_pipeline(tmp_path), 1, 30)
+    _ingest(_pipeline(tmp_path), 2, 30)
+
+    chroma = _pipeline(tmp_path).retrieve(QUERY, user_id=1)
+    exact = _pipeline(tmp_path, dense_backend="exact").retrieve(QUERY, user_id=1)
+
+    assert [hit["content"] for hit in exact] == [hit["content"] for hit in chroma]
+    assert np.allclose([h["score"] for h in exact], [h["score"] for h in chroma], atol=1e-5)
+    assert {hit["metadata"]["user_id"] for hit in exact} == {1}
+
+
+def test_index_is_kept_in_sync_on_ingest_and_delete(tmp_path):
+    pipeline = _pipeline(tmp_path, dense_backend="exact")
+    _ingest(pipeline, 1, 3)
+    assert pipeline._exact_index(1).size == 3
+
+    _ingest(pipeline, 1, 2, start=3)
+    index = pipeline._exact_index(1)
+    assert index.size == 5
+    pipeline.delete_chunks(index.ids[:4], user_id=1)
+
+    assert pipeline._exact_index(1).size == 1
+    assert len(pipeline.retrieve(QUERY, user_id=1)) == 1
+    # The current matrix and its three code arrays; older ones are removed.
+    assert len(list((tmp_path / "vs" / "exact-search").glob("1-*.npy"))) == 4
+
+
+def test_writes_update_the_saved_index_without_a_rebuild(tmp_path, monkeypatch):
+    pipeline = _pipeline(tmp_path, dense_backend="exact")
+    _ingest(pipeline, 1, 3)
+    before = pipeline._exact_index(1)
+    builds = []
+    monkeypatch.setattr(pipeline, "_build_exact_index", lambda user_id: builds.append(user_id))
+
+    pipeline.ingest_uploaded_text(
+        "Roadmap du projet.", metadata={"source": "r.md", "folder": "Projets", "user_id": 1}
+    )
+    pipeline.delete_chunks(before.ids[:1], user_id=1)
+    pipeline.ingest_documents(
+        [Document(page_content="Note 1 réécrite.", metadata={"source": "1.md", "user_id": 1})],
+        ids=[before.ids[1]],
+    )
+
+    index = pipeline._exact_index(1)
+    assert builds == []
+    assert index.size == 3 and len(set(index.ids)) == 3
+    assert before.ids[0] not in index.ids and index.ids[-1] == before.ids[1]
+    assert len(pipeline.retrieve(QUERY, user_id=1, filters=MetadataFilter(folder="Projets"))) == 1
+    # Same hits as Chroma's over the same chunks.
+    chroma = _pipeline(tmp_path).retrieve(QUERY, user_id=1)
+    exact = pipeline.retrieve(QUERY, user_id=1)
+    assert [hit["content"] for hit in exact] == [hit["content"] for hit in chroma]
+    assert np.allclose([h["score"] for h in exact], [h["score"] for h in chroma], atol=1e-5)
+
+
+def test_an_update_past_the_threshold_falls_back_to_a_rebuild(tmp_path):
+    pipeline = _pipeline(tmp_path, dense_backend="exact", exact_max_chunks=3)
+    _ingest(pipeline, 1, 3)
+    assert pipeline._exact_index(1).size == 3
+
+    _ingest(pipeline, 1, 1, start=3)
+
+    assert pipeline._exact_indexes.load(1) is None
+    assert pipeline._exact_index(1) is None
+
+
+def test_another_process_sees_a_rebuilt_index(tmp_path):
+    reader = _pipeline(tmp_path, dense_backend="exact")
+    writer = _pipeline(tmp_path, dense_backend="exact")
+    _ingest(writer, 1, 2)
+    assert len(reader.retrieve(QUERY, user_id=1)) == 2
+
+    _ingest(writer, 1, 2, start=2)
+
+    assert len(reader.retrieve(QUERY, user_id=1)) == 4
+
+
+def test_rebuild_racing_an_invalidation_is_not_saved(tmp_path):
+    reader = _pipeline(tmp_path, dense_backend="exact")
+    writer = _pipeline(tmp_path, dense_backend="exact")
+    _ingest(writer, 1, 2)
+    # The reader's rebuild read its data before the writer's ingestion...
+    stale = reader._exact_indexes.generation(1)
+    _ingest(writer, 1, 2, start=2)
+    index = reader._exact_indexes.save(
+        1, 2, ids=["a", "b"], embeddings=np.eye(2, 64), metadatas=[{}, {}], generation=stale
+    )
+
+    # ...so it only serves the query that built it.
+    assert index.size == 2
+    assert reader._exact_indexes.load(1) is None
+    assert len(reader.retrieve(QUERY, user_id=1)) == 4
+    assert len(list((tmp_path / "vs" / "exact-search").glob("1-*.npy"))) == 4
+
+
+def test_sidecar_of_an_older_generation_counts_as_missing(tmp_path):
+    pipeline = _pipeline(tmp_path, dense_backend="exact")
+    _ingest(pipeline, 1, 2)
+    assert pipeline._exact_index(1).size == 2
+    store = pipeline._exact_indexes
+    sidecar = store.directory / "1.json"
+    saved = sidecar.read_bytes()
+
+    # A rebuild that passed its check just before the invalidation lands after it.
+    store.invalidate(1)
+    sidecar.write_bytes(saved)
+
+    assert store.load(1) is None
+
+
+def test_users_above_the_threshold_fall_back_to_chroma(tmp_path):
+    pipeline = _pipeline(tmp_path, dense_backend="exact", exact_max_chunks=3)
+    _ingest(pipeline, 1, 4)
+    _ingest(pipeline, 2, 2)
+
+    assert pipeline._exact_index(1) is None
+    assert pipeline._exact_indexes.load(1).size == 4
+    assert pipeline._exact_index(2).size == 2
+    assert len(pipeline.retrieve(QUERY, user_id=1)) == 4
+
+
+def test_binary_codes_count_differing_signs():
+    codes = binary_codes(np.array([[0.5, -0.2, 0.1], [-0.5, -0.2, 0.1]]))
+
+    assert codes.dtype == np.uint64 and codes.shape == (2, 1)
+    assert np.bitwise_count(codes[0] ^ codes[1]).sum() == 1
+
+
+def test_quantized_first_pass_is_rescored_in_full_precision():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 64))
+    matrix = normalize_rows(centers[rng.integers(0, 20, 2000)] + rng.normal(size=(2000, 64)))
+    int8, int8_scale = int8_codes(matrix)
+    index = ExactIndex(
+        size=2000, matrix=matrix, binary=binary_codes(matrix), int8=int8, int8_scale=int8_scale
+    )
+    query = centers[3] + rng.normal(size=64)
+
+    exact = index.search(query, 5)
+    for quantization in ("binary", "int8"):
+        assert index.search(query, 5, quantization, oversample=40) == exact
+    assert index.scanned_bytes("binary") * 32 == index.scanned_bytes()
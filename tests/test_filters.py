@@ -0,0 +1,196 @@
+import pytest
+
+from backend.rag import get_pipeline
+from backend.rag import pipeline as pipeline_module
+from backend.rag.filters import FilterPostings, MetadataFilter, scope_fields
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+from .conftest import auth_headers, register
+
+NOTES = [
+    ("Projets/Alpha/plan.md", ["projet/alpha", "urgent"], "2025-03-02T10:00:00"),
+    ("Projets/Beta.md", ["projet/beta"], "2025-01-15T09:30:00"),
+    ("Recettes/Tarte.md", ["cuisine"], "2024-11-20T18:00:00"),
+    ("Journal/2025-03-01.md", ["journal"], "2025-03-01T23:59:00"),
+]
+
+
+def _ingest(pipeline, user_id=1):
+    for path, tags, modified_at in NOTES:
+        folder = path.rpartition("/")[0]
+        for i in range(4):
+            pipeline.ingest_uploaded_text(
+                f"Paragraphe {i} de la note {path} sur le budget et le planning.",
+                metadata={
+                    "source": path,
+                    "note_path": path,
+                    "folder": folder,
+                    "tags": tags,
+                    "modified_at": modified_at,
+                    "user_id": user_id,
+                },
+            )
+
+
+def _pipeline(tmp_path, **config):
+    return RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(final_k=6, **config)
+    )
+
+
+def test_filter_from_payload():
+    scope = MetadataFilter.from_dict(
+        {"tags": ["#projet"], "folder": "/Projets/", "modified_after": "2025-01-01"}
+    )
+
+    assert scope == MetadataFilter(tags=("projet",), folder="Projets", modified_after="2025-01-01")
+    assert MetadataFilter.from_dict({}) is None
+    assert MetadataFilter.from_dict({"tags": [], "folder": ""}) is None
+    for payload in (
+        {"color": "red"},
+        {"tags": [1]},
+        {"modified_before": "hier"},
+        {"folder": 3},
+        ["Projets"],
+    ):
+        with pytest.raises(ValueError):
+            MetadataFilter.from_dict(payload)
+
+
+def test_postings_match_nested_tags_subfolders_and_whole_days():
+    postings = FilterPostings(
+        [
+            {"tags": ["projet/alpha"], "folder": "Projets/Alpha", "modified_at": NOTES[0][2]},
+            {"tags": "projet/beta, urgent", "folder": "Projets", "modified_at": NOTES[1][2]},
+            {"tags": ["cuisine"], "folder": "Recettes"},
+        ]
+    )
+
+    def rows(**scope):
+        return postings.rows(MetadataFilter(**scope)).tolist()
+
+    assert rows(tags=("projet",)) == [0, 1]
+    assert rows(tags=("urgent", "cuisine")) == [1, 2]
+    assert rows(folder="Projets") == [0, 1]
+    assert rows(folder="Projets/Alpha") == [0]
+    assert rows(folder="Projet") == []
+    # A date alone as upper bound includes that whole day; no date, no match.
+    assert rows(modified_before="2025-01-15") == [1]
+    assert rows(modified_after="2025-02-01", tags=("projet",)) == [0]
+
+
+def test_chroma_clauses_come_from_the_filter_and_stored_scope_fields():
+    fields = scope_fields(
+        {"tags": "projet/beta, urgent", "folder": "Projets/Beta", "modified_at": NOTES[1][2]}
+    )
+    assert fields["tag_paths"] == ["projet", "projet/beta", "urgent"]
+    assert fields["folder_paths"] == ["Projets", "Projets/Beta"]
+    assert fields["modified_ts"] == 1736933400
+    assert "modified_ts" not in scope_fields({"modified_at": "hier"})
+
+    assert MetadataFilter(tags=("projet", "urgent"), folder="Projets").chroma_clauses() == [
+        {"$or": [{"tag_paths": {"$contains": "projet"}}, {"tag_paths": {"$contains": "urgent"}}]},
+        {"folder_paths": {"$contains": "Projets"}},
+    ]
+    # A date alone as upper bound includes that whole day.
+    assert MetadataFilter(modified_before="2025-01-15").chroma_clauses() == [
+        {"modified_ts": {"$lte": 1736985599}}
+    ]
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"dense_backend": "chroma"},
+        {"dense_backend": "chroma", "partitioning": "user"},
+        {"dense_backend": "exact"},
+        {"dense_backend": "exact", "dense_quantization": "int8"},
+        {"hybrid_enabled": True},
+    ],
+)
+def test_scoped_retrieval_returns_k_hits_in_scope(tmp_path, config):
+    pipeline = _pipeline(tmp_path, **config)
+    _ingest(pipeline)
+
+    hits = pipeline.retrieve(
+        "budget planning", user_id=1, top_k=3, filters=MetadataFilter(folder="Projets")
+    )
+
+    assert len(hits) == 3
+    assert {hit["metadata"]["folder"] for hit in hits} <= {"Projets", "Projets/Alpha"}
+    dated = pipeline.retrieve(
+        "budget", user_id=1, filters=MetadataFilter(modified_after="2025-03-01")
+    )
+    assert {hit["metadata"]["note_path"] for hit in dated} == {
+        "Projets/Alpha/plan.md",
+        "Journal/2025-03-01.md",
+    }
+    assert pipeline.retrieve("budget", user_id=1, filters=MetadataFilter(tags=("absent",))) == []
+
+
+def test_scopes_are_per_user_and_follow_deletions(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    _ingest(pipeline, user_id=1)
+    _ingest(pipeline, user_id=2)
+    scope = MetadataFilter(tags=("cuisine",))
+
+    hits = pipeline.retrieve("budget", user_id=1, filters=scope)
+    assert len(hits) == 4 and {hit["metadata"]["user_id"] for hit in hits} == {1}
+
+    pipeline.delete_chunks([hits[0]["metadata"]["chunk_id"]], user_id=1)
+
+    assert len(pipeline.retrieve("budget", user_id=1, filters=scope)) == 3
+
+
+def test_scoped_dense_search_sees_notes_ingested_by_another_worker(tmp_path):
+    reader = _pipeline(tmp_path, dense_backend="chroma")
+    writer = _pipeline(tmp_path, dense_backend="chroma")
+    _ingest(reader)
+    assert reader.retrieve("budget", user_id=1, filters=MetadataFilter(folder="Archives")) == []
+
+    writer.ingest_uploaded_text(
+        "Budget de l'archive.",
+        metadata={"source": "a.md", "folder": "Archives/2020", "tags": ["vieux"], "user_id": 1},
+    )
+
+    for scope in (MetadataFilter(folder="Archives"), MetadataFilter(tags=("vieux",))):
+        hits = reader._dense_hits("budget", 1, 5, filters=scope)
+        assert len(hits) == 1
+
+
+def test_chunks_stored_without_scope_fields_are_backfilled(tmp_path, monkeypatch):
+    pipeline = _pipeline(tmp_path, dense_backend="chroma")
+    with monkeypatch.context() as patch:
+        patch.setattr(pipeline_module, "_with_scope_fields", lambda docs: docs)
+        _ingest(pipeline)
+
+    hits = pipeline.retrieve("budget", user_id=1, top_k=3, filters=MetadataFilter(folder="Projets"))
+
+    assert len(hits) == 3
+    assert all("folder_paths" not in hit["metadata"] for hit in hits)
+
+
+def test_query_route_accepts_filters(app, client):
+    token, user_id = register(client, "scope@example.com")
+    with app.app_context():
+        pipeline = get_pipeline(
+            persist_directory=app.config["VECTOR_STORE_FOLDER"], top_k=app.config["RAG_TOP_K"]
+        )
+    _ingest(pipeline, user_id=user_id)
+
+    response = client.post(
+        "/api/chat/query",
+        json={"message": "Quel budget ?", "filters": {"folder": "Recettes"}},
+        headers=auth_headers(token),
+    )
+    assert response.status_code == 200
+    assert {source["source"] for source in response.get_json()["sources"]} == {"Recettes/Tarte.md"}
+
+    response = client.post(
+        "/api/chat/query",
+        json={"message": "Quel budget ?", "filters": {"modified_after": "mars"}},
+        headers=auth_headers(token),
+    )
+    assert response.status_code == 400
+    assert "invalid date" in response.get_json()["error"]
@@ -1,7 +1,7 @@
 import pytest
 
 from backend.evals.metrics import unique_ordered
-from backend.rag.fusion import rrf_fuse
+from backend.rag.fusion import normalize_scores, rrf_fuse, score_fuse
 
 
 def test_rrf_hand_computed():
@@ -24,3 +24,55 @@ def test_rrf_single_ranking_preserves_order():
 def test_rrf_empty():
     assert rrf_fuse([]) == {}
     assert unique_ordered([]) == []
+
+
+def test_weighted_rrf_scales_each_list():
+    scores = rrf_fuse([["A"], ["B"]], k=60, weights=[1.5, 0.5])
+
+    assert scores["A"] == pytest.approx(1.5 / 61)
+    assert scores["B"] == pytest.approx(0.5 / 61)
+
+
+@pytest.mark.parametrize(
+    ("method", "expected"),
+    [
+        ("minmax", [1.0, 0.5, 0.0]),
+        ("zscore", [1.224745, 0.0, -1.224745]),
+        ("dbsf", [0.704124, 0.5, 0.295876]),
+    ],
+)
+def test_normalize_scores(method, expected):
+    assert normalize_scores([3.0, 2.0, 1.0], method) == pytest.approx(expected, abs=1e-6)
+
+
+def test_normalize_constant_scores():
+    assert normalize_scores([2.0, 2.0], "minmax").tolist() == [1.0, 1.0]
+    assert normalize_scores([2.0, 2.0], "zscore").tolist() == [0.0, 0.0]
+    with pytest.raises(ValueError):
+        normalize_scores([1.0], "rank")
+
+
+def test_score_fusion_keeps_score_gaps_that_rrf_drops():
+    # Dense barely prefers A; BM25 strongly prefers B.
+    runs = [(["A", "B", "C"], [0.91, 0.90, 0.10]), (["B", "A"], [12.0, 1.0])]
+
+    rrf = rrf_fuse([ids for ids, _ in runs])
+    fused = score_fuse(runs, [0.5, 0.5], "minmax")
+
+    assert rrf["A"] == rrf["B"]
+    assert fused["B"] > fused["A"] > fused["C"]
+    # C is missing from the BM25 list: it gets 0 there.
+    assert fused["C"] == pytest.approx(0.0)
+
+
+def test_zscore_fusion_gives_missing_items_the_worst_score():
+    fused = score_fuse([(["A", "B"], [2.0, 1.0]), (["C"], [5.0])], [0.5, 0.5], "zscore")
+
+    # Each item gets the other list's floor (-1 for the first, 0 for the second).
+    assert fused["A"] == pytest.approx(0.5 * 1.0)
+    assert fused["B"] == pytest.approx(0.5 * -1.0)
+    assert fused["C"] == pytest.approx(0.5 * -1.0)
+
+
+def test_score_fusion_skips_empty_lists():
+    assert score_fuse([([], []), (["A"], [1.0])], [0.5, 0.5], "dbsf") == {"A": 0.5}
@@ -0,0 +1,120 @@
+import threading
+from datetime import UTC, datetime, timedelta
+
+from backend.extensions import db
+from backend.models import UsageLog
+from backend.rag import get_pipeline
+from backend.rag import warmer as warmer_module
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+from backend.rag.warmer import WarmupStatus, init_warmer, most_active_users, warm_pipeline
+
+from .conftest import auth_headers, register
+from .test_stream_route import _upload
+
+
+def _log_calls(user_id: int, count: int, days_ago: int = 0) -> None:
+    created_at = datetime.now(UTC) - timedelta(days=days_ago)
+    for _ in range(count):
+        db.session.add(
+            UsageLog(user_id=user_id, endpoint="chat.query", latency_ms=1.0, created_at=created_at)
+        )
+    db.session.commit()
+
+
+def test_ready_reports_503_until_models_and_store_are_loaded(client):
+    token, _ = register(client, "ready@example.com")
+
+    resp = client.get("/api/health/ready")
+    assert resp.status_code == 503
+    assert resp.get_json()["models"] == {"embedding": False}
+    assert resp.get_json()["vectorstore"] is False
+
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+    client.post("/api/chat/query", json={"message": "Flask ?"}, headers=auth_headers(token))
+
+    resp = client.get("/api/health/ready")
+    assert resp.status_code == 200
+    assert resp.get_json()["ready"] is True
+
+
+def test_ready_after_warmup_without_any_query(app, client):
+    with app.app_context():
+        get_pipeline(
+            persist_directory=app.config["VECTOR_STORE_FOLDER"], top_k=app.config["RAG_TOP_K"]
+        ).warmup()
+
+    resp = client.get("/api/health/ready")
+    assert resp.status_code == 200
+    assert resp.get_json()["vectorstore"] is True
+
+
+def test_most_active_users_ranks_recent_usage(app, client):
+    ids = [register(client, f"user{i}@example.com")[1] for i in range(3)]
+    with app.app_context():
+        _log_calls(ids[0], 2)
+        _log_calls(ids[1], 5)
+        _log_calls(ids[2], 9, days_ago=30)  # busiest, but outside the window
+
+        assert most_active_users(limit=5, lookback_days=7) == [ids[1], ids[0]]
+        assert most_active_users(limit=1, lookback_days=7) == [ids[1]]
+
+
+def test_warmer_prebuilds_bm25_for_active_users(app, client, tmp_path):
+    active, _idle = (register(client, f"warm{i}@example.com")[1] for i in range(2))
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(hybrid_enabled=True)
+    )
+    pipeline.ingest_uploaded_text(
+        "# Notes\n\nDu contenu.", metadata={"source": "notes.md", "user_id": active}
+    )
+    with app.app_context():
+        _log_calls(active, 3)
+    status = WarmupStatus()
+
+    warm_pipeline(app, pipeline, status)
+
+    assert status.state == "done", status.error
+    assert (status.users_total, status.users_warmed) == (1, 1)
+    assert set(pipeline._bm25_cache) == {active}
+    assert pipeline.readiness()["ready"] is True
+
+
+def test_ready_waits_for_a_running_warmer(app, client):
+    token, _ = register(client, "warming@example.com")
+    _upload(client, token, "notes.md", "# Notes\nDu contenu.")
+    client.post("/api/chat/query", json={"message": "contenu ?"}, headers=auth_headers(token))
+
+    app.extensions["rag_warmer"] = WarmupStatus(state="running", users_total=4, users_warmed=1)
+    resp = client.get("/api/health/ready")
+    assert resp.status_code == 503
+    assert resp.get_json()["warmer"]["users_warmed"] == 1
+
+    app.extensions["rag_warmer"].state = "done"
+    assert client.get("/api/health/ready").status_code == 200
+
+
+def test_wsgi_worker_starts_the_warmer_once_on_its_first_request(app, client, monkeypatch):
+    app.config["RAG_WARMER"] = True
+    init_warmer(app)
+    runs = []
+    finished = threading.Event()
+
+    def fake_warm(app, pipeline, status):
+        runs.append(status)
+        status.state = "done"
+        finished.set()
+
+    monkeypatch.setattr(warmer_module, "warm_pipeline", fake_warm)
+
+    client.get("/api/health/ready")
+    assert finished.wait(timeout=5)
+    client.get("/api/health/ready")
+    assert runs == [app.extensions["rag_warmer"]]
+
+    # A status inherited through fork: its thread is gone, the worker starts its own.
+    finished.clear()
+    runs[0].pid = -1
+    client.get("/api/health/ready")
+    assert finished.wait(timeout=5)
+    assert len(runs) == 2 and app.extensions["rag_warmer"] is runs[1]
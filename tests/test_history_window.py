@@ -0,0 +1,136 @@
+import threading
+from types import SimpleNamespace
+
+from sqlalchemy import inspect
+
+from backend.extensions import db
+from backend.models import ChatSummary, UsageLog, UsageStage
+from backend.rag import get_pipeline
+from backend.rag.retrieval_config import RetrievalConfig
+from backend.routes.chat import _fold_history, _load_history
+
+from .conftest import auth_headers, register
+from .test_chat_history import _count_queries, _seed
+
+
+def _pipeline(**config):
+    summaries = []
+
+    def summarize_history(summary, messages):
+        summaries.append(messages)
+        text = " | ".join([summary, *(msg["content"] for msg in messages)]).strip(" |")
+        return {"summary": text, "timings": {"summary": 1.0}, "usage": {}}
+
+    return SimpleNamespace(
+        config=RetrievalConfig(**config), summarize_history=summarize_history, summaries=summaries
+    )
+
+
+def test_history_reads_the_window_only_however_long_the_session(app, client):
+    _, user_id = register(client, "window@example.com")
+    (short_id,) = _seed(app, user_id, sessions=1, messages=4)
+    long_id = _seed(app, user_id, sessions=1, messages=200)[-1]
+    pipeline = _pipeline(history_window=3)
+
+    with app.app_context():
+        with _count_queries(app) as short_queries:
+            _load_history(pipeline, short_id)
+        with _count_queries(app) as long_queries:
+            history = _load_history(pipeline, long_id)
+
+    assert len(long_queries) == len(short_queries)
+    assert [msg["content"] for msg in history] == ["m197", "m198", "m199"]
+    assert [msg["role"] for msg in history] == ["assistant", "user", "assistant"]
+
+
+def test_only_the_last_answer_carries_its_sources(app, client):
+    _, user_id = register(client, "sources@example.com")
+    (session_id,) = _seed(app, user_id, sessions=1, messages=6)
+
+    with app.app_context():
+        history = _load_history(_pipeline(history_window=6), session_id)
+
+    assert [msg["role"] for msg in history] == ["user", "assistant"] * 3
+    assert [i for i, msg in enumerate(history) if "sources" in msg] == [5]
+
+
+def test_messages_leaving_the_window_are_folded_into_the_summary(app, client):
+    _, user_id = register(client, "fold@example.com")
+    (session_id,) = _seed(app, user_id, sessions=1, messages=6)
+    pipeline = _pipeline(history_window=2, history_summary=True)
+
+    with app.app_context():
+        assert _fold_history(pipeline, session_id)["timings"] == {"summary": 1.0}
+        assert _fold_history(pipeline, session_id) == {}
+        db.session.commit()
+        history = _load_history(pipeline, session_id)
+
+    assert [len(messages) for messages in pipeline.summaries] == [4]
+    assert history[0] == {"role": "summary", "content": "m0 | m1 | m2 | m3"}
+    assert [msg["content"] for msg in history[1:]] == ["m4", "m5"]
+
+
+def test_chat_turns_keep_a_running_summary(monkeypatch, app, client):
+    monkeypatch.setenv("CHAT_HISTORY_WINDOW", "2")
+    monkeypatch.setenv("CHAT_HISTORY_SUMMARY", "true")
+    token, _ = register(client, "summary@example.com")
+
+    session_id = None
+    for question in ("Premier sujet ?", "Deuxième sujet ?", "Troisième sujet ?"):
+        session_id = client.post(
+            "/api/chat/query",
+            json={"message": question, "session_id": session_id},
+            headers=auth_headers(token),
+        ).get_json()["session_id"]
+        app.extensions["background_tasks"].join()
+
+    with app.app_context():
+        summary = ChatSummary.query.filter_by(session_id=session_id).one()
+        assert summary.content.startswith("Premier sujet ? | ")
+        assert "Deuxième sujet ?" in summary.content
+        assert "Troisième" not in summary.content
+        assert UsageStage.query.filter_by(stage="summary").count() == 2
+        assert UsageLog.query.filter_by(endpoint="chat.summary").count() == 2
+        # The turns' own rows carry no summary call.
+        turns = UsageLog.query.filter_by(endpoint="chat.query").all()
+        assert "summary" not in {stage.stage for turn in turns for stage in turn.stages}
+
+
+def test_summary_fold_does_not_hold_up_the_turn(monkeypatch, app, client):
+    monkeypatch.setenv("CHAT_HISTORY_WINDOW", "2")
+    monkeypatch.setenv("CHAT_HISTORY_SUMMARY", "true")
+    token, _ = register(client, "async-fold@example.com")
+    release = threading.Event()
+    folds = []
+
+    def slow_summarize(summary, messages):
+        release.wait(timeout=5)
+        folds.append(messages)
+        return {"summary": "résumé", "timings": {"summary": 1.0}, "usage": {}}
+
+    first = client.post(
+        "/api/chat/query", json={"message": "Premier sujet ?"}, headers=auth_headers(token)
+    ).get_json()
+    app.extensions["background_tasks"].join()
+    get_pipeline(
+        persist_directory=app.config["VECTOR_STORE_FOLDER"], top_k=app.config["RAG_TOP_K"]
+    ).summarize_history = slow_summarize
+    try:
+        resp = client.post(
+            "/api/chat/query",
+            json={"message": "Deuxième sujet ?", "session_id": first["session_id"]},
+            headers=auth_headers(token),
+        )
+        # Answered while the fold it triggered is still blocked.
+        assert resp.status_code == 200
+        assert folds == []
+    finally:
+        release.set()
+    app.extensions["background_tasks"].join()
+    assert [len(messages) for messages in folds] == [2]
+
+
+def test_chat_messages_have_a_session_and_date_index(app):
+    with app.app_context():
+        indexes = inspect(db.engine).get_indexes("chat_messages")
+    assert ["session_id", "created_at"] in [index["column_names"] for index in indexes]
@@ -78,3 +78,29 @@ def test_bm25_index_invalidated_after_deletion(tmp_path):
     pipeline.delete_chunks(ids, user_id=1)
 
     assert pipeline.retrieve(QUERY, user_id=1) == []
+
+
+def test_score_fusions_leaning_on_bm25_rank_the_rare_token_first(tmp_path):
+    pipeline = _pipeline(tmp_path, hybrid_enabled=True, final_k=3)
+    _ingest_all(pipeline)
+
+    # Not zscore: BM25 matches z.md alone, and a one-hit list has no spread.
+    for fusion in ("minmax", "dbsf"):
+        pipeline.config = RetrievalConfig(
+            hybrid_enabled=True, final_k=3, fusion=fusion, fusion_dense_weight=0.3
+        )
+        top = pipeline.retrieve(QUERY, user_id=1)[0]["metadata"]
+        assert top["source"] == "z.md", fusion
+        assert top["fusion_score"] > 0 and top["bm25_score"] > 0
+        assert "rrf_score" not in top
+
+
+def test_dense_weight_one_ignores_bm25(tmp_path):
+    pipeline = _pipeline(tmp_path, hybrid_enabled=True, final_k=3, fusion_dense_weight=1.0)
+    _ingest_all(pipeline)
+    dense_pipeline = _pipeline(tmp_path, hybrid_enabled=False, final_k=3)
+
+    hits = pipeline.retrieve(QUERY, user_id=1)
+    dense_hits = dense_pipeline.retrieve(QUERY, user_id=1)
+
+    assert [hit["content"] for hit in hits] == [hit["content"] for hit in dense_hits]
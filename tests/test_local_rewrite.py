@@ -0,0 +1,106 @@
+from backend.evals.goldset import GoldItem
+from backend.evals.retrieval import evaluate_retrieval
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+from backend.rag.rewriter import LocalRewriter
+
+from .test_rewrite_policy import RecordingRewriter
+
+HISTORY = [
+    {"role": "user", "content": "Quel framework utilise le backend de AQUILA ?"},
+    {
+        "role": "assistant",
+        "content": "Le backend utilise Flask.",
+        "sources": [{"note_title": "Projet X", "heading_path": "Projet X > Architecture"}],
+    },
+]
+
+
+def test_local_rewriter_expands_with_sources_and_entities():
+    result = LocalRewriter().rewrite("Et la persistance ?", HISTORY)
+
+    assert result.terms == ["Projet X", "Architecture", "AQUILA"]
+    assert result.query == "Et la persistance ? Projet X Architecture AQUILA"
+    assert result.confidence == 0.9
+
+
+def test_local_rewriter_has_no_confidence_without_context():
+    result = LocalRewriter().rewrite("Docker ?", [])
+    assert result.query == "Docker ?"
+    assert result.confidence == 0.0
+
+
+def test_local_rewriter_leaves_a_topic_change_to_the_llm():
+    history = [
+        {"role": "user", "content": "Comment est organisé le backend de AQUILA ?"},
+        {"role": "assistant", "content": "En Flask.", "sources": [{"note_title": "Projet X"}]},
+    ]
+
+    # A new, self-contained question: no pronoun, nothing from the last turn.
+    assert LocalRewriter().rewrite("What is Docker?", history).confidence == 0.0
+    # A follow-up marker, or naming something from the last turn, still expands.
+    assert LocalRewriter().rewrite("Et son déploiement ?", history).confidence == 0.9
+    assert LocalRewriter().rewrite("AQUILA en prod ?", history).query == "AQUILA en prod ? Projet X"
+
+
+def _pipeline(tmp_path, **config_kwargs):
+    config = RetrievalConfig(local_rewrite=True, **config_kwargs)
+    pipeline = RAGPipeline(persist_directory=str(tmp_path / "vs"), config=config)
+    pipeline._rewriter = RecordingRewriter()
+    pipeline.ingest_uploaded_text(
+        "# Projet X\n\n## Architecture\n\nLa persistance passe par SQLite.",
+        metadata={"source": "Projet X.md", "note_path": "Projet X.md", "user_id": 1},
+        content_type="text/markdown",
+    )
+    return pipeline
+
+
+def test_confident_local_rewrite_skips_the_llm(tmp_path):
+    pipeline = _pipeline(tmp_path)
+
+    result = pipeline.query("Et la persistance ?", user_id=1, history=HISTORY)
+
+    assert result["query_rewritten"] == "Et la persistance ? Projet X Architecture AQUILA"
+    assert pipeline._rewriter.rewrites == []
+    assert pipeline._rewriter.condenses == []
+
+
+def test_low_confidence_falls_back_to_the_llm(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    history = [{"role": "user", "content": "Parle-moi du backend Flask."}]
+
+    result = pipeline.query("Et la persistance ?", user_id=1, history=history)
+
+    assert result["query_rewritten"] == "rewritten: Et la persistance ?"
+    assert pipeline._rewriter.rewrites == ["Et la persistance ?"]
+
+
+def test_topic_change_is_rewritten_by_the_llm(tmp_path):
+    pipeline = _pipeline(tmp_path)
+
+    result = pipeline.query("What is Docker?", user_id=1, history=HISTORY)
+
+    assert result["query_rewritten"] == "rewritten: What is Docker?"
+    assert pipeline._rewriter.rewrites == ["What is Docker?"]
+
+
+def test_eval_retrieval_compares_rewrite_tiers(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    items = [
+        GoldItem(
+            id="q001",
+            question="Et la persistance ?",
+            expected_note_paths=["Projet X.md"],
+            tags=["follow-up"],
+            history=HISTORY,
+        )
+    ]
+
+    local = evaluate_retrieval(items, pipeline=pipeline, user_id=1, k=3, rewrite_tier="local")
+    llm = evaluate_retrieval(items, pipeline=pipeline, user_id=1, k=3, rewrite_tier="llm")
+
+    assert local["rewrite_tiers"] == {"local": 1.0}
+    assert local["questions"][0]["rewrite"]["confidence"] == 0.9
+    assert llm["rewrite_tiers"] == {"llm": 1.0}
+    assert llm["questions"][0]["rewrite"]["query"] == "rewritten: Et la persistance ?"
+    assert local["metrics"]["recall@1"] == 1.0
@@ -0,0 +1,135 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from backend.app import create_app
+from backend.config import BaseConfig
+from backend.metrics import MetricsRegistry
+
+from .conftest import auth_headers, register
+from .test_stream_route import _upload
+
+
+@pytest.fixture(autouse=True)
+def _metrics_enabled(monkeypatch):
+    # Autouse: runs before the conftest app fixture reads the config.
+    monkeypatch.setattr(BaseConfig, "METRICS_ENABLED", True)
+
+
+def test_render_uses_the_prometheus_text_format():
+    metrics = MetricsRegistry()
+    metrics.observe("rag_stage_duration_seconds", 0.004, {"stage": "rerank"})
+    metrics.observe("rag_stage_duration_seconds", 20.0, {"stage": "rerank"})
+    metrics.inc("rag_llm_tokens_total", {"model": "claude-haiku-4-5", "kind": "input_tokens"}, 120)
+
+    lines = metrics.render({"rag_chroma_chunks": 42}).splitlines()
+
+    assert "# TYPE rag_stage_duration_seconds histogram" in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="rerank",le="0.0025"} 0' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="rerank",le="0.005"} 1' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="rerank",le="+Inf"} 2' in lines
+    assert 'rag_stage_duration_seconds_count{stage="rerank"} 2' in lines
+    assert 'rag_llm_tokens_total{kind="input_tokens",model="claude-haiku-4-5"} 120' in lines
+    assert "rag_chroma_chunks 42" in lines
+    assert not any(line.startswith("# TYPE rag_query_duration") for line in lines)
+
+
+def _forked_worker(metrics):
+    metrics.inc("rag_bm25_cache_requests_total", {"result": "hit"})
+    metrics.flush()
+
+
+# The child only touches the registry: gunicorn forks its workers the same way.
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")
+def test_workers_are_summed_and_dead_workers_keep_their_counts(tmp_path):
+    metrics = MetricsRegistry(str(tmp_path))
+    metrics.gauge_function("rag_bm25_cache_users", lambda: 3)
+    metrics.inc("rag_bm25_cache_requests_total", {"result": "hit"}, 2)
+    metrics.inc("rag_bm25_cache_requests_total", {"result": "miss"})
+
+    worker = multiprocessing.get_context("fork").Process(target=_forked_worker, args=(metrics,))
+    worker.start()
+    worker.join(10)
+    assert worker.exitcode == 0
+
+    lines = metrics.render().splitlines()
+    # The fork started from zero: 2 (parent) + 1 (worker), not 2 + 3.
+    assert 'rag_bm25_cache_requests_total{result="hit"} 3' in lines
+    assert "rag_bm25_cache_hit_ratio 0.75" in lines
+    # Gauges of the exited worker are dropped, the live process reports its own.
+    assert [line for line in lines if line.startswith("rag_bm25_cache_users")] == [
+        f'rag_bm25_cache_users{{pid="{os.getpid()}"}} 3'
+    ]
+    # The exited worker's file was folded into exited.json and removed.
+    assert {path.name for path in tmp_path.glob("*.json")} == {"exited.json", metrics._file.name}
+    assert 'rag_bm25_cache_requests_total{result="hit"} 3' in metrics.render().splitlines()
+
+
+def test_a_reused_pid_does_not_pass_for_a_live_worker(tmp_path):
+    metrics = MetricsRegistry(str(tmp_path))
+    metrics.inc("rag_bm25_cache_requests_total", {"result": "miss"})
+    # A file left by an exited worker whose pid now belongs to a live process.
+    stale = tmp_path / f"{os.getpid()}-1.json"
+    stale.write_text(
+        json.dumps(
+            {
+                "pid": os.getpid(),
+                "counters": [["rag_bm25_cache_requests_total", [["result", "miss"]], 4]],
+                "histograms": [],
+                "gauges": [["rag_bm25_cache_users", 7]],
+            }
+        )
+    )
+    stale.with_suffix(".lock").touch()
+
+    lines = metrics.render().splitlines()
+
+    assert 'rag_bm25_cache_requests_total{result="miss"} 5' in lines
+    assert not any(line.endswith(" 7") for line in lines)
+    assert not stale.exists() and not stale.with_suffix(".lock").exists()
+
+
+def test_values_are_published_by_a_timer_not_by_requests(tmp_path):
+    metrics = MetricsRegistry(str(tmp_path), flush_interval_s=0.01)
+    metrics.inc("rag_bm25_cache_requests_total", {"result": "hit"})
+
+    deadline = time.monotonic() + 5
+    while not metrics._file.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert json.loads(metrics._file.read_text())["counters"] == [
+        ["rag_bm25_cache_requests_total", [["result", "hit"]], 1.0]
+    ]
+
+
+def test_metrics_endpoint_reports_queries_stages_and_chroma(client):
+    token, _ = register(client, "metrics@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+    client.post(
+        "/api/chat/query", json={"message": "Quel framework ?"}, headers=auth_headers(token)
+    )
+
+    resp = client.get("/metrics")
+
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain; version=0.0.4")
+    body = resp.get_data(as_text=True)
+    assert 'rag_query_duration_seconds_count{endpoint="chat.query"}' in body
+    assert 'rag_stage_duration_seconds_count{stage="generation"}' in body
+    assert 'endpoint="chat.query_chat",method="POST",status="200"' in body
+    assert "rag_chroma_chunks 1" in body
+
+
+def test_metrics_endpoint_is_not_registered_when_disabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(BaseConfig, "METRICS_ENABLED", False)
+
+    class DisabledConfig(BaseConfig):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = "sqlite://"
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        VECTOR_STORE_FOLDER = str(tmp_path / "vectorstore")
+
+    assert create_app(DisabledConfig).test_client().get("/metrics").status_code == 404
@@ -0,0 +1,89 @@
+import pytest
+
+from backend.rag.partitioning import GLOBAL_COLLECTION, migrate_partitions
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+NOTES = {
+    1: ["Recette de la tarte aux pommes.", "Plan d'entraînement course à pied."],
+    2: ["Compte rendu de réunion produit."],
+    3: ["Liste de courses de la semaine.", "Idées de cadeaux.", "Budget mensuel."],
+}
+
+
+def _pipeline(tmp_path, **config):
+    return RAGPipeline(persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(**config))
+
+
+def _ingest(pipeline):
+    for user_id, texts in NOTES.items():
+        for i, text in enumerate(texts):
+            pipeline.ingest_uploaded_text(text, metadata={"source": f"{i}.md", "user_id": user_id})
+
+
+def _collections(pipeline):
+    return {c.name: c.count() for c in pipeline._chroma().list_collections()}
+
+
+def test_user_layout_keeps_one_collection_per_user(tmp_path):
+    pipeline = _pipeline(tmp_path, partitioning="user", final_k=5)
+    _ingest(pipeline)
+
+    assert _collections(pipeline) == {"user-1": 2, "user-2": 1, "user-3": 3}
+    assert pipeline._user_filter(1) is None
+    hits = pipeline.retrieve("courses", user_id=3)
+    assert len(hits) == 3
+    assert {hit["metadata"]["user_id"] for hit in hits} == {3}
+    assert pipeline.collection_size() == 6
+    assert not pipeline.is_empty()
+
+
+def test_hash_layout_filters_users_sharing_a_shard(tmp_path):
+    pipeline = _pipeline(tmp_path, partitioning="hash", partition_shards=2, hybrid_enabled=True)
+    _ingest(pipeline)
+
+    # Users 1 and 3 hash onto shard-1.
+    assert _collections(pipeline) == {"shard-0": 1, "shard-1": 5}
+    hits = pipeline.retrieve("recette", user_id=1)
+    assert len(hits) == 2
+    assert {hit["metadata"]["user_id"] for hit in hits} == {1}
+
+
+def test_deletion_without_a_user_reaches_every_partition(tmp_path):
+    pipeline = _pipeline(tmp_path, partitioning="user")
+    _ingest(pipeline)
+    ids = [
+        chunk_id
+        for user_id in NOTES
+        for chunk_id in pipeline._user_vectorstore(user_id).get()["ids"]
+    ]
+
+    pipeline.delete_chunks(ids)
+
+    assert pipeline.collection_size() == 0
+    assert pipeline.is_empty()
+
+
+def test_migration_moves_chunks_between_layouts(tmp_path):
+    _ingest(_pipeline(tmp_path))
+    client = _pipeline(tmp_path)._chroma()
+
+    assert migrate_partitions(client, "user", 16, batch_size=2) == {
+        "user-1": 2,
+        "user-2": 1,
+        "user-3": 3,
+    }
+    assert GLOBAL_COLLECTION not in {c.name for c in client.list_collections()}
+    assert migrate_partitions(client, "user", 16) == {}
+
+    migrate_partitions(client, "hash", 2)
+    pipeline = _pipeline(tmp_path, partitioning="hash", partition_shards=2, final_k=5)
+    assert _collections(pipeline) == {"shard-0": 1, "shard-1": 5}
+    assert len(pipeline.retrieve("courses", user_id=3)) == 3
+
+
+def test_partitioning_mode_is_validated():
+    with pytest.raises(ValueError, match="partitioning"):
+        RetrievalConfig(partitioning="per-tenant")
+    with pytest.raises(ValueError, match="partition_shards"):
+        RetrievalConfig(partitioning="hash", partition_shards=0)
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+
+from backend.rag import pipeline as pipeline_module
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+from backend.rag.retrieval_service import RetrievalServer, RetrievalServiceError
+from backend.rag.tracing import tracing
+
+from .test_pipeline_lazy import ExplodingClient
+
+NOTES = {
+    "docker.md": "# Docker\n\nLe déploiement passe par Docker et gunicorn.",
+    "flask.md": "# Backend\n\nLe backend du projet utilise Flask et SQLAlchemy.",
+    "vue.md": "# Frontend\n\nLe frontend est écrit avec Vue et Vite.",
+}
+
+
+class CountingEmbedding:
+    """Wraps the fake embedding and records the size of every forward pass."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.batches: list[int] = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.batches.append(1)
+        return self.inner.embed_query(text)
+
+
+@contextmanager
+def _serving(pipeline, **kwargs):
+    # AF_UNIX paths are limited to ~100 bytes: pytest's tmp_path can be longer.
+    socket_path = os.path.join(tempfile.mkdtemp(), "rag.sock")
+    server = RetrievalServer(pipeline, socket_path, **kwargs)
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(ready),), daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    try:
+        yield socket_path
+    finally:
+        server.close()
+        thread.join(5)
+
+
+def _server_pipeline(tmp_path, **config_kwargs):
+    config = RetrievalConfig(hybrid_enabled=True, rerank_enabled=True, **config_kwargs)
+    return RAGPipeline(persist_directory=str(tmp_path / "vs"), config=config)
+
+
+def test_thin_client_ingests_and_retrieves_through_the_service(tmp_path, monkeypatch):
+    server_pipeline = _server_pipeline(tmp_path)
+    assert server_pipeline.embedding is not None and server_pipeline.reranker is not None
+    # From here on any model load would come from the client side.
+    monkeypatch.setattr(pipeline_module, "_load_embedding_model", ExplodingClient)
+    monkeypatch.setattr(pipeline_module, "Reranker", ExplodingClient)
+
+    with _serving(server_pipeline) as socket_path:
+        client = RAGPipeline(
+            persist_directory=str(tmp_path / "unused"), retrieval_socket=socket_path
+        )
+        assert client.query("Docker ?", user_id=1)["answer"].startswith("Knowledge base is empty")
+        for name, content in NOTES.items():
+            client.ingest_uploaded_text(
+                content, metadata={"source": name, "user_id": 1}, content_type="text/markdown"
+            )
+
+        remote = client.retrieve("backend Flask", user_id=1, top_k=2)
+        local = server_pipeline.retrieve("backend Flask", user_id=1, top_k=2)
+        assert remote == local
+        assert remote[0]["metadata"]["source"] == "flask.md"
+        assert client.retrieve("backend Flask", user_id=2) == []
+
+        client.delete_chunks([remote[0]["metadata"]["chunk_id"]], user_id=1)
+        assert all(
+            hit["metadata"]["source"] != "flask.md"
+            for hit in client.retrieve("backend Flask", user_id=1)
+        )
+    assert client._embedding is None
+
+
+def test_concurrent_requests_share_embedding_passes(tmp_path):
+    server_pipeline = _server_pipeline(tmp_path)
+    for name, content in NOTES.items():
+        server_pipeline.ingest_uploaded_text(
+            content, metadata={"source": name, "user_id": 1}, content_type="text/markdown"
+        )
+    queries = ["Docker", "Flask", "Vue", "gunicorn", "SQLAlchemy", "Vite"]
+    expected = {query: server_pipeline.retrieve(query, user_id=1, top_k=2) for query in queries}
+
+    embedding = CountingEmbedding(server_pipeline.embedding)
+    server_pipeline._embedding = embedding
+    with _serving(server_pipeline, batch_window_ms=200) as socket_path:
+        client = RAGPipeline(
+            persist_directory=str(tmp_path / "unused"), retrieval_socket=socket_path
+        )
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            results = dict(
+                zip(
+                    queries,
+                    pool.map(lambda q: client.retrieve(q, user_id=1, top_k=2), queries),
+                    strict=True,
+                )
+            )
+
+    assert results == expected
+    assert sum(embedding.batches) == len(queries)
+    assert len(embedding.batches) < len(queries)
+
+
+def _ingested_server_pipeline(tmp_path):
+    server_pipeline = _server_pipeline(tmp_path)
+    for name, content in NOTES.items():
+        server_pipeline.ingest_uploaded_text(
+            content, metadata={"source": name, "user_id": 1}, content_type="text/markdown"
+        )
+    return server_pipeline
+
+
+def test_a_slow_batch_does_not_hold_up_later_requests(tmp_path, monkeypatch):
+    server_pipeline = _ingested_server_pipeline(tmp_path)
+    entered, release = threading.Event(), threading.Event()
+    retrieve_batch = server_pipeline.retrieve_batch
+
+    def slow_for_docker(requests):
+        if any(request["query"] == "Docker" for request in requests):
+            entered.set()
+            release.wait(5)
+        return retrieve_batch(requests)
+
+    monkeypatch.setattr(server_pipeline, "retrieve_batch", slow_for_docker)
+    with _serving(server_pipeline, batch_window_ms=1, workers=2) as socket_path:
+        client = RAGPipeline(
+            persist_directory=str(tmp_path / "unused"), retrieval_socket=socket_path
+        )
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(client.retrieve, "Docker", user_id=1, top_k=1)
+            assert entered.wait(5)
+            try:
+                fast = client.retrieve("Vue", user_id=1, top_k=1)
+                assert not slow.done()
+            finally:
+                release.set()
+            assert slow.result(5)[0]["metadata"]["source"] == "docker.md"
+    assert fast[0]["metadata"]["source"] == "vue.md"
+
+
+def test_service_stages_are_recorded_in_the_callers_trace(tmp_path):
+    server_pipeline = _ingested_server_pipeline(tmp_path)
+    with _serving(server_pipeline) as socket_path:
+        client = RAGPipeline(
+            persist_directory=str(tmp_path / "unused"), retrieval_socket=socket_path
+        )
+        with tracing() as trace:
+            client.retrieve("backend Flask", user_id=1, top_k=2)
+        assert client.retrieve("backend Flask", user_id=1, top_k=2)
+
+    stages = trace.as_dict()
+    assert {"embedding", "dense_search", "bm25", "fusion", "hydration", "rerank"} <= set(stages)
+
+
+def test_unreachable_service_raises(tmp_path):
+    client = RAGPipeline(
+        persist_directory=str(tmp_path / "unused"),
+        retrieval_socket=str(tmp_path / "missing.sock"),
+    )
+    with pytest.raises(RetrievalServiceError, match="unreachable"):
+        client.retrieve("Docker", user_id=1)
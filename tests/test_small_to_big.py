@@ -0,0 +1,71 @@
+from backend.rag.ingestion import CHILD_CHUNK_SIZE, chunk_hierarchical
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+from .test_rerank import InjectedReranker
+
+FILLER = "Phrase de remplissage sans rapport avec la question. " * 12
+NOTE = (
+    f"# Infra\n\n## Déploiement\n\n{FILLER}\n\nLe déploiement passe par Kubernetes.\n\n"
+    f"{FILLER}\n\n## Budget\n\nLe budget cloud est de 400 euros par mois."
+)
+
+
+def _pipeline(tmp_path, **config):
+    return RAGPipeline(
+        persist_directory=str(tmp_path / "vs"),
+        config=RetrievalConfig(small_to_big=True, **config),
+    )
+
+
+def test_children_are_small_and_point_to_their_section():
+    children, parents = chunk_hierarchical(NOTE, {"source": "infra.md", "user_id": 1})
+
+    assert len(parents) == 2 and len(children) > 2
+    for child in children:
+        assert len(child.page_content) <= CHILD_CHUNK_SIZE
+        assert child.page_content in parents[child.metadata["parent_id"]]
+        assert child.metadata["source"] == "infra.md"
+
+
+def test_reranker_scores_children_and_the_answer_gets_sections(tmp_path):
+    pipeline = _pipeline(tmp_path, rerank_enabled=True, rerank_threshold=0.0, final_k=10)
+    reranker = InjectedReranker({"Kubernetes": 0.9, "remplissage": 0.5})
+    pipeline._reranker = reranker
+    pipeline.ingest_uploaded_text(NOTE, metadata={"source": "infra.md", "user_id": 1})
+
+    hits = pipeline.retrieve("Comment se fait le déploiement ?", user_id=1)
+
+    assert all(len(text) <= CHILD_CHUNK_SIZE for text in reranker.calls[0][1])
+    # Every child of "Déploiement" expands to the same section: one hit.
+    assert [hit["metadata"]["heading_path"] for hit in hits] == [
+        "Infra > Déploiement",
+        "Infra > Budget",
+    ]
+    assert "Kubernetes" in hits[0]["content"] and hits[0]["content"].count(FILLER.strip()) == 2
+
+
+def test_expansion_can_be_turned_off_at_query_time(tmp_path):
+    _pipeline(tmp_path).ingest_uploaded_text(NOTE, metadata={"source": "infra.md", "user_id": 1})
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(final_k=10)
+    )
+
+    hits = pipeline.retrieve("budget cloud", user_id=1)
+
+    assert len(hits) > 2
+    assert all(len(hit["content"]) <= CHILD_CHUNK_SIZE for hit in hits)
+
+
+def test_sections_are_deleted_with_their_last_child(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    pipeline.ingest_uploaded_text(NOTE, metadata={"source": "infra.md", "user_id": 1})
+    pipeline.config = RetrievalConfig(final_k=20)
+    chunk_ids = [hit["metadata"]["chunk_id"] for hit in pipeline.retrieve("budget", user_id=1)]
+    assert pipeline._chunks.stats()["parents"] == 2
+
+    pipeline.delete_chunks(chunk_ids[:-1], user_id=1)
+    assert pipeline._chunks.stats()["parents"] == 1
+    pipeline.delete_chunks(chunk_ids[-1:], user_id=1)
+
+    assert pipeline._chunks.stats()["parents"] == 0
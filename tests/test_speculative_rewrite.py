@@ -0,0 +1,141 @@
+import threading
+import time
+
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+
+class GatedRewriter:
+    """Rewrite blocked until the test releases it."""
+
+    def __init__(self, rewritten):
+        self.rewritten = rewritten
+        self.release = threading.Event()
+        self.returned = threading.Event()
+
+    def rewrite(self, question):
+        self.release.wait(timeout=5)
+        self.returned.set()
+        return self.rewritten
+
+    def condense(self, question, history):
+        return self.rewrite(question)
+
+
+def _pipeline(tmp_path, rewriter, **config_kwargs):
+    config = RetrievalConfig(speculative_rewrite=True, final_k=4, **config_kwargs)
+    pipeline = RAGPipeline(persist_directory=str(tmp_path / "vs"), config=config)
+    pipeline._rewriter = rewriter
+    for source, text in [
+        ("flask.md", "Le backend du projet utilise Flask."),
+        ("chroma.md", "Les vecteurs sont stockés dans Chroma."),
+        ("tarte.md", "La tarte aux pommes cuit quarante minutes."),
+    ]:
+        pipeline.ingest_uploaded_text(text, metadata={"source": source, "user_id": 1})
+    return pipeline
+
+
+def test_sources_event_fires_before_the_rewrite_returns(tmp_path):
+    rewriter = GatedRewriter("Quel framework utilise le backend du projet ?")
+    pipeline = _pipeline(tmp_path, rewriter)
+    try:
+        events = pipeline.stream_query("Backend ?", user_id=1)
+
+        provisional = next(events)
+        assert provisional["type"] == "sources"
+        assert provisional["provisional"] is True
+        assert provisional["sources"]
+        assert not rewriter.returned.is_set()
+
+        rewriter.release.set()
+        final = next(events)
+        assert final["type"] == "sources"
+        assert final["query_rewritten"] == "Quel framework utilise le backend du projet ?"
+        assert final["rewrite_reason"] == "short"
+        assert all("speculative_rrf_score" in src["metadata"] for src in final["sources"])
+        assert [event["type"] for event in events] == ["delta", "delta", "timings"]
+    finally:
+        rewriter.release.set()
+
+
+def test_rewrite_missing_the_deadline_is_abandoned(tmp_path):
+    rewriter = GatedRewriter("never used")
+    pipeline = _pipeline(tmp_path, rewriter, rewrite_deadline_ms=50)
+    try:
+        result = pipeline.query("Backend ?", user_id=1)
+    finally:
+        rewriter.release.set()
+
+    assert result["rewrite_reason"] == "deadline"
+    assert result["query_rewritten"] == "Backend ?"
+    assert result["sources"]
+    assert result["answer"].startswith("Answer based on")
+
+
+def test_deadline_includes_the_time_queued_for_a_worker(tmp_path):
+    rewriter = GatedRewriter("Quel framework utilise le backend du projet ?")
+    pipeline = _pipeline(tmp_path, rewriter, rewrite_deadline_ms=400, rewrite_workers=1)
+    # The only worker is busy for 300 ms, then this rewrite takes 200 ms:
+    # 500 ms after submission, past the deadline.
+    pipeline.rewrite_executor.submit(time.sleep, 0.3)
+    threading.Timer(0.5, rewriter.release.set).start()
+
+    start = time.perf_counter()
+    result = pipeline.query("Backend ?", user_id=1)
+
+    assert result["rewrite_reason"] == "deadline"
+    assert time.perf_counter() - start < 0.5
+
+
+def test_full_rewrite_pool_skips_the_speculation(tmp_path):
+    rewriter = GatedRewriter("never used")
+    pipeline = _pipeline(tmp_path, rewriter, rewrite_deadline_ms=50, rewrite_workers=1)
+    try:
+        # Abandoned at its deadline, the first rewrite still holds the only worker.
+        assert pipeline.query("Backend ?", user_id=1)["rewrite_reason"] == "deadline"
+
+        events = list(pipeline.stream_query("Frontend ?", user_id=1))
+    finally:
+        rewriter.release.set()
+
+    sources = [event for event in events if event["type"] == "sources"]
+    assert len(sources) == 1 and "provisional" not in sources[0]
+    assert sources[0]["rewrite_reason"] == "saturated"
+    assert sources[0]["query_rewritten"] == "Frontend ?"
+
+
+def test_rewrite_still_queued_after_the_deadline_never_runs(tmp_path):
+    rewriter = GatedRewriter("never used")
+    pipeline = _pipeline(tmp_path, rewriter, rewrite_deadline_ms=50, rewrite_workers=1)
+    blocker = pipeline.rewrite_executor.submit(time.sleep, 0.3)
+
+    result = pipeline.query("Backend ?", user_id=1)
+    blocker.result()
+    pipeline.rewrite_executor.submit(lambda: None).result()
+
+    assert result["rewrite_reason"] == "deadline"
+    assert not rewriter.returned.is_set()
+    rewriter.release.set()
+
+
+def test_questions_without_rewrite_skip_the_speculation(tmp_path):
+    rewriter = GatedRewriter("never used")
+    pipeline = _pipeline(tmp_path, rewriter)
+    question = "Quel framework backend utilise le projet documenté dans mes notes ?"
+
+    result = pipeline.query(question, user_id=1)
+
+    assert result["rewrite_reason"] == "none"
+    assert result["query_rewritten"] == question
+    assert pipeline._rewrite_executor is None
+
+
+def test_fused_hits_are_deduplicated_by_chunk_id(tmp_path):
+    rewriter = GatedRewriter("Où sont stockés les vecteurs Chroma ?")
+    rewriter.release.set()
+    pipeline = _pipeline(tmp_path, rewriter)
+
+    result = pipeline.query("Backend ?", user_id=1)
+
+    chunk_ids = [src["metadata"]["chunk_id"] for src in result["sources"]]
+    assert len(chunk_ids) == len(set(chunk_ids))
@@ -0,0 +1,118 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from backend.evals.answers import evaluate_answers
+from backend.models import UsageLog
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+from backend.rag.tracing import stage, tracing
+
+from .conftest import auth_headers, register
+from .test_eval_answers import FakeJudge, _items, _pipeline_with_content
+from .test_stream_route import _parse_sse, _upload
+
+
+def test_query_reports_every_stage_that_ran(tmp_path):
+    config = RetrievalConfig(hybrid_enabled=True, rerank_enabled=True)
+    pipeline = RAGPipeline(persist_directory=str(tmp_path / "vs"), config=config)
+    pipeline.ingest_uploaded_text(
+        "# Notes\n\nLe backend utilise Flask.", metadata={"source": "notes.md", "user_id": 1}
+    )
+
+    result = pipeline.query("Quel framework backend utilise le projet ?", user_id=1)
+
+    timings = result["timings"]
+    assert list(timings) == [
+        "embedding",
+        "dense_search",
+        "bm25",
+        "fusion",
+        "hydration",
+        "rerank",
+        "generation",
+    ]
+    assert all(duration >= 0 for duration in timings.values())
+
+
+def test_query_route_persists_stages_and_returns_them_on_request(app, client):
+    token, _ = register(client, "timings@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+
+    plain = client.post(
+        "/api/chat/query",
+        json={"message": "Quel framework backend ?"},
+        headers=auth_headers(token),
+    ).get_json()
+    assert "timings" not in plain
+
+    detailed = client.post(
+        "/api/chat/query",
+        json={"message": "Quel framework backend ?", "include_timings": True},
+        headers=auth_headers(token),
+    ).get_json()
+    assert {"embedding", "dense_search", "generation"} <= set(detailed["timings"])
+
+    with app.app_context():
+        entry = UsageLog.query.filter_by(endpoint="chat.query").order_by(UsageLog.id).first()
+        assert {row.stage for row in entry.stages} >= {"embedding", "generation"}
+
+
+def test_stream_done_frame_carries_timings_on_request(client):
+    token, _ = register(client, "sse-timings@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+
+    resp = client.post(
+        "/api/chat/query/stream",
+        headers=auth_headers(token),
+        json={"message": "Quel framework backend ?", "include_timings": True},
+    )
+    events = _parse_sse(resp.get_data(as_text=True))
+
+    assert "timings" not in [name for name, _ in events]
+    done = events[-1][1]
+    assert {"embedding", "generation"} <= set(done["timings"])
+
+
+def test_evaluate_answers_reports_stage_percentiles(tmp_path):
+    pipeline = _pipeline_with_content(tmp_path)
+
+    result = evaluate_answers(_items(), pipeline=pipeline, user_id=1, judge=FakeJudge())
+
+    metrics = result["metrics"]
+    assert metrics["embedding_p50_ms"] <= metrics["embedding_p95_ms"]
+    assert "generation_p95_ms" in metrics
+    assert "rerank_p50_ms" not in metrics  # rerank disabled
+    assert all("timings" in q for q in result["questions"])
+
+
+def _fake_model(*replies):
+    return GenericFakeChatModel(
+        messages=iter(
+            AIMessage(
+                content="...",
+                usage_metadata={
+                    "input_tokens": tokens,
+                    "output_tokens": 4,
+                    "total_tokens": tokens + 4,
+                },
+                response_metadata={"model_name": "claude-haiku-4-5"},
+            )
+            for tokens in replies
+        )
+    )
+
+
+def test_trace_collects_llm_usage_by_stage_and_model():
+    model = _fake_model(30, 12, 9)
+
+    with tracing() as trace:
+        with stage("rewrite"):
+            model.invoke("Quel framework ?")
+        model.invoke("Hors étape")
+    model.invoke("Hors trace")
+
+    counts = {"output_tokens": 4, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+    assert trace.usage() == {
+        "rewrite": {"claude-haiku-4-5": {"input_tokens": 30, **counts}},
+        "other": {"claude-haiku-4-5": {"input_tokens": 12, **counts}},
+    }
@@ -0,0 +1,103 @@
+import asyncio
+import subprocess
+import sys
+
+from backend.app import create_app
+from backend.asgi import asgi_app
+from backend.config import BaseConfig
+from backend.rag import pipeline as pipeline_module
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+HEAVY_MODULES = (
+    "chromadb",
+    "langchain_chroma",
+    "langchain_huggingface",
+    "sentence_transformers",
+    "langchain.chat_models",
+    "pypdf",
+)
+
+
+class RecordingReranker:
+    def __init__(self):
+        self.model_loaded = False
+        self.calls = []
+
+    @property
+    def model(self):
+        self.model_loaded = True
+        return object()
+
+    def score(self, query, texts):
+        self.calls.append((query, texts))
+        return [0.9] * len(texts)
+
+
+def test_importing_the_app_defers_heavy_modules():
+    probe = (
+        "import sys, backend.app, backend.asgi; "
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+    )
+    assert completed.stdout.strip() == "[]"
+
+
+def test_load_models_loads_weights_without_chroma(tmp_path):
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(rerank_enabled=True)
+    )
+    pipeline._reranker = RecordingReranker()
+
+    pipeline.load_models()
+
+    assert pipeline._embedding is not None
+    assert pipeline._reranker.model_loaded
+    assert pipeline._reranker.calls == []
+    assert pipeline._chroma_client is None
+
+
+def test_warmup_opens_the_store_and_runs_a_dummy_embed_and_rerank(tmp_path):
+    pipeline = RAGPipeline(
+        persist_directory=str(tmp_path / "vs"), config=RetrievalConfig(rerank_enabled=True)
+    )
+    pipeline._reranker = RecordingReranker()
+
+    timings = pipeline.warmup()
+
+    assert set(timings) == {"vectorstore_ms", "embedding_ms", "rerank_ms"}
+    assert pipeline._chroma_client is not None
+    assert pipeline._reranker.calls == [("warmup", ["warmup"])]
+
+
+def test_preload_setting_loads_models_in_create_app(tmp_path):
+    class PreloadConfig(BaseConfig):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = "sqlite://"
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        VECTOR_STORE_FOLDER = str(tmp_path / "vectorstore")
+        RAG_PRELOAD_MODELS = True
+
+    create_app(PreloadConfig)
+
+    assert pipeline_module._pipeline is not None
+    assert pipeline_module._pipeline._embedding is not None
+
+
+def test_asgi_lifespan_warms_the_pipeline_up(app):
+    app.config["RAG_WARMUP"] = True
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(asgi_app(app)({"type": "lifespan"}, receive, send))
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert pipeline_module._pipeline._embedding is not None
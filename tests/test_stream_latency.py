@@ -0,0 +1,161 @@
+import threading
+
+from backend.evals.answers import evaluate_answers
+from backend.models import UsageLog
+from backend.rag.pipeline import RAGPipeline
+from backend.rag.retrieval_config import RetrievalConfig
+
+from .conftest import auth_headers, register
+from .test_eval_answers import FakeJudge, _items, _pipeline_with_content
+from .test_stream_route import _parse_sse, _upload
+
+
+class GatedReranker:
+    """Rerank blocked until the test releases it; reverses the first-stage order."""
+
+    loaded = True
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.returned = threading.Event()
+
+    def score(self, query, texts):
+        self.release.wait(timeout=5)
+        self.returned.set()
+        return [0.1 + 0.8 * i / max(1, len(texts) - 1) for i in range(len(texts))]
+
+
+def _pipeline(tmp_path, reranker, **config_kwargs):
+    config = RetrievalConfig(rerank_enabled=True, early_generation=True, **config_kwargs)
+    pipeline = RAGPipeline(persist_directory=str(tmp_path / "vs"), config=config)
+    pipeline._reranker = reranker
+    for source, text in [
+        ("flask.md", "Le backend du projet utilise Flask."),
+        ("chroma.md", "Les vecteurs du projet sont stockés dans Chroma."),
+    ]:
+        pipeline.ingest_uploaded_text(text, metadata={"source": source, "user_id": 1})
+    return pipeline
+
+
+def test_early_generation_streams_before_the_rerank_returns(tmp_path):
+    reranker = GatedReranker()
+    pipeline = _pipeline(tmp_path, reranker, rerank_threshold=0.0)
+    try:
+        events = pipeline.stream_query("Quel framework utilise le backend du projet ?", user_id=1)
+
+        provisional = next(events)
+        assert provisional["type"] == "sources"
+        assert provisional["provisional"] is True
+        first_delta = next(events)
+        assert first_delta["type"] == "delta"
+        assert not reranker.returned.is_set()
+
+        reranker.release.set()
+        rest = list(events)
+    finally:
+        reranker.release.set()
+
+    assert [event["type"] for event in rest] == ["delta", "sources", "timings"]
+    refined = rest[1]
+    assert "provisional" not in refined
+    assert all("rerank_score" in src["metadata"] for src in refined["sources"])
+    assert [src["source"] for src in refined["sources"]] == [
+        src["source"] for src in reversed(provisional["sources"])
+    ]
+
+
+class KeywordReranker:
+    """Scores a chunk by whether it mentions the keyword, whatever its first-stage rank."""
+
+    loaded = True
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+
+    def score(self, query, texts):
+        return [0.9 if self.keyword in text else 0.1 for text in texts]
+
+
+def test_background_rerank_scores_the_same_pool_as_retrieve(tmp_path):
+    pipeline = _pipeline(tmp_path, KeywordReranker("Chroma"), rerank_threshold=0.0, final_k=1)
+    for index in range(4):
+        pipeline.ingest_uploaded_text(
+            f"Le backend du projet utilise Flask, note {index}.",
+            metadata={"source": f"flask-{index}.md", "user_id": 1},
+        )
+    question = "Quel framework utilise le backend du projet ?"
+
+    events = list(pipeline.stream_query(question, user_id=1))
+
+    provisional, refined = (e for e in events if e["type"] == "sources")
+    expected = pipeline.retrieve(question, user_id=1)
+    assert [src["source"] for src in provisional["sources"]] != ["chroma.md"]
+    assert (
+        [src["source"] for src in refined["sources"]]
+        == [hit["metadata"]["source"] for hit in expected]
+        == ["chroma.md"]
+    )
+    # The provisional hits the answer is generated from are left unscored.
+    assert all("rerank_score" not in src["metadata"] for src in provisional["sources"])
+
+
+def test_background_rerank_does_not_queue_behind_rewrites(tmp_path):
+    reranker = GatedReranker()
+    reranker.release.set()
+    pipeline = _pipeline(tmp_path, reranker, rerank_threshold=0.0, rewrite_workers=1)
+    busy = threading.Event()
+    pipeline.rewrite_executor.submit(busy.wait, 5)
+    try:
+        events = list(pipeline.stream_query("Quel framework utilise le backend ?", user_id=1))
+    finally:
+        busy.set()
+
+    refined = [e for e in events if e["type"] == "sources" and not e.get("provisional")]
+    assert len(refined) == 1
+    assert all("rerank_score" in src["metadata"] for src in refined[0]["sources"])
+    assert events[-1]["type"] == "timings"
+
+
+def test_threshold_gating_keeps_the_rerank_before_the_answer(tmp_path):
+    reranker = GatedReranker()
+    reranker.release.set()
+    pipeline = _pipeline(tmp_path, reranker, rerank_threshold=0.3)
+
+    events = list(pipeline.stream_query("Quel framework utilise le backend ?", user_id=1))
+
+    assert [event["type"] for event in events] == ["sources", "delta", "delta", "timings"]
+    assert not events[0].get("provisional")
+    assert all("rerank_score" in src["metadata"] for src in events[0]["sources"])
+
+
+def test_done_frame_and_usage_log_carry_stream_milestones(app, client):
+    token, _ = register(client, "ttft@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+
+    resp = client.post(
+        "/api/chat/query/stream",
+        headers=auth_headers(token),
+        json={"message": "Quel framework backend utilise le projet ?"},
+    )
+    done = _parse_sse(resp.get_data(as_text=True))[-1][1]
+
+    assert 0 <= done["time_to_sources_ms"] <= done["ttft_ms"] <= done["latency_ms"]
+    with app.app_context():
+        entry = UsageLog.query.filter_by(endpoint="chat.query.stream").one()
+        stages = {row.stage: row.duration_ms for row in entry.stages}
+    assert stages["ttft"] == done["ttft_ms"]
+    assert stages["time_to_sources"] == done["time_to_sources_ms"]
+
+
+def test_streamed_eval_reports_time_to_first_token(tmp_path):
+    pipeline = _pipeline_with_content(tmp_path)
+
+    result = evaluate_answers(
+        _items(), pipeline=pipeline, user_id=1, judge=FakeJudge(), stream=True
+    )
+
+    metrics = result["metrics"]
+    assert metrics["time_to_sources_p50_ms"] <= metrics["ttft_p95_ms"]
+    detail = {q["id"]: q for q in result["questions"]}
+    assert detail["q001"]["answer"].startswith("Answer based on")
+    assert detail["q001"]["ttft_ms"] >= detail["q001"]["time_to_sources_ms"]
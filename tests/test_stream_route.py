@@ -69,7 +69,9 @@ def test_stream_route_persists_messages_at_the_end(client):
     session_id = events[-1][1]["session_id"]
     answer = "".join(data["text"] for name, data in events if name == "delta")
 
-    history = client.get("/api/chat/history", headers=auth_headers(token)).get_json()
+    history = client.get(
+        "/api/chat/history?include_messages=1", headers=auth_headers(token)
+    ).get_json()
     session = next(s for s in history["sessions"] if s["session_id"] == session_id)
     roles = [message["role"] for message in session["messages"]]
     assert roles == ["user", "assistant"]
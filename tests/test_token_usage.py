@@ -0,0 +1,158 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from backend.extensions import db
+from backend.models import (
+    ChatMessage,
+    UsageLog,
+    UsageTokens,
+    User,
+    calculate_token_summary,
+    cost_by_user,
+    record_usage,
+)
+from backend.rag import pipeline as pipeline_module
+
+from .conftest import auth_headers, register
+from .test_stream_route import _parse_sse, _upload
+
+
+class MeteredAnswerer:
+    """Answers through a fake chat model reporting 1M input / 100k output tokens."""
+
+    def __init__(self):
+        self.llm = GenericFakeChatModel(messages=self._replies())
+
+    @staticmethod
+    def _replies():
+        while True:
+            yield AIMessage(
+                content="Flask.",
+                usage_metadata={
+                    "input_tokens": 1_000_000,
+                    "output_tokens": 100_000,
+                    "total_tokens": 1_100_000,
+                },
+                response_metadata={"model_name": "claude-haiku-4-5"},
+            )
+
+    def generate(self, question, chunks):
+        return self.llm.invoke(question).content
+
+    def generate_stream(self, question, chunks):
+        yield self.generate(question, chunks)
+
+
+@pytest.fixture()
+def metered(monkeypatch):
+    monkeypatch.setattr(pipeline_module, "AnswerGenerator", MeteredAnswerer)
+
+
+def test_query_route_records_tokens_and_cost(metered, app, client):
+    token, _ = register(client, "tokens@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+
+    client.post(
+        "/api/chat/query", json={"message": "Quel framework ?"}, headers=auth_headers(token)
+    )
+
+    with app.app_context():
+        entry = UsageLog.query.filter_by(endpoint="chat.query").one()
+        assert entry.tokens_used == 1_100_000
+        (row,) = entry.token_usage
+        assert (row.stage, row.model) == ("generation", "claude-haiku-4-5")
+        assert (row.input_tokens, row.output_tokens) == (1_000_000, 100_000)
+        assert row.cost_usd == pytest.approx(1.5)  # $1 in + $0.5 out
+        assert row.chat_message.role == "assistant"
+
+
+def test_stream_route_records_tokens_on_the_assistant_message(metered, app, client):
+    token, _ = register(client, "sse-tokens@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+
+    resp = client.post(
+        "/api/chat/query/stream",
+        headers=auth_headers(token),
+        json={"message": "Quel framework ?"},
+    )
+    _parse_sse(resp.get_data(as_text=True))
+
+    with app.app_context():
+        entry = UsageLog.query.filter_by(endpoint="chat.query.stream").one()
+        assert entry.tokens_used == 1_100_000
+        message = ChatMessage.query.filter_by(role="assistant").one()
+        assert [row.stage for row in message.token_usage] == ["generation"]
+
+
+def test_calls_without_llm_usage_leave_tokens_empty(app, client):
+    token, _ = register(client, "no-tokens@example.com")
+
+    client.post("/api/chat/query", json={"message": "Bonjour"}, headers=auth_headers(token))
+
+    with app.app_context():
+        entry = UsageLog.query.one()
+        assert entry.tokens_used is None
+        assert entry.token_usage == []
+
+
+def test_analytics_summary_reports_cost_by_stage_and_model(metered, client):
+    token, _ = register(client, "summary-tokens@example.com")
+    _upload(client, token, "notes.md", "# Notes\nLe backend utilise Flask.")
+    for _ in range(2):
+        client.post(
+            "/api/chat/query", json={"message": "Quel framework ?"}, headers=auth_headers(token)
+        )
+
+    tokens = client.get("/api/analytics/summary", headers=auth_headers(token)).get_json()["tokens"]
+
+    assert tokens["input_tokens"] == 2_000_000
+    assert tokens["cost_usd"] == pytest.approx(3.0)
+    assert tokens["by_stage"]["generation"]["output_tokens"] == 200_000
+    assert tokens["by_model"]["claude-haiku-4-5"]["cost_usd"] == pytest.approx(3.0)
+
+
+def _log(user, created_at, *rows):
+    record_usage(
+        UsageLog(
+            user_id=user.id,
+            endpoint="chat.query",
+            latency_ms=10.0,
+            created_at=created_at,
+            token_usage=[
+                UsageTokens(stage=stage, model=model, input_tokens=100, cost_usd=cost)
+                for stage, model, cost in rows
+            ],
+        )
+    )
+
+
+def test_token_summary_and_cost_ranking(app):
+    now = datetime.now(UTC)
+    with app.app_context():
+        alice = User(email="alice@example.com", password_hash="x")
+        bob = User(email="bob@example.com", password_hash="x")
+        db.session.add_all([alice, bob])
+        db.session.flush()
+        _log(alice, now, ("rewrite", "claude-haiku-4-5", 0.01), ("generation", "local", None))
+        _log(bob, now, ("generation", "claude-sonnet-4-6", 0.2))
+        _log(bob, now - timedelta(days=40), ("generation", "claude-sonnet-4-6", 5.0))
+        db.session.commit()
+
+        summary = calculate_token_summary(alice.id)
+        assert summary["input_tokens"] == 200
+        assert summary["cost_usd"] == pytest.approx(0.01)
+        assert set(summary["by_stage"]) == {"rewrite", "generation"}
+        assert summary["by_model"]["local"]["cost_usd"] == 0.0
+        assert calculate_token_summary(bob.id, since=(now - timedelta(days=30)).date())[
+            "cost_usd"
+        ] == pytest.approx(0.2)
+
+        ranking = cost_by_user(since=now - timedelta(days=30))
+        assert [(row["email"], row["calls"]) for row in ranking] == [
+            ("bob@example.com", 1),
+            ("alice@example.com", 1),
+        ]
+        assert ranking[0]["cost_usd"] == pytest.approx(0.2)
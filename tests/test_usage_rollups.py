@@ -0,0 +1,160 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect
+
+from backend.extensions import db
+from backend.models import (
+    UsageDaily,
+    UsageLog,
+    UsageTokens,
+    UsageTokensDaily,
+    User,
+    calculate_token_summary,
+    calculate_usage_summary,
+    ensure_indexes,
+    rebuild_usage_rollups,
+    record_usage,
+)
+
+from .conftest import auth_headers, register
+
+
+def _user(email="rollup@example.com"):
+    user = User(email=email, password_hash="x")
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _log(user, created_at, latency_ms, tokens=None):
+    record_usage(
+        UsageLog(
+            user_id=user.id,
+            endpoint="chat.query",
+            latency_ms=latency_ms,
+            created_at=created_at,
+            tokens_used=tokens,
+            token_usage=[
+                UsageTokens(stage="generation", model="claude-haiku-4-5", input_tokens=tokens)
+            ]
+            if tokens
+            else [],
+        )
+    )
+
+
+def _rollups():
+    daily = {
+        (row.user_id, row.day, row.calls, row.latency_ms_sum, row.tokens_used)
+        for row in UsageDaily.query.all()
+    }
+    tokens = {
+        (row.user_id, row.day, row.stage, row.model, row.input_tokens, row.cost_usd)
+        for row in UsageTokensDaily.query.all()
+    }
+    return daily, tokens
+
+
+def test_record_usage_accumulates_one_row_per_user_and_day(app):
+    now = datetime(2026, 10, 19, 12, tzinfo=UTC)
+    with app.app_context():
+        user = _user()
+        _log(user, now, 100.0, tokens=40)
+        _log(user, now + timedelta(hours=3), 300.0)
+        _log(user, now - timedelta(days=1), 50.0, tokens=10)
+        db.session.commit()
+
+        rows = {row.day.isoformat(): row for row in UsageDaily.query.all()}
+        assert set(rows) == {"2026-10-19", "2026-10-18"}
+        assert (rows["2026-10-19"].calls, rows["2026-10-19"].latency_ms_sum) == (2, 400.0)
+        assert rows["2026-10-19"].tokens_used == 40
+        assert calculate_usage_summary(user.id) == {
+            "total_calls": 3,
+            "average_latency_ms": pytest.approx(150.0),
+        }
+        assert calculate_token_summary(user.id)["input_tokens"] == 50
+
+
+def test_rebuild_matches_the_incremental_rollups(app):
+    now = datetime(2026, 10, 19, 12, tzinfo=UTC)
+    with app.app_context():
+        alice, bob = _user("alice@example.com"), _user("bob@example.com")
+        _log(alice, now, 100.0, tokens=40)
+        _log(alice, now - timedelta(days=3), 20.0, tokens=5)
+        _log(bob, now, 10.0)
+        db.session.commit()
+        incremental = _rollups()
+
+        assert rebuild_usage_rollups() == 3
+        db.session.commit()
+        assert _rollups() == incremental
+
+        UsageDaily.query.delete()
+        assert rebuild_usage_rollups(since=(now - timedelta(days=1)).date()) == 2
+        db.session.commit()
+        assert {row.day.isoformat() for row in UsageDaily.query.all()} == {"2026-10-19"}
+
+
+def test_startup_backfills_rollups_of_an_existing_database(app):
+    now = datetime.now(UTC)
+    with app.app_context():
+        alice = _user()
+        _log(alice, now - timedelta(days=30), 50.0)
+        _log(alice, now, 10.0)
+        db.session.commit()
+        incremental = _rollups()
+        UsageDaily.query.delete()
+        UsageTokensDaily.query.delete()
+        db.session.commit()
+
+        ensure_indexes()
+        assert _rollups() == incremental
+        assert calculate_usage_summary(alice.id)["total_calls"] == 2
+
+        # Rollups only for the latest rows: the older days are filled in too.
+        UsageDaily.query.filter(UsageDaily.day < now.date()).delete()
+        db.session.commit()
+        ensure_indexes()
+        assert _rollups() == incremental
+
+
+def test_summary_reads_the_rollups(client):
+    token, _ = register(client, "dashboard@example.com")
+    for _ in range(3):
+        client.post("/api/chat/query", json={"message": "Bonjour"}, headers=auth_headers(token))
+
+    summary = client.get("/api/analytics/summary", headers=auth_headers(token)).get_json()
+
+    assert summary["usage"]["total_calls"] == 3
+    assert summary["last_7_days"] == {datetime.now(UTC).date().isoformat(): 3}
+
+
+def test_last_7_days_covers_seven_calendar_days(app, client):
+    token, user_id = register(client, "week@example.com")
+    today = datetime.now(UTC).replace(hour=12)
+    with app.app_context():
+        for days_ago in range(9):
+            record_usage(
+                UsageLog(
+                    user_id=user_id,
+                    endpoint="chat.query",
+                    latency_ms=1.0,
+                    created_at=today - timedelta(days=days_ago),
+                )
+            )
+        db.session.commit()
+
+    summary = client.get("/api/analytics/summary", headers=auth_headers(token)).get_json()
+
+    assert sorted(summary["last_7_days"]) == [
+        (today - timedelta(days=days_ago)).date().isoformat() for days_ago in range(6, -1, -1)
+    ]
+
+
+def test_usage_log_has_a_user_and_date_index(app):
+    with app.app_context():
+        indexes = inspect(db.engine).get_indexes("usage_log")
+    assert {"name": "ix_usage_log_user_id_created_at", "columns": ["user_id", "created_at"]} in [
+        {"name": index["name"], "columns": index["column_names"]} for index in indexes
+    ]